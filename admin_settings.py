@@ -3,24 +3,115 @@ Admin Settings System
 Manage alert rules, and system configuration
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import sqlite3
 import json
+import os
+import queue
+import threading
+import time
+from collections import deque
 from datetime import datetime
 
+from alerts import AlertEngine, RuleError, compile_rule
+from count_store import HISTORY_DB, ROLLUPS, CountStore
+from live_counts import LiveBroadcaster, LiveCounts
+from retention import RetentionCleaner
+from settings_cache import SettingsCache
+
 app = Flask(__name__)
 
 # ==================== DATABASE ====================
+# Per-connection settings; journal_mode=WAL is set once and stays on the file
+DB_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -8000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 67108864',
+)
+
+class ConnectionPool:
+    """
+    Open SQLite connections reused across requests.
+    
+    `connect` hands a thread an idle connection, or opens one when none is
+    idle, and `release` gives it back; at most `size` idle connections are
+    kept. A connection is only ever used by the thread holding it. Each
+    keeps its own statement cache, so repeated queries skip parsing, and
+    waits up to `timeout` seconds for another writer's lock instead of
+    failing. In WAL mode readers see the last commit and never block the
+    writer, nor it them.
+    """
+    
+    def __init__(self, db_path, size=8, timeout=5.0, cached_statements=256):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.opened = 0
+        self._idle = queue.LifoQueue()
+    
+    def connect(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        self.opened += 1
+        return conn
+    
+    def release(self, conn):
+        # Never hand on a half-done transaction (and the write lock it holds)
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+    
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
 class SettingsDatabase:
-    def __init__(self, db_path='settings.db'):
+    def __init__(self, db_path='settings.db', pooled=True, pool_size=8):
+        """
+        `pooled` reuses WAL-mode connections from a ConnectionPool; without
+        it every call opens its own connection and the journal mode is left
+        alone (e.g. for a file system without shared memory, where WAL can't work).
+        """
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, pool_size) if pooled else None
         self.init_database()
     
+    def connect(self):
+        if self.pool is None:
+            return sqlite3.connect(self.db_path)
+        return self.pool.connect()
+    
+    def release(self, conn):
+        if self.pool is None:
+            conn.close()
+        else:
+            self.pool.release(conn)
+    
     def init_database(self):
         """Initialize settings database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
+        # Only takes effect on a new file; lets the retention cleanup hand freed pages back
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        if self.pool is not None:
+            cursor.execute('PRAGMA journal_mode = WAL')
+        
         # System settings table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS system_settings (
@@ -67,6 +158,21 @@ class SettingsDatabase:
             )
         ''')
         
+        # Counting lines and occupancy zones per camera
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS counting_geometry (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                camera_id TEXT NOT NULL,
+                zone_id TEXT NOT NULL,
+                geometry_type TEXT NOT NULL,
+                points TEXT NOT NULL,
+                is_active INTEGER DEFAULT 1,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_by TEXT,
+                UNIQUE (camera_id, zone_id)
+            )
+        ''')
+        
         # Notification settings table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS notification_settings (
@@ -80,6 +186,15 @@ class SettingsDatabase:
             )
         ''')
         
+        # Bumped with every change counting processes read (see settings_cache.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS settings_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO settings_version (id, version) VALUES (1, 0)')
+        
         # Settings history (audit trail)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS settings_history (
@@ -93,21 +208,36 @@ class SettingsDatabase:
                 change_reason TEXT
             )
         ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS settings_history_timestamp ON settings_history (timestamp)
+        ''')
         
         conn.commit()
         
-        # Insert default settings
-        self._insert_default_settings(cursor)
+        # Insert default settings; readers only need to reload if some were missing
+        if self._insert_default_settings(cursor):
+            self._bump_version(cursor)
         conn.commit()
-        conn.close()
+        self.release(conn)
         
         print("✅ Settings Database initialized")
     
     def _insert_default_settings(self, cursor):
-        """Insert default system settings"""
+        """Insert missing default system settings and alert rules; returns how many"""
+        inserted = 0
         default_settings = [
             ('detection_confidence_threshold', '0.5', 'float', 'detection', 'Minimum confidence for person detection'),
             ('detection_fps', '10', 'integer', 'detection', 'Frames per second for detection'),
+            ('motion_threshold', '0', 'float', 'detection', 'Changed-pixel fraction below which frames skip the detector (0 = off)'),
+            ('detector_backend', 'ultralytics', 'string', 'detection', 'Inference backend: ultralytics or onnx'),
+            ('detector_model', '', 'string', 'detection', 'Model file for the backend (blank for its default)'),
+            ('detector_int8', 'false', 'boolean', 'detection', 'Use the INT8-quantized ONNX model'),
+            ('detector_roi_margin', '0', 'integer', 'detection', 'Only detect within this many pixels of the counting lines (0 = whole frame)'),
+            ('detector_tiling', 'false', 'boolean', 'detection', 'Also detect on tiles where people appear small'),
+            ('tracker_embedding', 'always', 'string', 'detection', 'Appearance embeddings: always, every, ambiguous or iou'),
+            ('tracker_embed_every', '5', 'integer', 'detection', 'Detection frames between full embedding passes'),
+            ('source_latest_only', 'false', 'boolean', 'detection', 'Drop stale frames of live streams to bound latency'),
+            ('publish_live_counts', 'true', 'boolean', 'system', 'Publish live counts for /api/live'),
             ('max_people_count', '1000', 'integer', 'detection', 'Maximum people count per zone'),
             ('alert_cooldown_seconds', '300', 'integer', 'alerts', 'Seconds between duplicate alerts'),
             ('enable_email_alerts', 'true', 'boolean', 'alerts', 'Enable email notifications'),
@@ -115,6 +245,8 @@ class SettingsDatabase:
             ('enable_webhook_alerts', 'false', 'boolean', 'alerts', 'Enable webhook notifications'),
             ('data_retention_days', '90', 'integer', 'database', 'Days to retain detection data'),
             ('auto_cleanup_enabled', 'true', 'boolean', 'database', 'Automatically cleanup old data'),
+            ('count_history_enabled', 'true', 'boolean', 'database', 'Store crossings and per-minute/hour/day rollups'),
+            ('rollup_retention_days', '365', 'integer', 'database', 'Days to retain per-minute and per-hour count rollups'),
             ('system_timezone', 'UTC', 'string', 'system', 'System timezone'),
             ('max_concurrent_cameras', '10', 'integer', 'system', 'Maximum concurrent camera streams')
         ]
@@ -126,6 +258,7 @@ class SettingsDatabase:
                     (setting_key, setting_value, setting_type, category, description)
                     VALUES (?, ?, ?, ?, ?)
                 ''', setting)
+                inserted += cursor.rowcount
             except:
                 pass
         
@@ -148,7 +281,8 @@ class SettingsDatabase:
             (
                 'sudden_crowd_increase',
                 'rate_of_change',
-                json.dumps({'condition': 'increase > 50% in 5 minutes', 'metric': 'people_count'}),
+                json.dumps({'condition': 'increase > 50% in 5 minutes', 'metric': 'people_count',
+                            'min_base': 10}),
                 json.dumps({'email': True, 'sms': False, 'webhook': True}),
                 'medium'
             )
@@ -161,13 +295,28 @@ class SettingsDatabase:
                     (rule_name, rule_type, conditions, actions, priority)
                     VALUES (?, ?, ?, ?, ?)
                 ''', rule)
+                inserted += cursor.rowcount
             except:
                 pass
+        return inserted
+    
+    def _bump_version(self, cursor):
+        """Tell SettingsCache readers to reload; part of the caller's transaction"""
+        cursor.execute('UPDATE settings_version SET version = version + 1 WHERE id = 1')
+    
+    def get_version(self):
+        """Current settings version"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT version FROM settings_version WHERE id = 1')
+        version = cursor.fetchone()[0]
+        self.release(conn)
+        return version
     
     # ==================== SYSTEM SETTINGS ====================
     def get_all_settings(self, category=None):
         """Get all system settings"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         if category:
@@ -178,21 +327,21 @@ class SettingsDatabase:
             cursor.execute('SELECT * FROM system_settings ORDER BY category, setting_key')
         
         settings = cursor.fetchall()
-        conn.close()
+        self.release(conn)
         return settings
     
     def get_setting(self, setting_key):
         """Get single setting"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM system_settings WHERE setting_key = ?', (setting_key,))
         setting = cursor.fetchone()
-        conn.close()
+        self.release(conn)
         return setting
     
     def update_setting(self, setting_key, new_value, username, reason=''):
         """Update system setting"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Get old value
@@ -200,7 +349,7 @@ class SettingsDatabase:
         result = cursor.fetchone()
         
         if not result:
-            conn.close()
+            self.release(conn)
             return False, "Setting not found"
         
         old_value = result[0]
@@ -219,14 +368,15 @@ class SettingsDatabase:
             VALUES (?, (SELECT id FROM system_settings WHERE setting_key = ?), ?, ?, ?, ?)
         ''', ('system_setting', setting_key, old_value, new_value, username, reason))
         
+        self._bump_version(cursor)
         conn.commit()
-        conn.close()
+        self.release(conn)
         
         return True, "Setting updated successfully"
     
     def get_settings_by_category(self):
         """Get settings grouped by category"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT DISTINCT category FROM system_settings ORDER BY category')
@@ -244,31 +394,31 @@ class SettingsDatabase:
             result[category] = [dict(zip(['key', 'value', 'type', 'description'], row)) 
                               for row in cursor.fetchall()]
         
-        conn.close()
+        self.release(conn)
         return result
     
     # ==================== ALERT RULES ====================
     def get_all_alert_rules(self):
         """Get all alert rules"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM alert_rules ORDER BY priority DESC, rule_name')
         rules = cursor.fetchall()
-        conn.close()
+        self.release(conn)
         return rules
     
     def get_alert_rule(self, rule_id):
         """Get single alert rule"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM alert_rules WHERE id = ?', (rule_id,))
         rule = cursor.fetchone()
-        conn.close()
+        self.release(conn)
         return rule
     
     def create_alert_rule(self, rule_data, username):
         """Create new alert rule"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         try:
@@ -285,22 +435,23 @@ class SettingsDatabase:
                 username
             ))
             
+            self._bump_version(cursor)
             conn.commit()
             rule_id = cursor.lastrowid
-            conn.close()
+            self.release(conn)
             
             return True, rule_id, "Alert rule created successfully"
         
         except sqlite3.IntegrityError:
-            conn.close()
+            self.release(conn)
             return False, None, "Rule name already exists"
         except Exception as e:
-            conn.close()
+            self.release(conn)
             return False, None, str(e)
     
     def update_alert_rule(self, rule_id, rule_data, username):
         """Update alert rule"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Get old values
@@ -308,7 +459,7 @@ class SettingsDatabase:
         old_rule = cursor.fetchone()
         
         if not old_rule:
-            conn.close()
+            self.release(conn)
             return False, "Rule not found"
         
         try:
@@ -334,18 +485,19 @@ class SettingsDatabase:
                 VALUES (?, ?, ?, ?, ?)
             ''', ('alert_rule', rule_id, json.dumps(old_rule), json.dumps(rule_data), username))
             
+            self._bump_version(cursor)
             conn.commit()
-            conn.close()
+            self.release(conn)
             
             return True, "Alert rule updated successfully"
         
         except Exception as e:
-            conn.close()
+            self.release(conn)
             return False, str(e)
     
     def delete_alert_rule(self, rule_id, username):
         """Delete alert rule"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM alert_rules WHERE id = ?', (rule_id,))
@@ -357,14 +509,15 @@ class SettingsDatabase:
             VALUES (?, ?, ?, ?)
         ''', ('alert_rule', rule_id, username, 'Rule deleted'))
         
+        self._bump_version(cursor)
         conn.commit()
-        conn.close()
+        self.release(conn)
         
         return True, "Alert rule deleted successfully"
     
     def toggle_alert_rule(self, rule_id, username):
         """Toggle alert rule active status"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT is_active FROM alert_rules WHERE id = ?', (rule_id,))
@@ -377,15 +530,16 @@ class SettingsDatabase:
             WHERE id = ?
         ''', (new_status, username, rule_id))
         
+        self._bump_version(cursor)
         conn.commit()
-        conn.close()
+        self.release(conn)
         
         return True, f"Rule {'activated' if new_status else 'deactivated'}"
     
     # ==================== ZONE THRESHOLDS ====================
     def get_zone_thresholds(self, zone_id=None):
         """Get zone thresholds"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         if zone_id:
@@ -395,12 +549,12 @@ class SettingsDatabase:
             cursor.execute('SELECT * FROM zone_thresholds')
             threshold = cursor.fetchall()
         
-        conn.close()
+        self.release(conn)
         return threshold
     
     def upsert_zone_threshold(self, zone_id, threshold_data, username):
         """Update or insert zone threshold"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Check if exists
@@ -437,24 +591,118 @@ class SettingsDatabase:
                 username
             ))
         
+        self._bump_version(cursor)
         conn.commit()
-        conn.close()
+        self.release(conn)
         
         return True, "Zone threshold updated successfully"
     
+    # ==================== COUNTING GEOMETRY ====================
+    def get_counting_geometry(self, camera_id=None):
+        """Get counting lines and zones, for one camera or all"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        if camera_id:
+            cursor.execute('SELECT * FROM counting_geometry WHERE camera_id = ? ORDER BY id', (camera_id,))
+        else:
+            cursor.execute('SELECT * FROM counting_geometry ORDER BY camera_id, id')
+        
+        geometry = cursor.fetchall()
+        self.release(conn)
+        return geometry
+    
+    def upsert_counting_geometry(self, camera_id, zone_id, geometry_data, username):
+        """Create or replace a camera's counting line or zone"""
+        geometry_type = geometry_data.get('geometry_type')
+        points = geometry_data.get('points') or []
+        
+        if geometry_type not in ('line', 'zone'):
+            return False, "geometry_type must be 'line' or 'zone'"
+        if geometry_type == 'line' and len(points) != 2:
+            return False, "A line needs exactly two points"
+        if geometry_type == 'zone' and len(points) < 3:
+            return False, "A zone needs at least three points"
+        
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        # Get old value
+        cursor.execute('''
+            SELECT points FROM counting_geometry WHERE camera_id = ? AND zone_id = ?
+        ''', (camera_id, zone_id))
+        existing = cursor.fetchone()
+        
+        cursor.execute('''
+            INSERT INTO counting_geometry
+            (camera_id, zone_id, geometry_type, points, is_active, updated_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (camera_id, zone_id) DO UPDATE SET
+                geometry_type = excluded.geometry_type, points = excluded.points,
+                is_active = excluded.is_active, updated_at = CURRENT_TIMESTAMP,
+                updated_by = excluded.updated_by
+        ''', (
+            camera_id,
+            zone_id,
+            geometry_type,
+            json.dumps(points),
+            int(geometry_data.get('is_active', 1)),
+            username
+        ))
+        
+        # Log change
+        cursor.execute('''
+            INSERT INTO settings_history
+            (setting_type, setting_id, old_value, new_value, changed_by)
+            VALUES (?, (SELECT id FROM counting_geometry WHERE camera_id = ? AND zone_id = ?), ?, ?, ?)
+        ''', ('counting_geometry', camera_id, zone_id, existing[0] if existing else None,
+              json.dumps(points), username))
+        
+        self._bump_version(cursor)
+        conn.commit()
+        self.release(conn)
+        
+        return True, "Counting geometry updated successfully"
+    
+    def delete_counting_geometry(self, camera_id, zone_id, username):
+        """Delete a camera's counting line or zone"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            DELETE FROM counting_geometry WHERE camera_id = ? AND zone_id = ?
+        ''', (camera_id, zone_id))
+        
+        if not cursor.rowcount:
+            self.release(conn)
+            return False, "Geometry not found"
+        
+        # Log change
+        cursor.execute('''
+            INSERT INTO settings_history
+            (setting_type, changed_by, change_reason)
+            VALUES (?, ?, ?)
+        ''', ('counting_geometry', username, f'{camera_id}/{zone_id} deleted'))
+        
+        self._bump_version(cursor)
+        conn.commit()
+        self.release(conn)
+        
+        return True, "Counting geometry deleted successfully"
+    
     # ==================== NOTIFICATION SETTINGS ====================
     def get_notification_settings(self):
         """Get all notification settings"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM notification_settings')
         settings = cursor.fetchall()
-        conn.close()
+        self.release(conn)
         return settings
     
     def update_notification_setting(self, notification_type, is_enabled, recipients, config, username):
         """Update notification setting"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Check if exists
@@ -476,14 +724,14 @@ class SettingsDatabase:
             ''', (notification_type, is_enabled, recipients, config, username))
         
         conn.commit()
-        conn.close()
+        self.release(conn)
         
         return True, "Notification setting updated successfully"
     
     # ==================== SETTINGS HISTORY ====================
     def get_settings_history(self, limit=50):
         """Get settings change history"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT * FROM settings_history
@@ -491,7 +739,7 @@ class SettingsDatabase:
             LIMIT ?
         ''', (limit,))
         history = cursor.fetchall()
-        conn.close()
+        self.release(conn)
         return history
 
 db = SettingsDatabase()
@@ -541,6 +789,14 @@ def update_setting(setting_key):
     return jsonify({'success': False, 'message': message}), 400
 
 # Alert Rules
+def rule_error(data):
+    """Why the alert engine can't compile this rule, or None"""
+    try:
+        compile_rule({'id': None, 'priority': 'medium', **data})
+    except RuleError as e:
+        return str(e)
+    return None
+
 @app.route('/api/alert-rules', methods=['GET'])
 def get_alert_rules():
     """Get all alert rules"""
@@ -560,6 +816,10 @@ def create_alert_rule():
     data = request.get_json()
     username = request.headers.get('X-Username', 'unknown')
     
+    error = rule_error(data)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
     success, rule_id, message = db.create_alert_rule(data, username)
     
     if success:
@@ -572,6 +832,10 @@ def update_alert_rule(rule_id):
     data = request.get_json()
     username = request.headers.get('X-Username', 'unknown')
     
+    error = rule_error(data)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
     success, message = db.update_alert_rule(rule_id, data, username)
     
     if success:
@@ -641,6 +905,230 @@ def upsert_zone_threshold(zone_id):
         return jsonify({'success': True, 'message': message}), 200
     return jsonify({'success': False, 'message': message}), 400
 
+# Counting Geometry
+@app.route('/api/geometry', methods=['GET'])
+def get_counting_geometry():
+    """Get counting lines and zones"""
+    camera_id = request.args.get('camera_id')
+    
+    geometry = db.get_counting_geometry(camera_id)
+    
+    return jsonify({
+        'success': True,
+        'data': [dict(zip(
+            ['id', 'camera_id', 'zone_id', 'geometry_type', 'points', 'is_active',
+             'updated_at', 'updated_by'],
+            row[:4] + (json.loads(row[4]),) + row[5:]
+        )) for row in geometry]
+    }), 200
+
+@app.route('/api/geometry/<camera_id>/<zone_id>', methods=['POST', 'PUT'])
+def upsert_counting_geometry(camera_id, zone_id):
+    """Create or update a counting line or zone"""
+    data = request.get_json()
+    username = request.headers.get('X-Username', 'unknown')
+    
+    success, message = db.upsert_counting_geometry(camera_id, zone_id, data, username)
+    
+    if success:
+        return jsonify({'success': True, 'message': message}), 200
+    return jsonify({'success': False, 'message': message}), 400
+
+@app.route('/api/geometry/<camera_id>/<zone_id>', methods=['DELETE'])
+def delete_counting_geometry(camera_id, zone_id):
+    """Delete a counting line or zone"""
+    username = request.headers.get('X-Username', 'unknown')
+    
+    success, message = db.delete_counting_geometry(camera_id, zone_id, username)
+    
+    if success:
+        return jsonify({'success': True, 'message': message}), 200
+    return jsonify({'success': False, 'message': message}), 404
+
+# Live Counts
+live_store = None
+
+# Seconds between SSE comment lines that keep idle connections (and proxies) open
+LIVE_KEEPALIVE = 15
+
+def get_live_store():
+    """Attach to the counters' shared memory store once it exists"""
+    global live_store
+    if live_store is None:
+        live_store = LiveCounts.open(create=False)
+    return live_store
+
+live_broadcaster = LiveBroadcaster(get_live_store)
+
+def live_payload(camera_ids=()):
+    """Totals and per-camera counts, optionally only for some cameras"""
+    store = get_live_store()
+    cameras = store.snapshot() if store is not None else []
+    if camera_ids:
+        cameras = [c for c in cameras if c['camera'] in camera_ids]
+    return {'timestamp': time.time(), **LiveCounts.aggregate(cameras)}
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/live', methods=['GET'])
+def get_live_counts():
+    """Latest counts of every camera plus totals, straight from shared memory"""
+    camera_id = request.args.get('camera_id')
+    
+    payload = live_payload([camera_id] if camera_id is not None else ())
+    
+    return jsonify({'success': True, **payload}), 200
+
+@app.route('/api/live/stream', methods=['GET'])
+def stream_live_counts():
+    """Server-Sent Events: a 'snapshot', then 'counts' as cameras' counts change"""
+    camera_ids = set(request.args.getlist('camera_id'))
+    subscriber = live_broadcaster.subscribe()
+    
+    def events():
+        try:
+            yield "retry: 2000\n" + sse_message('snapshot', live_payload(camera_ids))
+            while True:
+                updates = subscriber.get(timeout=LIVE_KEEPALIVE)
+                if subscriber.resync:
+                    # Fell behind: start over from the current counts
+                    subscriber.clear()
+                    yield sse_message('snapshot', live_payload(camera_ids))
+                    continue
+                if updates is None:
+                    yield ": keepalive\n\n"
+                    continue
+                if camera_ids:
+                    updates = [u for u in updates if u['camera'] in camera_ids]
+                if updates:
+                    yield sse_message('counts', {'timestamp': time.time(), 'cameras': updates})
+        finally:
+            # Runs when the client disconnects and the next write fails
+            live_broadcaster.unsubscribe(subscriber)
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/live/<camera_id>', methods=['GET'])
+def get_live_camera(camera_id):
+    """Latest counts of one camera, with its zones"""
+    store = get_live_store()
+    cameras = store.snapshot() if store is not None else []
+    
+    for camera in cameras:
+        if camera['camera'] == camera_id:
+            return jsonify({'success': True, 'timestamp': time.time(), 'data': camera}), 200
+    return jsonify({'success': False, 'message': 'Camera not found'}), 404
+
+# Count History
+count_store = None
+
+def get_count_store():
+    """The counters' history DB; its rollups also run here, in the background"""
+    global count_store
+    if count_store is None:
+        count_store = CountStore()
+    return count_store
+
+@app.route('/api/counts/history', methods=['GET'])
+def get_count_history():
+    """Pre-aggregated counts per minute, hour or day"""
+    resolution = request.args.get('resolution', 'hour')
+    if resolution not in ROLLUPS:
+        return jsonify({
+            'success': False,
+            'message': f"resolution must be one of: {', '.join(ROLLUPS)}"
+        }), 400
+    
+    rows = get_count_store().history(
+        resolution,
+        camera_id=request.args.get('camera_id'),
+        geometry_id=request.args.get('zone_id'),
+        since=request.args.get('since', type=float),
+        until=request.args.get('until', type=float)
+    )
+    
+    return jsonify({'success': True, 'resolution': resolution, 'data': rows}), 200
+
+# Maintenance
+retention_cleaner = None
+
+def get_retention_cleaner():
+    """Cleanup of the settings history and count history, following the retention settings"""
+    global retention_cleaner
+    if retention_cleaner is None:
+        retention_cleaner = RetentionCleaner(SettingsCache(db.db_path), db.db_path, HISTORY_DB)
+    return retention_cleaner
+
+@app.route('/api/maintenance/cleanup', methods=['GET'])
+def get_cleanup_report():
+    """Report of the last retention cleanup"""
+    cleaner = get_retention_cleaner()
+    return jsonify({'success': True, 'runs': cleaner.runs, 'data': cleaner.last_report}), 200
+
+@app.route('/api/maintenance/cleanup', methods=['POST'])
+def run_cleanup():
+    """Run the retention cleanup now"""
+    report = get_retention_cleaner().run()
+    return jsonify({'success': True, 'data': report}), 200
+
+# Alerts
+# Alerts raised since start, newest last
+recent_alerts = deque(maxlen=500)
+alert_engine = None
+
+def get_alert_engine():
+    """Rule evaluation over the live counts; raised alerts go to recent_alerts"""
+    global alert_engine
+    if alert_engine is None:
+        alert_engine = AlertEngine(SettingsCache(db.db_path), on_alert=recent_alerts.append)
+    return alert_engine
+
+def monitor_alerts():
+    """Feed every live count change to the alert engine (runs on its own thread)"""
+    engine = get_alert_engine()
+    subscriber = live_broadcaster.subscribe()
+    cameras = None
+    while True:
+        try:
+            if cameras is None:
+                cameras = live_payload()['cameras']
+            engine.update(cameras)
+        except Exception as e:
+            # Keep watching; a failed snapshot is retried with the next update
+            print(f"⚠️  Alert evaluation failed: {e!r}")
+        updates = subscriber.get(timeout=LIVE_KEEPALIVE)
+        if subscriber.resync or cameras is None:
+            subscriber.clear()
+            cameras = None
+        else:
+            # Rules still see time pass (and settings change) while counts don't
+            cameras = updates or ()
+
+def start_alert_monitor():
+    thread = threading.Thread(target=monitor_alerts, name="alert-monitor", daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    """Recent alerts, newest first, plus the engine's rule compile errors"""
+    limit = int(request.args.get('limit', 50))
+    engine = get_alert_engine()
+    
+    return jsonify({
+        'success': True,
+        'data': list(reversed(recent_alerts))[:limit],
+        'rule_errors': engine.errors,
+        'stats': {
+            'rules': len(engine.rules),
+            'evaluations': engine.evaluations,
+            'alerts': engine.alerts,
+            'suppressed': engine.suppressed
+        }
+    }), 200
+
 # Notification Settings
 @app.route('/api/notification-settings', methods=['GET'])
 def get_notification_settings():
@@ -689,6 +1177,25 @@ def get_settings_history():
         )) for entry in history]
     }), 200
 
+# Background Tasks
+background_lock = threading.Lock()
+background_started = False
+
+def start_background_tasks():
+    """Start the retention cleanup and alert monitor, once per process however the app is served"""
+    global background_started
+    with background_lock:
+        if background_started:
+            return
+        background_started = True
+    get_retention_cleaner().start()
+    start_alert_monitor()
+
+def create_app():
+    """The app with its background tasks running, for WSGI servers: gunicorn 'admin_settings:create_app()'"""
+    start_background_tasks()
+    return app
+
 if __name__ == '__main__':
     print("="*60)
     print("⚙️  Admin Settings System")
@@ -704,7 +1211,18 @@ if __name__ == '__main__':
     print("PUT  /api/alert-rules/<id>            - Update alert rule")
     print("GET  /api/zone-thresholds             - Get zone thresholds")
     print("POST /api/zone-thresholds/<zone_id>   - Set zone threshold")
+    print("GET  /api/geometry                    - Get counting lines and zones")
+    print("PUT  /api/geometry/<camera>/<zone_id> - Set a counting line or zone")
+    print("GET  /api/live                        - Get live counts of all cameras")
+    print("GET  /api/live/<camera_id>            - Get live counts of one camera")
+    print("GET  /api/live/stream                 - Stream live count changes (SSE)")
+    print("GET  /api/counts/history              - Get counts per minute, hour or day")
+    print("POST /api/maintenance/cleanup         - Run the retention cleanup now")
+    print("GET  /api/alerts                      - Get recent alerts")
     print("GET  /api/notification-settings       - Get notification settings")
     print("GET  /api/settings/history            - Get change history")
     print("="*60)
+    # The debug reloader runs this file twice; only its serving child runs the background tasks
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     app.run(host='0.0.0.0', port=5005, debug=True)
\ No newline at end of file
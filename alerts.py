@@ -0,0 +1,388 @@
+"""
+Alert Engine
+Compile alert rules once and evaluate them incrementally against live count changes
+"""
+
+import operator
+import re
+import time
+from collections import deque
+
+# Condition strings of the alert_rules table, e.g. "capacity >= warning_threshold"
+# and "increase > 50% in 5 minutes"
+THRESHOLD_CONDITION = re.compile(r'^\s*([\w.%]+)\s*(>=|<=|==|!=|>|<)\s*([\w.%]+)\s*$')
+RATE_CONDITION = re.compile(
+    r'^\s*(increase|decrease)\s*(>=|>)\s*(\d+(?:\.\d+)?)\s*(%?)\s*in\s*(\d+(?:\.\d+)?)\s*'
+    r'(seconds?|secs?|s|minutes?|mins?|m|hours?|h)\s*$', re.IGNORECASE
+)
+
+OPERATORS = {
+    '>=': operator.ge, '>': operator.gt, '<=': operator.le, '<': operator.lt,
+    '==': operator.eq, '!=': operator.ne,
+}
+UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+# Values a rule's `metric` can watch; people_count is another name for occupancy
+METRICS = {'occupancy': 'inside', 'people_count': 'inside', 'entered': 'entered',
+           'exited': 'exited'}
+
+# Seconds between repeated alerts of a rule for a zone without a zone threshold
+ALERT_COOLDOWN = 300
+
+# Fewest people a percent rate rule measures from, unless its conditions set min_base
+RATE_MIN_BASE = 10
+
+
+class RuleError(ValueError):
+    """An alert rule that can't be compiled"""
+
+
+class SlidingWindow:
+    """
+    Minimum and maximum of a step-wise value over the last `seconds`.
+
+    `push` records a new value from time `t` on. Monotonic deques keep the
+    candidates, so `push`, `minimum` and `maximum` are amortized O(1). The
+    value in effect at the start of the window counts, even if it was set
+    long before.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        # Every (t, value) still needed, oldest first: its first entry holds at the window start
+        self._samples = deque()
+        self._low = deque()
+        self._high = deque()
+
+    def push(self, t, value):
+        sample = (t, value)
+        self._samples.append(sample)
+        low, high = self._low, self._high
+        while low and low[-1][1] >= value:
+            low.pop()
+        low.append(sample)
+        while high and high[-1][1] <= value:
+            high.pop()
+        high.append(sample)
+        self._expire(t)
+
+    def minimum(self, now):
+        self._expire(now)
+        return self._low[0][1] if self._low else None
+
+    def maximum(self, now):
+        self._expire(now)
+        return self._high[0][1] if self._high else None
+
+    def _expire(self, now):
+        samples = self._samples
+        cutoff = now - self.seconds
+        while len(samples) > 1 and samples[1][0] <= cutoff:
+            samples.popleft()
+        start = samples[0][0] if samples else now
+        while self._low and self._low[0][0] < start:
+            self._low.popleft()
+        while self._high and self._high[0][0] < start:
+            self._high.popleft()
+
+
+class ThresholdPredicate:
+    """Compiled "<operand> <op> <operand>" condition, e.g. capacity >= warning_threshold"""
+
+    def __init__(self, condition, metric):
+        match = THRESHOLD_CONDITION.match(condition)
+        if match is None:
+            raise RuleError(f"Can't parse condition '{condition}'")
+        left, op, right = match.groups()
+        self.metric = metric
+        self.left = self._operand(left)
+        self.op = OPERATORS[op]
+        self.right = self._operand(right)
+        self.window = None
+
+    def _operand(self, token):
+        """A function of (target, threshold) for one side of the comparison"""
+        try:
+            if token.endswith('%'):
+                number = float(token[:-1]) / 100
+            else:
+                number = float(token)
+            return lambda target, threshold: number
+        except ValueError:
+            pass
+
+        field = METRICS[self.metric]
+        if token == 'capacity':
+            # Share of the zone's capacity in use, to compare with its thresholds
+            def share(target, threshold):
+                if threshold is None or not threshold['capacity']:
+                    return None
+                return target.values[field] / threshold['capacity']
+            return share
+        if token in ('warning_threshold', 'critical_threshold'):
+            def limit(target, threshold):
+                if threshold is None:
+                    return None
+                # Stored as a share (0.8) or a percentage (80)
+                value = threshold[token]
+                return value / 100 if value > 1 else value
+            return limit
+        if token == 'max_capacity':
+            return lambda target, threshold: threshold['capacity'] if threshold else None
+        if token in METRICS:
+            key = METRICS[token]
+            return lambda target, threshold: target.values[key]
+        raise RuleError(f"Unknown value '{token}'")
+
+    def __call__(self, target, threshold, now):
+        """The watched value if the condition holds, else None"""
+        left = self.left(target, threshold)
+        right = self.right(target, threshold)
+        if left is None or right is None or not self.op(left, right):
+            return None
+        return left
+
+
+class RatePredicate:
+    """
+    Compiled "increase|decrease > N[%] in T units" condition over a SlidingWindow.
+
+    A percent change is only measured from at least `min_base` people, so
+    0 -> 1 or 1 -> 2 on a quiet scene is not a 100% rise.
+    """
+
+    def __init__(self, condition, metric, min_base=RATE_MIN_BASE):
+        match = RATE_CONDITION.match(condition)
+        if match is None:
+            raise RuleError(f"Can't parse condition '{condition}'")
+        direction, op, amount, percent, length, unit = match.groups()
+        self.metric = metric
+        self.field = METRICS[metric]
+        self.rising = direction.lower() == 'increase'
+        self.op = OPERATORS[op]
+        self.amount = float(amount)
+        self.percent = bool(percent)
+        self.min_base = max(1, float(min_base))
+        # Rules with the same metric and length share a target's window
+        self.window = (self.field, float(length) * UNITS[unit[0].lower()])
+
+    def __call__(self, target, threshold, now):
+        """The change over the window if it is big enough, else None"""
+        value = target.values[self.field]
+        window = target.windows[self.window]
+        if self.rising:
+            base = window.minimum(now)
+            change = value - base
+        else:
+            base = window.maximum(now)
+            change = base - value
+        if self.percent:
+            if base < self.min_base:
+                return None
+            change = change / base * 100
+        return change if self.op(change, self.amount) else None
+
+
+class CompiledRule:
+    """One alert_rules row, parsed once"""
+
+    def __init__(self, rule):
+        self.id = rule['id']
+        self.name = rule['rule_name']
+        self.rule_type = rule['rule_type']
+        self.priority = rule['priority']
+        self.actions = rule['actions']
+        conditions = rule['conditions']
+        if not isinstance(conditions, dict) or 'condition' not in conditions:
+            raise RuleError(f"Rule '{self.name}' has no condition")
+        self.condition = conditions['condition']
+        metric = conditions.get('metric', 'occupancy')
+        if metric not in METRICS:
+            raise RuleError(f"Unknown metric '{metric}', expected one of {tuple(METRICS)}")
+
+        if self.rule_type == 'rate_of_change' or RATE_CONDITION.match(self.condition):
+            self.predicate = RatePredicate(self.condition, metric,
+                                           conditions.get('min_base', RATE_MIN_BASE))
+        else:
+            self.predicate = ThresholdPredicate(self.condition, metric)
+        self.window = self.predicate.window
+
+
+def compile_rule(rule):
+    """CompiledRule of an alert_rules row as a dict (JSON decoded); RuleError if it is invalid"""
+    try:
+        return CompiledRule(rule)
+    except RuleError:
+        raise
+    except (KeyError, TypeError, ValueError) as e:
+        raise RuleError(f"Malformed alert rule: {e}") from e
+
+
+class _Target:
+    """A camera or zone being watched: its latest values, windows and alert times"""
+
+    __slots__ = ('zone', 'camera', 'values', 'windows', 'alerted')
+
+    def __init__(self, zone, camera, windows):
+        # A camera's own target has the camera id as its zone
+        self.zone = zone
+        self.camera = camera
+        self.values = None
+        self.windows = {spec: SlidingWindow(spec[1]) for spec in windows}
+        # Last alert time per rule id
+        self.alerted = {}
+
+
+class AlertEngine:
+    """
+    Streaming evaluation of the active alert rules.
+
+    `update` takes camera dicts from the live count stream (LiveCounts
+    snapshots or LiveBroadcaster pushes). Every camera is a target, and so
+    is each of its zones; a target's zone threshold is the one whose
+    zone_id is the zone's (or camera's) id. Only targets whose counts
+    changed are evaluated, against every compiled rule, so a tick costs
+    O(changed targets x rules) however many zones are idle:
+
+    - threshold rules compare values such as `occupancy`, `capacity` (the
+      share of the zone's capacity in use), `warning_threshold` or plain
+      numbers, e.g. "capacity >= warning_threshold";
+    - rate-of-change rules, e.g. "increase > 50% in 5 minutes", compare
+      the value with the minimum (or maximum) over a SlidingWindow per
+      target, metric and length, which rules of the same length share;
+      percentages need a base of the rule's `min_base` people (default
+      RATE_MIN_BASE).
+
+    Rules come from `settings` (a SettingsCache). A settings reload only
+    recompiles rules whose definition changed, keeping the windows of the
+    rest, and re-evaluates every target against the new rules and
+    thresholds. A rule alerts for a target at most once per the zone
+    threshold's alert_cooldown (else the alert_cooldown_seconds setting).
+    Each alert goes to `on_alert` and is returned by `update`.
+    """
+
+    def __init__(self, settings, on_alert=None, clock=time.time):
+        self.settings = settings
+        self.on_alert = on_alert
+        self.clock = clock
+
+        self.rules = []
+        self.errors = {}
+        self.compiles = 0
+        self.evaluations = 0
+        self.alerts = 0
+        self.suppressed = 0
+
+        self._source = None
+        self._compiled = {}
+        self._windows = set()
+        # Per (camera, zone id or None)
+        self._targets = {}
+
+    def update(self, cameras, now=None):
+        """Evaluate the changed targets of these camera counts; returns the alerts raised"""
+        now = self.clock() if now is None else now
+        reloaded = self._refresh(now)
+        changed = []
+        for camera in cameras:
+            camera_id = camera['camera']
+            self._observe(camera_id, None, camera, now, changed)
+            for zone in camera.get('zones', ()):
+                self._observe(camera_id, zone['id'], zone, now, changed)
+
+        # New rules or thresholds apply to the current counts too
+        targets = self._targets.values() if reloaded else changed
+        alerts = []
+        for target in targets:
+            if target.values is not None:
+                self._evaluate(target, now, alerts)
+        return alerts
+
+    # ==================== RULES ====================
+    def _refresh(self, now):
+        """Recompile changed rules after a settings reload; True if there was one"""
+        source = self.settings.alert_rules()
+        if source is self._source:
+            return False
+        self._source = source
+
+        compiled, errors = {}, {}
+        for rule in source:
+            key = (rule['id'], repr(rule))
+            previous = self._compiled.get(key)
+            if previous is not None:
+                compiled[key] = previous
+                continue
+            try:
+                compiled[key] = compile_rule(rule)
+                self.compiles += 1
+            except RuleError as e:
+                errors[rule['id']] = str(e)
+        self._compiled = compiled
+        self.rules = list(compiled.values())
+        self.errors = errors
+
+        windows = {rule.window for rule in self.rules if rule.window is not None}
+        for spec in windows - self._windows:
+            for target in self._targets.values():
+                target.windows[spec] = SlidingWindow(spec[1])
+                if target.values is not None:
+                    # Its history starts now
+                    target.windows[spec].push(now, target.values[spec[0]])
+        for spec in self._windows - windows:
+            for target in self._targets.values():
+                del target.windows[spec]
+        self._windows = windows
+        return True
+
+    # ==================== EVALUATION ====================
+    def _observe(self, camera_id, zone_id, counts, now, changed):
+        target = self._targets.get((camera_id, zone_id))
+        if target is None:
+            target = _Target(camera_id if zone_id is None else zone_id, camera_id, self._windows)
+            self._targets[(camera_id, zone_id)] = target
+        values = target.values
+        if values is not None and values['inside'] == counts['inside'] and \
+                values['entered'] == counts['entered'] and values['exited'] == counts['exited']:
+            return
+        target.values = {'inside': counts['inside'], 'entered': counts['entered'],
+                         'exited': counts['exited']}
+        for (field, _), window in target.windows.items():
+            if values is None or values[field] != counts[field]:
+                window.push(now, counts[field])
+        changed.append(target)
+
+    def _evaluate(self, target, now, alerts):
+        threshold = self.settings.zone_threshold(target.zone)
+        cooldown = None
+        for rule in self.rules:
+            self.evaluations += 1
+            value = rule.predicate(target, threshold, now)
+            if value is None:
+                continue
+            if cooldown is None:
+                cooldown = (threshold or {}).get('alert_cooldown') or \
+                    self.settings.get('alert_cooldown_seconds', ALERT_COOLDOWN)
+            last = target.alerted.get(rule.id)
+            if last is not None and now - last < cooldown:
+                self.suppressed += 1
+                continue
+            target.alerted[rule.id] = now
+
+            alert = {
+                'type': 'alert',
+                'time': now,
+                'rule_id': rule.id,
+                'rule': rule.name,
+                'priority': rule.priority,
+                'condition': rule.condition,
+                'camera': target.camera,
+                'zone': target.zone,
+                'value': value,
+                'counts': dict(target.values),
+                'actions': rule.actions,
+            }
+            self.alerts += 1
+            alerts.append(alert)
+            if self.on_alert is not None:
+                self.on_alert(alert)
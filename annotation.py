@@ -0,0 +1,138 @@
+"""
+Annotated Output
+Draw counts on frames and write full, sampled or event-clip videos
+"""
+
+import os
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+ANNOTATE_MODES = ('full', 'every', 'clips')
+
+
+def draw_frame(frame, boxes, entered, exited, lines, zones=()):
+    """Annotate a frame with the counting lines and zones, tracks and totals."""
+    for polygon in zones:
+        points = np.asarray(polygon, dtype=np.int32).reshape(-1, 1, 2)
+        cv2.polylines(frame, [points], True, (0, 255, 255), 2)
+
+    for start, end in lines:
+        cv2.line(frame, tuple(map(int, start)), tuple(map(int, end)), (0, 0, 255), 2)
+
+    for track_id, l, t, r, b in boxes:
+        cv2.rectangle(frame, (l, t), (r, b), (0, 255, 0), 2)
+        cv2.putText(frame, f"ID {track_id}", (l, t - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+    inside = entered - exited
+
+    cv2.putText(frame, f"Entered: {entered}", (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    cv2.putText(frame, f"Exited: {exited}", (10, 60),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    cv2.putText(frame, f"Inside: {inside}", (10, 90),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+
+def _open_writer(path, fps, size):
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+
+
+class AnnotatedWriter:
+    """
+    Annotated mp4 output in one of three modes.
+
+    'full' draws and writes every frame. 'every' writes only every
+    `every`-th frame (the video plays at fps / every). 'clips' writes one
+    `<output>_<frame>.mp4` per crossing, running from `clip_seconds` / 2
+    before the first crossing to `clip_seconds` / 2 after the last one
+    close to it. Frames are only drawn when they are actually written,
+    unless the caller already drew them (`drawn=True`, e.g. for display).
+    With `metrics`, drawing and encoding are timed as 'draw' and 'encode'.
+    """
+
+    def __init__(self, output_path, fps, size, lines, mode='full', every=10,
+                 clip_seconds=4.0, metrics=None, zones=()):
+        if mode not in ANNOTATE_MODES:
+            raise ValueError(f"Unknown annotate mode '{mode}', expected one of {ANNOTATE_MODES}")
+
+        self.output_path = output_path
+        self.fps = fps
+        self.size = size
+        self.lines = lines
+        self.zones = zones
+        self.mode = mode
+        self.every = max(1, int(every))
+        self.clips = []
+        self.metrics = metrics
+
+        self._writer = None
+        if mode == 'full':
+            self._writer = _open_writer(output_path, fps, size)
+        elif mode == 'every':
+            self._writer = _open_writer(output_path, fps / self.every, size)
+
+        half = max(1, int(round(clip_seconds * fps / 2)))
+        self._pre_roll = deque(maxlen=half)
+        self._post_roll = half
+        self._clip_left = 0
+
+    @property
+    def keeps_frames(self):
+        """Whether frames are held after `write` returns (clip pre-roll)"""
+        return self.mode == 'clips'
+
+    def write(self, index, frame, boxes, entered, exited, crossed=False, drawn=False):
+        if self.mode == 'full':
+            self._draw_and_write(frame, boxes, entered, exited, drawn)
+        elif self.mode == 'every':
+            if index % self.every == 0:
+                self._draw_and_write(frame, boxes, entered, exited, drawn)
+        else:
+            self._write_clip(index, frame, boxes, entered, exited, crossed, drawn)
+
+    def _draw_and_write(self, frame, boxes, entered, exited, drawn):
+        if self.metrics is None:
+            if not drawn:
+                draw_frame(frame, boxes, entered, exited, self.lines, self.zones)
+            self._writer.write(frame)
+            return
+
+        start = time.perf_counter()
+        if not drawn:
+            draw_frame(frame, boxes, entered, exited, self.lines, self.zones)
+            drawn_at = time.perf_counter()
+            self.metrics.record('draw', drawn_at - start)
+            start = drawn_at
+        self._writer.write(frame)
+        self.metrics.record('encode', time.perf_counter() - start)
+
+    def _write_clip(self, index, frame, boxes, entered, exited, crossed, drawn):
+        if crossed:
+            if self._writer is None:
+                root, ext = os.path.splitext(self.output_path)
+                path = f"{root}_{index:06d}{ext or '.mp4'}"
+                self._writer = _open_writer(path, self.fps, self.size)
+                self.clips.append(path)
+                for item in self._pre_roll:
+                    self._draw_and_write(*item)
+                self._pre_roll.clear()
+            self._clip_left = self._post_roll
+
+        if self._writer is None:
+            self._pre_roll.append((frame, boxes, entered, exited, drawn))
+            return
+
+        self._draw_and_write(frame, boxes, entered, exited, drawn)
+        self._clip_left -= 1
+        if self._clip_left <= 0:
+            self._writer.release()
+            self._writer = None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
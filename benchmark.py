@@ -0,0 +1,1636 @@
+"""
+Benchmarks
+Measure people counter throughput on CPU
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from alerts import RATE_CONDITION, UNITS, AlertEngine, ThresholdPredicate
+from detector import BatchDetector, TiledBackend, create_backend, export_onnx
+from embeddings import EMBED_MODES, AppearanceEmbeddings, BatchEmbedder, iou_matrix
+from frame_ring import FrameHandle, SharedFrameRing
+from count_store import INSERT_EVENTS, CountStore
+from live_counts import LiveCounts
+from retention import RetentionCleaner
+from settings_cache import SettingsCache
+from sources import FaultInjector, StreamSource
+from synthetic import StubBackend, make_synthetic_video
+
+DEFAULT_VIDEO = "input/1030931519-preview.mp4"
+
+
+def load_frames(video_path, limit):
+    """Decode up to `limit` frames into memory so decoding isn't timed"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise SystemExit(f"❌ ERROR: Cannot open input video {video_path}")
+
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+# ==================== BATCHED INFERENCE ====================
+def bench_batch(frames, batch_sizes, streams=1, max_wait=0.05, model="yolov8n.pt"):
+    """Frames/sec of BatchDetector for each batch size.
+
+    Every stream runs on its own thread and submits the same frames, with
+    up to one batch of frames in flight, the way `people_counter` does.
+    """
+    results = []
+    for batch_size in batch_sizes:
+        detector = BatchDetector(model, batch_size=batch_size,
+                                 max_wait=max_wait, device="cpu")
+        # Warm-up outside the timed region
+        detector.detect_batch(frames[:1])
+        detector.batches = detector.frames = 0
+
+        def run_stream():
+            pending = []
+            for frame in frames:
+                pending.append(detector.submit(frame))
+                if len(pending) >= batch_size:
+                    pending.pop(0).result()
+            for future in pending:
+                future.result()
+
+        threads = [threading.Thread(target=run_stream) for _ in range(streams)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        detector.close()
+
+        total = len(frames) * streams
+        results.append({
+            'batch_size': batch_size,
+            'streams': streams,
+            'frames': total,
+            'batches': detector.batches,
+            'seconds': elapsed,
+            'fps': total / elapsed,
+        })
+    return results
+
+
+# ==================== MOTION GATE ====================
+def bench_gate(video_path, threshold, output_path="/dev/null", model="yolov8n.pt"):
+    """Compare counts and detector calls with and without the motion gate"""
+    from main import people_counter
+
+    rows = []
+    for motion_threshold in (0, threshold):
+        detector = BatchDetector(model, device="cpu")
+        start = time.perf_counter()
+        entered, exited = people_counter(
+            video_path, output_path, detector=detector, detection_fps=0,
+            motion_threshold=motion_threshold, display=False, live=False, history=False
+        )
+        rows.append({
+            'threshold': float(motion_threshold),
+            'detector_calls': detector.frames,
+            'entered': entered,
+            'exited': exited,
+            'seconds': time.perf_counter() - start,
+        })
+
+    baseline, gated = rows
+    skip_ratio = 1 - gated['detector_calls'] / max(1, baseline['detector_calls'])
+    counts_match = (baseline['entered'], baseline['exited']) == (gated['entered'], gated['exited'])
+    return rows, skip_ratio, counts_match
+
+
+# ==================== BACKENDS ====================
+def parse_backend_spec(spec):
+    """'name[:model][:int8]' -> (name, model, int8)"""
+    parts = spec.split(":")
+    int8 = parts[-1] == "int8"
+    if int8:
+        parts = parts[:-1]
+    return parts[0], (parts[1] if len(parts) > 1 else None), int8
+
+
+def bench_backends(video_path, specs, frames, batch_size=8, output_path="/dev/null"):
+    """Latency, throughput and count agreement of each backend on one video"""
+    from main import people_counter
+
+    rows = []
+    for spec in specs:
+        name, model, int8 = parse_backend_spec(spec)
+        backend = create_backend(name, model, device="cpu", int8=int8)
+        backend.predict(frames[:1])
+
+        latencies = []
+        for frame in frames:
+            start = time.perf_counter()
+            backend.predict([frame])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for i in range(0, len(frames), batch_size):
+            backend.predict(frames[i:i + batch_size])
+        throughput = len(frames) / (time.perf_counter() - start)
+
+        entered, exited = people_counter(
+            video_path, output_path, detector=BatchDetector(backend, batch_size=batch_size),
+            detection_fps=0, display=False, live=False, history=False
+        )
+
+        rows.append({
+            'backend': spec,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'fps': throughput,
+            'entered': entered,
+            'exited': exited,
+        })
+
+    reference = (rows[0]['entered'], rows[0]['exited'])
+    for row in rows:
+        row['agrees'] = "yes" if (row['entered'], row['exited']) == reference else "no"
+    return rows
+
+
+# ==================== TRACK STATE SOAK ====================
+def bench_soak(frames, concurrent=40, lifetime=90, checkpoints=10, sweep_every=30):
+    """Stream ever-new track ids through a line counter and sample memory.
+
+    `concurrent` tracks are alive at once, each for `lifetime` frames, and
+    walk down across the line, so every id ends up counted. Returns one row
+    per checkpoint with the traced Python heap size and live slots.
+    """
+    from counting import LineCrossingCounter
+
+    counter = LineCrossingCounter([((0, 500), (1000, 500))], offset=25)
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(0, 1000, concurrent)
+
+    tracemalloc.start()
+    rows = []
+    interval = max(1, frames // checkpoints)
+    start = time.perf_counter()
+
+    for frame in range(frames):
+        # Track k is born every `lifetime / concurrent` frames and lives `lifetime` frames
+        first = max(0, (frame - lifetime) * concurrent // lifetime + 1)
+        last = frame * concurrent // lifetime
+        ids = [str(i) for i in range(first, last + 1)]
+        ages = frame - np.arange(first, last + 1) * lifetime / concurrent
+        centroids = np.stack([xs[np.arange(first, last + 1) % concurrent],
+                              ages * 1000 / lifetime], axis=1)
+
+        counter.update(ids, centroids)
+        if frame % sweep_every == 0:
+            counter.sweep(set(ids))
+
+        if frame % interval == interval - 1:
+            current, _ = tracemalloc.get_traced_memory()
+            rows.append({
+                'frame': frame + 1,
+                'track_ids': last + 1,
+                'live_slots': len(counter.state),
+                'heap_kb': current / 1024,
+                'entered': int(counter.entered.sum()),
+                'seconds': time.perf_counter() - start,
+            })
+
+    tracemalloc.stop()
+    return rows
+
+
+# ==================== FRAME TRANSPORT ====================
+TRANSPORT_SIZES = {'720p': (720, 1280, 3), '1080p': (1080, 1920, 3)}
+
+
+def _transport_producer(mode, shape, count, frames_q, free_slots, slots, result_q, done):
+    template = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    start = time.process_time()
+    if mode == 'queue':
+        for index in range(count):
+            # A fresh array per frame, like cap.read() without a buffer
+            frames_q.put((index, template.copy()))
+        frames_q.put(None)
+    else:
+        ring = SharedFrameRing.create(shape, slots, free_slots)
+        frames_q.put(ring.describe())
+        for index in range(count):
+            slot = ring.acquire()
+            np.copyto(ring.view(slot), template)
+            frames_q.put(FrameHandle(slot, index))
+        frames_q.put(None)
+    result_q.put(('producer', time.process_time() - start))
+    if mode == 'shm':
+        # The consumer must have attached before the block is unlinked
+        done.wait()
+        ring.close()
+
+
+def _transport_consumer(mode, frames_q, free_slots, result_q, done):
+    start = time.process_time()
+    ring = None
+    if mode == 'shm':
+        ring = SharedFrameRing.attach(*frames_q.get(), free_slots)
+    total = 0
+    while True:
+        item = frames_q.get()
+        if item is None:
+            break
+        if ring is None:
+            _, frame = item
+            total += int(frame[0, 0, 0])
+        else:
+            total += int(ring.view(item.slot)[0, 0, 0])
+            ring.release(item.slot)
+    result_q.put(('consumer', time.process_time() - start))
+    if ring is not None:
+        ring.close()
+    done.set()
+
+
+def bench_transport(sizes, count=300, slots=16, queue_size=8):
+    """Frames/sec and CPU seconds moving frames between two processes"""
+    ctx = mp.get_context('spawn')
+    rows = []
+    for size in sizes:
+        shape = TRANSPORT_SIZES[size]
+        for mode in ('queue', 'shm'):
+            frames_q = ctx.Queue(maxsize=queue_size if mode == 'queue' else 0)
+            free_slots = ctx.Queue()
+            result_q = ctx.Queue()
+            done = ctx.Event()
+
+            consumer = ctx.Process(target=_transport_consumer,
+                                   args=(mode, frames_q, free_slots, result_q, done))
+            producer = ctx.Process(target=_transport_producer,
+                                   args=(mode, shape, count, frames_q, free_slots, slots,
+                                         result_q, done))
+            start = time.perf_counter()
+            consumer.start()
+            producer.start()
+            cpu = dict(result_q.get() for _ in range(2))
+            elapsed = time.perf_counter() - start
+            producer.join()
+            consumer.join()
+
+            rows.append({
+                'size': size,
+                'transport': mode,
+                'frames': count,
+                'fps': count / elapsed,
+                'producer_cpu_s': cpu['producer'],
+                'consumer_cpu_s': cpu['consumer'],
+            })
+    return rows
+
+
+# ==================== PIPELINE ====================
+# people_counter options for each variant; batch_size goes to the detector
+PIPELINE_VARIANTS = {
+    'baseline': {},
+    'batch8': {'batch_size': 8},
+    'detect10fps': {'detection_fps': 10},
+    'gated': {'motion_threshold': 0.002},
+    'annotated': {'annotate': 'full'},
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _pipeline_worker(video_path, options, detector_spec, stub_latency, result_q):
+    """Run one variant in a fresh process so peak RSS belongs to it alone"""
+    import resource
+
+    from main import people_counter
+    from metrics import StageMetrics
+
+    options = dict(options)
+    batch_size = options.pop('batch_size', 1)
+    options.setdefault('detection_fps', 0)
+    options.setdefault('live', False)
+    options.setdefault('history', False)
+    output_path = None
+    if 'annotate' in options:
+        output_path = os.path.join(tempfile.mkdtemp(), "annotated.mp4")
+
+    if detector_spec == 'stub':
+        backend = StubBackend(stub_latency)
+    else:
+        name, model, int8 = parse_backend_spec(detector_spec)
+        backend = create_backend(name, model, device="cpu", int8=int8)
+    detector = BatchDetector(backend, batch_size=batch_size)
+
+    metrics = StageMetrics()
+    try:
+        entered, exited = people_counter(
+            video_path, output_path, detector=detector, display=False,
+            metrics=metrics, metrics_interval=0, verbose=False, **options
+        )
+    finally:
+        detector.close()
+        if output_path:
+            os.remove(output_path)
+
+    snapshot = metrics.snapshot()
+    result_q.put({
+        'frames': snapshot['frames'],
+        'seconds': snapshot['elapsed_s'],
+        'fps': snapshot['fps'],
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'entered': entered,
+        'exited': exited,
+        'stages': snapshot['stages'],
+    })
+
+
+def bench_pipeline(videos, variants, detector_spec='stub', stub_latency=0.0, repeat=1):
+    """
+    Run people_counter variants on each video, each run in its own process.
+
+    `videos` maps a name to (path, expected counts or None). With `repeat`
+    > 1 the fastest run of each variant is kept. Returns one result per
+    video and variant.
+    """
+    ctx = mp.get_context('spawn')
+    results = []
+    for video, (path, expected) in videos.items():
+        for variant in variants:
+            best = None
+            for _ in range(repeat):
+                result_q = ctx.Queue()
+                process = ctx.Process(target=_pipeline_worker,
+                                      args=(path, PIPELINE_VARIANTS[variant], detector_spec,
+                                            stub_latency, result_q))
+                process.start()
+                run = None
+                while run is None:
+                    try:
+                        run = result_q.get(timeout=1.0)
+                    except queue.Empty:
+                        if not process.is_alive():
+                            raise SystemExit(f"❌ {video}/{variant} failed "
+                                             f"(exit code {process.exitcode})")
+                process.join()
+                if best is None or run['fps'] > best['fps']:
+                    best = run
+
+            best = {'video': video, 'variant': variant, **best}
+            if expected is not None:
+                best['expected_entered'], best['expected_exited'] = expected
+            results.append(best)
+    return results
+
+
+def compare_pipeline(baseline, results, threshold=0.1):
+    """Regressions against an earlier results file: fps, peak RSS and changed counts"""
+    previous = {(r['video'], r['variant']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['video'], result['variant']))
+        if before is None:
+            continue
+        name = f"{result['video']}/{result['variant']}"
+        if result['fps'] < before['fps'] * (1 - threshold):
+            regressions.append(f"{name}: fps {before['fps']:.1f} -> {result['fps']:.1f}")
+        if result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + threshold):
+            regressions.append(f"{name}: peak RSS {before['peak_rss_mb']:.0f} -> "
+                               f"{result['peak_rss_mb']:.0f} MiB")
+        if (result['entered'], result['exited']) != (before['entered'], before['exited']):
+            regressions.append(f"{name}: counts {before['entered']}/{before['exited']} -> "
+                               f"{result['entered']}/{result['exited']}")
+    return regressions
+
+
+# ==================== TILED INFERENCE ====================
+def make_crowd_frames(count, size=(3840, 2160), spacing=160, seed=0):
+    """
+    Frames of a perspective crowd: people grow from 20 px tall at the top to
+    about a tenth of the frame height at the bottom. Returns the frames and
+    each frame's ground-truth (N, 4) xyxy boxes.
+    """
+    W, H = size
+    rng = np.random.default_rng(seed)
+    frames, truth = [], []
+    for _ in range(count):
+        frame = np.full((H, W, 3), 40, dtype=np.uint8)
+        boxes = []
+        for y in range(0, H - 40, spacing):
+            height = int(20 + 0.1 * y)
+            width = max(6, int(0.4 * height))
+            for x in range(0, W - width, spacing):
+                if rng.random() < 0.5:
+                    continue
+                left = x + int(rng.integers(0, max(1, spacing - width)))
+                top = y + int(rng.integers(0, max(1, spacing - height))) if height < spacing else y
+                if top + height > H:
+                    continue
+                cv2.rectangle(frame, (left, top), (left + width - 1, top + height - 1),
+                              (255, 255, 255), -1)
+                boxes.append((left, top, left + width, top + height))
+        frames.append(frame)
+        truth.append(np.array(boxes, dtype=np.float64).reshape(-1, 4))
+    return frames, truth
+
+
+def _recall(detections, truth, iou=0.5):
+    if not len(truth):
+        return 1.0
+    if not detections:
+        return 0.0
+    boxes = np.array([(l, t, l + w, t + h) for (l, t, w, h), _, _ in detections], dtype=np.float64)
+    width = (np.minimum(truth[:, None, 2], boxes[None, :, 2])
+             - np.maximum(truth[:, None, 0], boxes[None, :, 0])).clip(0)
+    height = (np.minimum(truth[:, None, 3], boxes[None, :, 3])
+              - np.maximum(truth[:, None, 1], boxes[None, :, 1])).clip(0)
+    inter = width * height
+    areas_t = (truth[:, 2] - truth[:, 0]) * (truth[:, 3] - truth[:, 1])
+    areas_b = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    overlap = inter / (areas_t[:, None] + areas_b[None, :] - inter)
+    return float((overlap.max(axis=1) >= iou).mean())
+
+
+def bench_tiling(frames, truth=None, make_backend=None, max_tiles=(4, 8), warmup=3):
+    """
+    Recall (with ground truth), boxes and time per frame of full-frame vs
+    tiled inference. `make_backend(imgsz)` builds the inner backend; the
+    full-frame pass at twice the input size stands in for a larger model.
+    """
+    configs = [('full', 640, None), ('full', 1280, None)]
+    configs += [('tiled', 640, tiles) for tiles in max_tiles]
+
+    rows = []
+    for mode, imgsz, tiles in configs:
+        backend = make_backend(imgsz)
+        if mode == 'tiled':
+            backend = TiledBackend(backend, max_tiles=tiles, imgsz=imgsz, warmup=20)
+        for frame in frames[:warmup]:
+            backend.predict([frame])
+
+        inputs = boxes = 0
+        recalls = []
+        start = time.perf_counter()
+        for i, frame in enumerate(frames):
+            before = getattr(backend, 'tiles_run', 0)
+            detections = backend.predict([frame])[0]
+            inputs += 1 + getattr(backend, 'tiles_run', 0) - before
+            boxes += len(detections)
+            if truth is not None:
+                recalls.append(_recall(detections, truth[i]))
+        elapsed = time.perf_counter() - start
+
+        rows.append({
+            'mode': mode if tiles is None else f"tiled<={tiles}",
+            'imgsz': imgsz,
+            'inputs_per_frame': inputs / len(frames),
+            # Model cost scales with input pixels, relative to one 640 pass
+            'relative_cost': inputs / len(frames) * (imgsz / 640) ** 2,
+            'boxes_per_frame': boxes / len(frames),
+            'recall': float(np.mean(recalls)) if recalls else "-",
+            'ms_per_frame': elapsed / len(frames) * 1000,
+        })
+    return rows
+
+
+# ==================== EMBEDDING COST ====================
+def _id_switches(reference, run, min_iou=0.5):
+    """Times a track of the `reference` run is matched to a different id in `run`"""
+    switches = 0
+    assigned = {}
+    for ref_boxes, run_boxes in zip(reference, run):
+        if not ref_boxes or not run_boxes:
+            continue
+        overlap = iou_matrix(np.array([b[1:] for b in ref_boxes], dtype=np.float64),
+                             np.array([b[1:] for b in run_boxes], dtype=np.float64))
+        for i, j in zip(*linear_sum_assignment(-overlap)):
+            if overlap[i, j] < min_iou:
+                continue
+            ref_id, run_id = ref_boxes[i][0], run_boxes[j][0]
+            if assigned.get(ref_id, run_id) != run_id:
+                switches += 1
+            assigned[ref_id] = run_id
+    return switches
+
+
+def _track_clip(frames, detections, embeddings):
+    """Count one clip's detections through a CameraCounter; returns it and per-frame tracks"""
+    from main import CameraCounter
+
+    H, W = frames[0].shape[:2]
+    counter = CameraCounter([((0, H // 2), (W, H // 2))], 25, embeddings=embeddings)
+    tracks = [counter.update(frame, dets) for frame, dets in zip(frames, detections)]
+    return counter, tracks
+
+
+def bench_embedding(frames, detections, modes, every=5, streams=4):
+    """
+    Tracking cost, embedder use, ID switches and counts for each embedding mode.
+
+    The first mode is the reference that ID switches are counted against.
+    With `streams` > 1 the clip is also tracked as that many cameras on
+    threads, each with its own embedder and then sharing one BatchEmbedder.
+    """
+    def row(name, counter, tracks, seconds, frame_count):
+        return {
+            'mode': name,
+            'embedded': counter.embeddings.computed_ratio,
+            'track_ms': seconds / frame_count * 1000,
+            'track_ids': len({box[0] for boxes in tracks for box in boxes}),
+            'id_switches': _id_switches(reference, tracks),
+            'entered': counter.entered,
+            'exited': counter.exited,
+        }
+
+    rows = []
+    reference = None
+    for mode in modes:
+        embeddings = AppearanceEmbeddings(mode, every)
+        start = time.perf_counter()
+        counter, tracks = _track_clip(frames, detections, embeddings)
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = tracks
+        rows.append(row(mode, counter, tracks, seconds, len(frames)))
+
+    if streams > 1:
+        for shared in (False, True):
+            embedder = BatchEmbedder(batch_size=streams) if shared else None
+            results = [None] * streams
+
+            def run_stream(i):
+                stream_embedder = embedder or BatchEmbedder()
+                results[i] = _track_clip(frames, detections,
+                                         AppearanceEmbeddings(modes[0], every, stream_embedder))
+
+            threads = [threading.Thread(target=run_stream, args=(i,)) for i in range(streams)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            seconds = time.perf_counter() - start
+            if embedder is not None:
+                embedder.close()
+
+            name = f"{modes[0]} x{streams} {'shared' if shared else 'own'}"
+            rows.append(row(name, *results[0], seconds, len(frames) * streams))
+    return rows
+
+
+# ==================== SOURCE RESILIENCE ====================
+def bench_source(video_path, seconds=5.0, work=0.05, fail_every=90, outage=2, backoff=0.05):
+    """
+    Frames, drops, reconnects and latency reading a FaultInjector camera.
+
+    Each scenario reads for `seconds`, spending `work` seconds per frame
+    (the counting pipeline's cost) before the next read. Latency is the
+    time from a frame's capture to when the consumer got it.
+    """
+    scenarios = [
+        ('buffered', 0, False),
+        ('latest_only', 0, True),
+        ('flaky', fail_every, False),
+        ('flaky_latest', fail_every, True),
+    ]
+
+    rows = []
+    for name, faults, latest_only in scenarios:
+        injector = FaultInjector(video_path, fail_every=faults, outage=outage)
+        source = StreamSource(video_path, live=True, latest_only=latest_only,
+                              backoff=backoff, opener=injector.open, log=lambda *args: None)
+        latencies = []
+        start = time.monotonic()
+        while time.monotonic() - start < seconds:
+            ret, _ = source.read()
+            if not ret:
+                break
+            latencies.append(time.monotonic() - injector.started - source.position_msec / 1000)
+            time.sleep(work)
+        source.release()
+        injector.close()
+
+        rows.append({
+            'scenario': name,
+            'consumed': len(latencies),
+            **source.stats(),
+            'latency_ms': float(np.mean(latencies)) * 1000 if latencies else 0.0,
+            'max_latency_ms': max(latencies, default=0.0) * 1000,
+        })
+    return rows
+
+
+# ==================== LIVE COUNTS ====================
+def _live_writer(name, seconds, rate, result_q):
+    """Publish `rate` times a second (0: non-stop), keeping entered == exited == the zone's"""
+    store = LiveCounts.open(name)
+    writer = store.claim('bench')
+    publishes = 0
+    worst = 0.0
+    began = time.monotonic()
+    end = began + seconds
+    while time.monotonic() < end:
+        if rate:
+            wait = began + publishes / rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        publishes += 1
+        zone = {'id': 'door', 'entered': publishes, 'exited': publishes, 'inside': 0}
+        start = time.perf_counter()
+        writer.publish({'entered': publishes, 'exited': publishes, 'inside': 0,
+                        'zones': [zone]}, publishes)
+        worst = max(worst, time.perf_counter() - start)
+    writer.close()
+    store.close()
+    result_q.put((publishes, worst))
+
+
+def bench_live(seconds=3.0, readers=4, rate=1000):
+    """
+    Requests/sec of /api/live while a counting process publishes.
+
+    The writer runs in its own process like a camera worker, `rate` times
+    a second (0 for non-stop); `readers` threads call the endpoint through
+    Flask's test client. Every response is checked for torn counts, which
+    the seqlock should make impossible, and for a missing camera (readers
+    gave up retrying a slot that was always mid-write).
+    """
+    name = f"people_counter_live_bench_{os.getpid()}"
+    store = LiveCounts.open(name)
+    # Importing the admin app creates its settings DB in the working directory
+    os.chdir(tempfile.mkdtemp())
+    import admin_settings
+    admin_settings.live_store = store
+
+    ctx = mp.get_context('spawn')
+    result_q = ctx.Queue()
+    writer = ctx.Process(target=_live_writer, args=(name, seconds, rate, result_q))
+    writer.start()
+    while not store.snapshot():
+        time.sleep(0.01)
+
+    requests = [0] * readers
+    torn = [0] * readers
+    missed = [0] * readers
+
+    def read(i):
+        client = admin_settings.app.test_client()
+        while writer.is_alive():
+            data = client.get('/api/live').get_json()
+            requests[i] += 1
+            if not data['cameras']:
+                missed[i] += 1
+                continue
+            camera = data['cameras'][0]
+            zone = camera['zones'][0] if camera['zones'] else None
+            if camera['entered'] != camera['exited'] or (
+                    zone is not None and zone['entered'] != camera['entered']):
+                torn[i] += 1
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    publishes, worst = result_q.get()
+    writer.join()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    store.close()
+    store.unlink()
+    return {
+        'readers': readers,
+        'rate': rate,
+        'requests_per_s': sum(requests) / elapsed,
+        'torn_reads': sum(torn),
+        'missed_reads': sum(missed),
+        'publishes_per_s': publishes / seconds,
+        'worst_publish_us': worst * 1e6,
+    }
+
+
+def _serve_admin(port_q, store_name=None, pooled=True):
+    """Admin app on an ephemeral port, on a fresh settings DB and the bench live store"""
+    import logging
+
+    from werkzeug.serving import make_server
+
+    # One access log line per request would swamp the results
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    os.chdir(tempfile.mkdtemp())
+    import admin_settings
+    admin_settings.db = admin_settings.SettingsDatabase('bench.db', pooled=pooled)
+    if store_name is not None:
+        admin_settings.live_store = LiveCounts.open(store_name)
+    server = make_server('127.0.0.1', 0, admin_settings.app, threaded=True)
+    port_q.put(server.server_port)
+    server.serve_forever()
+
+
+def _stream_viewer(url, stop, latencies, counts):
+    import requests
+
+    with requests.get(url, stream=True, timeout=(3, 30)) as r:
+        event = None
+        for line in r.iter_lines(decode_unicode=True):
+            if stop.is_set():
+                break
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:") and event == 'counts':
+                now = time.time()
+                for camera in json.loads(line[5:])['cameras']:
+                    latencies.append(now - camera['updated'])
+                counts[0] += 1
+
+
+def _poll_viewer(url, stop, latencies, counts, interval=1.0):
+    import requests
+
+    session = requests.Session()
+    last = {}
+    while not stop.is_set():
+        data = session.get(url, timeout=5).json()
+        now = time.time()
+        counts[0] += 1
+        for camera in data['cameras']:
+            # Lag of changes this poll picked up
+            if last.get(camera['camera']) != camera['entered']:
+                last[camera['camera']] = camera['entered']
+                latencies.append(now - camera['updated'])
+        stop.wait(interval)
+
+
+def bench_stream(viewers=50, cameras=4, seconds=5.0, rate=2.0):
+    """
+    Server CPU, requests and update lag for dashboards streaming vs polling.
+
+    `cameras` writer slots each count someone `rate` times a second. The
+    admin app runs in its own process; `viewers` threads either hold one
+    /api/live/stream connection each or poll /api/live every second like
+    the old dashboard. Lag is from a count's publish to a viewer seeing it.
+    """
+    import resource
+
+    name = f"people_counter_stream_bench_{os.getpid()}"
+    store = LiveCounts.open(name)
+    writers = [store.claim(f"cam{i}") for i in range(cameras)]
+
+    ctx = mp.get_context('spawn')
+    rows = []
+    for mode in ('stream', 'poll'):
+        port_q = ctx.Queue()
+        server = ctx.Process(target=_serve_admin, args=(port_q, name), daemon=True)
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        server.start()
+        port = port_q.get(timeout=30)
+        path = '/api/live/stream' if mode == 'stream' else '/api/live'
+        url = f"http://127.0.0.1:{port}{path}"
+
+        stop = threading.Event()
+        latencies, counts = [], [0]
+        target = _stream_viewer if mode == 'stream' else _poll_viewer
+        threads = [threading.Thread(target=target, args=(url, stop, latencies, counts),
+                                    daemon=True) for _ in range(viewers)]
+        for t in threads:
+            t.start()
+        time.sleep(0.5)
+
+        entered = 0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            entered += 1
+            for writer in writers:
+                writer.publish({'entered': entered, 'exited': 0, 'inside': entered,
+                                'zones': []})
+            time.sleep(1 / rate)
+        stop.set()
+        # Wake streaming viewers blocked on their next line
+        for writer in writers:
+            writer.publish({'entered': entered + 1, 'exited': 0, 'inside': entered + 1,
+                            'zones': []})
+        for t in threads:
+            t.join(timeout=5)
+
+        server.terminate()
+        server.join()
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime)
+        rows.append({
+            'mode': mode,
+            'viewers': viewers,
+            'requests': viewers if mode == 'stream' else counts[0],
+            'messages': counts[0],
+            'server_cpu_s': cpu,
+            'lag_p50_ms': float(np.percentile(latencies, 50)) * 1000 if latencies else 0.0,
+            'lag_p95_ms': float(np.percentile(latencies, 95)) * 1000 if latencies else 0.0,
+        })
+
+    store.close()
+    store.unlink()
+    return rows
+
+
+SETTINGS_READS = ('/api/settings', '/api/settings/grouped', '/api/alert-rules',
+                  '/api/geometry', '/api/settings/history?limit=20')
+
+
+def _settings_load(make_client, clients, seconds, write_ratio):
+    """Latencies and error count of `clients` threads sending settings requests back to back"""
+    stop = threading.Event()
+    latencies, errors = [], [0]
+
+    def run(seed):
+        rng = np.random.default_rng(seed)
+        send = make_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            if rng.random() < write_ratio:
+                status = send('PUT', '/api/settings/detection_fps',
+                              json={'value': str(int(rng.integers(1, 30))), 'reason': 'bench'},
+                              headers={'X-Username': 'bench'})
+            else:
+                status = send('GET', SETTINGS_READS[int(rng.integers(len(SETTINGS_READS)))])
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[0] += 1
+
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+    return latencies, errors[0]
+
+
+def _http_client(base):
+    import requests
+
+    session = requests.Session()
+    return lambda method, path, **kwargs: session.request(
+        method, base + path, timeout=30, **kwargs).status_code
+
+
+def _load_in_process(result_q, pooled, clients, seconds, write_ratio):
+    """Settings load through Flask's test client: the endpoints without HTTP"""
+    os.chdir(tempfile.mkdtemp())
+    import admin_settings
+    admin_settings.db = admin_settings.SettingsDatabase('bench.db', pooled=pooled)
+
+    def make_client():
+        client = admin_settings.app.test_client()
+        return lambda method, path, **kwargs: client.open(
+            path, method=method, **kwargs).status_code
+
+    result_q.put(_settings_load(make_client, clients, seconds, write_ratio))
+
+
+def bench_settings(clients=16, seconds=5.0, write_ratio=0.1, transport='http'):
+    """
+    Settings API throughput and latency with and without the connection pool.
+
+    The admin app gets a fresh settings DB, once with a connection per call
+    in the default rollback journal (`pooled=False`, as before) and once
+    with pooled WAL connections. `clients` threads send requests back to
+    back, a `write_ratio` share of them setting updates. With `transport`
+    'http' the app serves them from its own process; with 'app' they go
+    through Flask's test client, leaving out the HTTP server and client.
+    """
+    ctx = mp.get_context('spawn')
+    rows = []
+    for pooled in (False, True):
+        if transport == 'http':
+            port_q = ctx.Queue()
+            server = ctx.Process(target=_serve_admin, args=(port_q,),
+                                 kwargs={'pooled': pooled}, daemon=True)
+            server.start()
+            base = f"http://127.0.0.1:{port_q.get(timeout=30)}"
+            latencies, errors = _settings_load(lambda: _http_client(base), clients, seconds,
+                                               write_ratio)
+            server.terminate()
+            server.join()
+        else:
+            result_q = ctx.Queue()
+            worker = ctx.Process(target=_load_in_process,
+                                 args=(result_q, pooled, clients, seconds, write_ratio))
+            worker.start()
+            latencies, errors = result_q.get()
+            worker.join()
+
+        rows.append({
+            'mode': 'pooled' if pooled else 'per-call',
+            'transport': transport,
+            'clients': clients,
+            'requests': len(latencies),
+            'errors': errors,
+            'requests_per_s': len(latencies) / seconds,
+            'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+            'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+        })
+    return rows
+
+
+def _lookup_in_process(result_q, lookups, check_interval):
+    os.chdir(tempfile.mkdtemp())
+    import admin_settings
+
+    db = admin_settings.db
+    cache = SettingsCache(db.db_path, check_interval)
+    keys = ['detection_confidence_threshold', 'detection_fps', 'max_concurrent_cameras']
+
+    def per_call(key):
+        # What load_setting did before the cache: a connection and query per lookup
+        conn = sqlite3.connect(f"file:{db.db_path}?mode=ro", uri=True)
+        try:
+            return conn.execute('SELECT setting_value, setting_type FROM system_settings '
+                                'WHERE setting_key = ?', (key,)).fetchone()
+        finally:
+            conn.close()
+
+    rows = []
+    for name, lookup in (('connect+query', per_call), ('get_setting', db.get_setting),
+                         ('cache', cache.get)):
+        lookup(keys[0])
+        start = time.perf_counter()
+        for i in range(lookups):
+            lookup(keys[i % len(keys)])
+        seconds = time.perf_counter() - start
+        rows.append({'lookup': name, 'lookups': lookups, 'us_per_lookup': seconds / lookups * 1e6})
+
+    # How long a change takes to reach a reader looking up every millisecond
+    delays = []
+    for value in ('0.45', '0.55', '0.5'):
+        db.update_setting('detection_confidence_threshold', value, 'bench')
+        start = time.perf_counter()
+        while cache.get('detection_confidence_threshold') != float(value):
+            time.sleep(0.001)
+        delays.append(time.perf_counter() - start)
+    for row in rows:
+        row['reload_ms'] = max(delays) * 1000 if row['lookup'] == 'cache' else 0.0
+        row['version_checks'] = cache.checks if row['lookup'] == 'cache' else 0
+    result_q.put(rows)
+
+
+def bench_lookup(lookups=100000, check_interval=1.0):
+    """
+    Cost of one setting lookup: a connection and query per lookup (the old
+    load_setting), the pooled SettingsDatabase.get_setting, and SettingsCache.
+
+    Also the worst delay, in ms, before a setting update reaches a cache
+    reader, which is bounded by `check_interval`.
+    """
+    ctx = mp.get_context('spawn')
+    result_q = ctx.Queue()
+    worker = ctx.Process(target=_lookup_in_process, args=(result_q, lookups, check_interval))
+    worker.start()
+    rows = result_q.get()
+    worker.join()
+    return rows
+
+
+def bench_history(events=200000, cameras=8, naive_events=2000):
+    """
+    Count history: ingestion with a commit per event vs CountStore's batches,
+    then a day of hourly per-camera totals from raw events vs the rollup.
+
+    `events` crossings are spread over one day across `cameras` cameras.
+    The commit-per-event writer only writes `naive_events` of them, as it
+    is orders of magnitude slower.
+    """
+    rng = np.random.default_rng(0)
+    start_ts = 1_700_000_000.0
+    frames = []
+    for i in range(events):
+        camera = f"cam{i % cameras}"
+        direction = 'enter' if rng.random() < 0.55 else 'exit'
+        frames.append((start_ts + i * 86400 / events, camera,
+                       [(i, 'line', 'door', direction)], {'inside': int(rng.integers(0, 50))}))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Each event committed on its own, as a straightforward writer would
+        path = os.path.join(tmp, "naive.db")
+        CountStore(path, rollup_interval=1e9).close()
+        conn = sqlite3.connect(path)
+        start = time.perf_counter()
+        for ts, camera, crossings, counts in frames[:naive_events]:
+            conn.execute(INSERT_EVENTS, (ts, camera, 'line', 'door', crossings[0][3],
+                                         crossings[0][0], counts['inside']))
+            conn.commit()
+        seconds = time.perf_counter() - start
+        conn.close()
+        rows.append({'writer': 'commit per event', 'events': naive_events,
+                     'events_per_s': naive_events / seconds, 'record_us': seconds / naive_events * 1e6,
+                     'flushes': naive_events})
+
+        path = os.path.join(tmp, "counts.db")
+        store = CountStore(path, rollup_interval=1e9, log=lambda *args: None)
+        start = time.perf_counter()
+        for ts, camera, crossings, counts in frames:
+            store.record(camera, crossings, counts, ts)
+        recorded = time.perf_counter() - start
+        store.close()
+        seconds = time.perf_counter() - start
+        rows.append({'writer': 'CountStore', 'events': events, 'events_per_s': events / seconds,
+                     'record_us': recorded / events * 1e6, 'flushes': store.flushes})
+
+        conn = sqlite3.connect(path)
+        start = time.perf_counter()
+        raw = conn.execute(
+            "SELECT camera_id, CAST(ts / 3600 AS INTEGER) * 3600 AS bucket, "
+            "SUM(direction = 'enter'), SUM(direction = 'exit') FROM count_events "
+            "WHERE ts >= ? AND ts < ? GROUP BY camera_id, bucket",
+            (start_ts, start_ts + 86400)).fetchall()
+        raw_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        rolled = conn.execute(
+            "SELECT camera_id, bucket, SUM(entered), SUM(exited) FROM counts_hour "
+            "WHERE bucket >= ? AND bucket < ? GROUP BY camera_id, bucket",
+            (start_ts // 3600 * 3600, start_ts + 86400)).fetchall()
+        rollup_ms = (time.perf_counter() - start) * 1000
+        conn.close()
+        if sorted(raw) != sorted(rolled):
+            raise SystemExit("❌ Hourly rollup differs from the raw events")
+    return rows, raw_ms, rollup_ms, len(rolled)
+
+
+def _make_history(path, settings_path, events, days):
+    """Count history and settings history spread evenly over the last `days` days"""
+    now = time.time()
+    store = CountStore(path, rollup_interval=1e9, log=lambda *args: None)
+    for i in range(events):
+        ts = now - days * 86400 * (1 - i / events)
+        store.record(f"cam{i % 8}", [(i, 'line', 'door', 'enter' if i % 2 else 'exit')],
+                     {'inside': i % 50}, ts)
+    store.close()
+
+    conn = sqlite3.connect(settings_path)
+    conn.execute('CREATE TABLE settings_history (id INTEGER PRIMARY KEY, timestamp DATETIME, '
+                 'setting_type TEXT, new_value TEXT)')
+    conn.execute('CREATE INDEX settings_history_timestamp ON settings_history (timestamp)')
+    conn.executemany(
+        "INSERT INTO settings_history (timestamp, setting_type, new_value) "
+        "VALUES (datetime(?, 'unixepoch'), 'system_setting', ?)",
+        [(now - days * 86400 * (1 - i / 20000), str(i)) for i in range(20000)])
+    conn.commit()
+    conn.close()
+
+
+def _under_load(path, stop, write_latencies, read_latencies):
+    """Ingest one event per transaction and read hourly totals until `stop`"""
+    def write():
+        conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        while not stop.is_set():
+            start = time.perf_counter()
+            conn.execute(INSERT_EVENTS, (time.time(), 'live', 'line', 'door', 'enter', 0, 0))
+            write_latencies.append(time.perf_counter() - start)
+            time.sleep(0.002)
+        conn.close()
+
+    def read():
+        conn = sqlite3.connect(path, timeout=60)
+        while not stop.is_set():
+            start = time.perf_counter()
+            conn.execute('SELECT camera_id, SUM(entered) FROM counts_hour '
+                         'WHERE bucket >= ? GROUP BY camera_id', (time.time() - 86400,)).fetchall()
+            read_latencies.append(time.perf_counter() - start)
+            time.sleep(0.002)
+        conn.close()
+
+    return [threading.Thread(target=write, daemon=True), threading.Thread(target=read, daemon=True)]
+
+
+def bench_retention(events=300000, days=180, retention_days=90):
+    """
+    Retention cleanup of `events` count events over `days` days, keeping
+    `retention_days`, while a writer ingests and a reader queries rollups.
+
+    Compares RetentionCleaner's small batches with one DELETE per table and
+    reports rows deleted, seconds taken and the worst write / read latency
+    the other connections saw meanwhile.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, "base.db")
+        base_settings = os.path.join(tmp, "base_settings.db")
+        _make_history(base, base_settings, events, days)
+
+        for mode in ('single DELETE', 'batched'):
+            path = os.path.join(tmp, f"{len(rows)}.db")
+            settings_path = os.path.join(tmp, f"{len(rows)}_settings.db")
+            shutil.copy(base, path)
+            shutil.copy(base_settings, settings_path)
+            size_before = os.path.getsize(path)
+
+            stop = threading.Event()
+            write_latencies, read_latencies = [], []
+            threads = _under_load(path, stop, write_latencies, read_latencies)
+            for t in threads:
+                t.start()
+            time.sleep(0.5)
+
+            start = time.perf_counter()
+            if mode == 'batched':
+                cleaner = RetentionCleaner({'data_retention_days': retention_days},
+                                           settings_path, path, log=lambda *args: None)
+                deleted = sum(cleaner.run()['deleted'].values())
+            else:
+                cutoff = time.time() - retention_days * 86400
+                conn = sqlite3.connect(path, timeout=60)
+                deleted = conn.execute('DELETE FROM count_events WHERE ts < ?', (cutoff,)).rowcount
+                conn.commit()
+                conn.close()
+                conn = sqlite3.connect(settings_path, timeout=60)
+                deleted += conn.execute("DELETE FROM settings_history "
+                                        "WHERE timestamp < datetime(?, 'unixepoch')",
+                                        (cutoff,)).rowcount
+                conn.commit()
+                conn.close()
+            seconds = time.perf_counter() - start
+
+            time.sleep(0.5)
+            stop.set()
+            for t in threads:
+                t.join()
+            rows.append({
+                'mode': mode,
+                'deleted': deleted,
+                'seconds': seconds,
+                'max_write_ms': max(write_latencies) * 1000,
+                'p99_write_ms': float(np.percentile(write_latencies, 99)) * 1000,
+                'max_read_ms': max(read_latencies) * 1000,
+                'file_mb': (os.path.getsize(path) - size_before) / 1e6,
+            })
+    return rows
+
+
+class _StaticSettings:
+    """SettingsCache stand-in with fixed rules, thresholds and settings"""
+
+    def __init__(self, rules, thresholds, values=None):
+        self.rules = tuple(rules)
+        self.thresholds = thresholds
+        self.values = values or {}
+
+    def get(self, setting_key, default=None):
+        return self.values.get(setting_key, default)
+
+    def zone_threshold(self, zone_id):
+        return self.thresholds.get(zone_id)
+
+    def alert_rules(self):
+        return self.rules
+
+
+def _alert_rules(count):
+    """`count` rules: a third occupancy limits, a third capacity shares, a third rates"""
+    rules = []
+    for i in range(count):
+        if i % 3 == 0:
+            condition, rule_type = f"occupancy > {20 + i}", 'threshold'
+        elif i % 3 == 1:
+            condition, rule_type = f"capacity >= {50 + i}%", 'threshold'
+        else:
+            condition, rule_type = f"increase > {20 + i}% in {1 + i % 10} minutes", 'rate_of_change'
+        rules.append({'id': i + 1, 'rule_name': f"rule{i}", 'rule_type': rule_type,
+                      'conditions': {'condition': condition, 'metric': 'occupancy'},
+                      'actions': {'email': True}, 'priority': 'medium'})
+    return rules
+
+
+class _NaiveAlerts:
+    """Every rule re-parsed and every zone checked each tick; rates scan each zone's history"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.history = {}
+        self.alerted = {}
+        self.evaluations = 0
+        self.alerts = 0
+
+    def update(self, cameras, now):
+        for camera in cameras:
+            for zone in camera['zones']:
+                samples = self.history.setdefault(zone['id'], [])
+                if not samples or samples[-1][1] != zone['inside']:
+                    samples.append((now, zone['inside']))
+        cooldown = self.settings.get('alert_cooldown_seconds', 300)
+        for camera in cameras:
+            for zone in camera['zones']:
+                target = SimpleNamespace(values=zone)
+                threshold = self.settings.zone_threshold(zone['id'])
+                for rule in self.settings.alert_rules():
+                    self.evaluations += 1
+                    if self._holds(rule['conditions']['condition'], zone, target, threshold, now):
+                        key = (zone['id'], rule['id'])
+                        if now - self.alerted.get(key, -1e18) >= cooldown:
+                            self.alerted[key] = now
+                            self.alerts += 1
+
+    def _holds(self, condition, zone, target, threshold, now):
+        match = RATE_CONDITION.match(condition)
+        if match is None:
+            return ThresholdPredicate(condition, 'occupancy')(target, threshold, now) is not None
+        direction, op, amount, percent, length, unit = match.groups()
+        cutoff = now - float(length) * UNITS[unit[0].lower()]
+        samples = self.history[zone['id']]
+        start = 0
+        for i, (t, _) in enumerate(samples):
+            if t <= cutoff:
+                start = i
+        base = min(value for _, value in samples[start:])
+        change = (zone['inside'] - base) / max(base, 1) * 100
+        return change > float(amount)
+
+
+def bench_alerts(zones=500, rules=30, seconds=60, change_ratio=0.2, zones_per_camera=10):
+    """
+    Alert rule evaluation over `seconds` one-second ticks of `zones` zones
+    and `rules` rules, with `change_ratio` of the zones changing each tick.
+
+    Compares re-parsing every rule against every zone on each tick (rates
+    from a scan of each zone's history) with AlertEngine's compiled rules,
+    sliding windows and evaluation of only the changed zones.
+    """
+    rng = np.random.default_rng(0)
+    thresholds = {f"zone{i}": {'capacity': 100, 'warning_threshold': 0.8,
+                               'critical_threshold': 0.95, 'alert_cooldown': 300}
+                  for i in range(zones)}
+    settings = _StaticSettings(_alert_rules(rules), thresholds, {'alert_cooldown_seconds': 300})
+
+    occupancy = rng.integers(0, 60, zones)
+    ticks = []
+    for tick in range(seconds):
+        changed = rng.random(zones) < change_ratio
+        occupancy = np.clip(occupancy + changed * rng.integers(-3, 4, zones), 0, 100)
+        cameras = []
+        for c in range(0, zones, zones_per_camera):
+            zone_rows = [{'id': f"zone{i}", 'entered': 0, 'exited': 0, 'inside': int(occupancy[i])}
+                         for i in range(c, min(c + zones_per_camera, zones))]
+            cameras.append({'camera': f"cam{c // zones_per_camera}", 'entered': 0, 'exited': 0,
+                            'inside': sum(z['inside'] for z in zone_rows), 'zones': zone_rows})
+        ticks.append(cameras)
+
+    rows = []
+    for name, evaluator in (('re-parse all', _NaiveAlerts(settings)),
+                            ('AlertEngine', AlertEngine(settings))):
+        tick_seconds = []
+        for tick, cameras in enumerate(ticks):
+            start = time.perf_counter()
+            evaluator.update(cameras, now=1_700_000_000.0 + tick)
+            tick_seconds.append(time.perf_counter() - start)
+        total = sum(tick_seconds)
+        rows.append({
+            'evaluator': name,
+            'evaluations': evaluator.evaluations,
+            'evals_per_s': evaluator.evaluations / total,
+            'ms_per_tick': total / len(ticks) * 1000,
+            'max_tick_ms': max(tick_seconds) * 1000,
+            'alerts': evaluator.alerts,
+        })
+    return rows
+
+
+def print_table(rows, columns):
+    print("  ".join(f"{c:>12}" for c in columns))
+    for row in rows:
+        cells = []
+        for c in columns:
+            value = row[c]
+            cells.append(f"{value:>12.4g}" if isinstance(value, float) else f"{value:>12}")
+        print("  ".join(cells))
+
+
+# -------------------- RUN --------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    batch = sub.add_parser("batch", help="frames/sec against YOLO batch size")
+    batch.add_argument("--video", default=DEFAULT_VIDEO)
+    batch.add_argument("--frames", type=int, default=64)
+    batch.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    batch.add_argument("--streams", type=int, default=1)
+    batch.add_argument("--max-wait", type=float, default=0.05)
+
+    gate = sub.add_parser("gate", help="motion-gated vs ungated counts on a video")
+    gate.add_argument("--video", default=DEFAULT_VIDEO)
+    gate.add_argument("--threshold", type=float, default=0.002)
+
+    backends = sub.add_parser("backends", help="compare detector backends on a video")
+    backends.add_argument("--video", default=DEFAULT_VIDEO)
+    backends.add_argument("--frames", type=int, default=64)
+    backends.add_argument("--batch-size", type=int, default=8)
+    backends.add_argument("--backends", nargs="+",
+                          default=["ultralytics", "onnx:yolov8n.onnx", "onnx:yolov8n.onnx:int8"],
+                          help="name[:model][:int8], the first one is the count reference")
+    backends.add_argument("--export", metavar="WEIGHTS",
+                          help="export WEIGHTS to ONNX (and INT8) before running")
+
+    soak = sub.add_parser("soak", help="memory of track state over a long stream of ids")
+    soak.add_argument("--frames", type=int, default=500_000)
+    soak.add_argument("--concurrent", type=int, default=40)
+    soak.add_argument("--lifetime", type=int, default=90)
+    soak.add_argument("--max-growth-kb", type=float, default=256)
+
+    transport = sub.add_parser("transport", help="queue pickling vs shared memory frame ring")
+    transport.add_argument("--sizes", nargs="+", choices=sorted(TRANSPORT_SIZES),
+                           default=["720p", "1080p"])
+    transport.add_argument("--frames", type=int, default=300)
+
+    pipeline = sub.add_parser("pipeline", help="end-to-end people_counter variants, as JSON")
+    pipeline.add_argument("--video", default=DEFAULT_VIDEO, help="real clip ('' to skip)")
+    pipeline.add_argument("--synthetic-seconds", type=float, nargs="*", default=[60],
+                          help="lengths of synthetic videos to generate")
+    pipeline.add_argument("--variants", nargs="+", choices=sorted(PIPELINE_VARIANTS),
+                          default=list(PIPELINE_VARIANTS))
+    pipeline.add_argument("--detector", default="stub",
+                          help="'stub' (no model) or name[:model][:int8]")
+    pipeline.add_argument("--stub-latency", type=float, default=0.0,
+                          help="seconds per frame the stub detector sleeps")
+    pipeline.add_argument("--repeat", type=int, default=1)
+    pipeline.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "people_counter_bench"),
+                          help="where synthetic videos are cached")
+    pipeline.add_argument("--json", default="bench_pipeline.json", help="results file to write")
+    pipeline.add_argument("--compare", metavar="JSON", help="earlier results to check against")
+    pipeline.add_argument("--threshold", type=float, default=0.1,
+                          help="allowed fractional fps drop / RSS growth before failing")
+
+    tiling = sub.add_parser("tiling", help="full-frame vs tiled detection on dense crowds")
+    tiling.add_argument("--video", help="real high-resolution video (default: synthetic 4K crowd)")
+    tiling.add_argument("--frames", type=int, default=10)
+    tiling.add_argument("--detector", default="stub",
+                        help="'stub' (no model) or name[:model][:int8]")
+    tiling.add_argument("--max-tiles", type=int, nargs="+", default=[4, 8])
+
+    embedding = sub.add_parser("embedding", help="embedding modes: cost, ID switches, counts")
+    embedding.add_argument("--video", default=DEFAULT_VIDEO)
+    embedding.add_argument("--frames", type=int, default=300)
+    embedding.add_argument("--detector", default="ultralytics",
+                           help="'stub' (no model) or name[:model][:int8]")
+    embedding.add_argument("--modes", nargs="+", choices=EMBED_MODES, default=list(EMBED_MODES),
+                           help="the first one is the ID switch reference")
+    embedding.add_argument("--every", type=int, default=5)
+    embedding.add_argument("--streams", type=int, default=4,
+                           help="also track the clip as this many cameras (1 to skip)")
+
+    source = sub.add_parser("source", help="reconnects and stale-frame drops on a faulty camera")
+    source.add_argument("--video", default=DEFAULT_VIDEO,
+                        help="file played back in real time as the camera")
+    source.add_argument("--seconds", type=float, default=5.0)
+    source.add_argument("--work-ms", type=float, default=50,
+                        help="consumer time per frame")
+    source.add_argument("--fail-every", type=int, default=90,
+                        help="reads between injected failures in the flaky scenarios")
+    source.add_argument("--outage", type=int, default=2,
+                        help="failed reconnect attempts after each failure")
+
+    live = sub.add_parser("live", help="/api/live throughput while a counter publishes")
+    live.add_argument("--seconds", type=float, default=3.0)
+    live.add_argument("--readers", type=int, nargs="+", default=[1, 4])
+    live.add_argument("--rates", type=int, nargs="+", default=[30, 1000, 0],
+                      help="writer publishes per second (0 = non-stop)")
+
+    stream = sub.add_parser("stream", help="dashboard updates: SSE stream vs 1 s polling")
+    stream.add_argument("--viewers", type=int, nargs="+", default=[10, 100])
+    stream.add_argument("--cameras", type=int, default=4)
+    stream.add_argument("--seconds", type=float, default=5.0)
+    stream.add_argument("--rate", type=float, default=2.0,
+                        help="count changes per camera per second")
+
+    settings = sub.add_parser("settings", help="settings API load: per-call vs pooled connections")
+    settings.add_argument("--clients", type=int, nargs="+", default=[4, 16])
+    settings.add_argument("--seconds", type=float, default=5.0)
+    settings.add_argument("--write-ratio", type=float, default=0.1,
+                          help="share of requests that update a setting")
+    settings.add_argument("--transport", choices=["http", "app"], nargs="+",
+                          default=["http", "app"],
+                          help="real HTTP server, or Flask's test client in one process")
+
+    lookup = sub.add_parser("lookup", help="setting lookups: per-call SQLite vs SettingsCache")
+    lookup.add_argument("--lookups", type=int, default=100000)
+    lookup.add_argument("--check-interval", type=float, default=1.0,
+                        help="seconds between SettingsCache version checks")
+
+    history = sub.add_parser("history", help="count history: batched ingestion and rollup queries")
+    history.add_argument("--events", type=int, default=200000)
+    history.add_argument("--cameras", type=int, default=8)
+    history.add_argument("--naive-events", type=int, default=2000,
+                         help="events written with a commit each, for comparison")
+
+    retention = sub.add_parser("retention", help="retention cleanup: one DELETE vs small batches")
+    retention.add_argument("--events", type=int, default=300000)
+    retention.add_argument("--days", type=int, default=180, help="days of history to generate")
+    retention.add_argument("--retention-days", type=int, default=90)
+
+    alerts = sub.add_parser("alerts", help="alert rules: re-parse every tick vs AlertEngine")
+    alerts.add_argument("--zones", type=int, default=500)
+    alerts.add_argument("--rules", type=int, default=30)
+    alerts.add_argument("--seconds", type=int, default=60, help="one-second ticks to simulate")
+    alerts.add_argument("--change-ratio", type=float, default=0.2,
+                        help="share of zones whose occupancy changes per tick")
+
+    args = parser.parse_args()
+
+    if args.benchmark == "batch":
+        frames = load_frames(args.video, args.frames)
+        rows = bench_batch(frames, args.batch_sizes, args.streams, args.max_wait)
+        print_table(rows, ['batch_size', 'streams', 'frames', 'batches', 'seconds', 'fps'])
+
+    elif args.benchmark == "gate":
+        rows, skip_ratio, counts_match = bench_gate(args.video, args.threshold)
+        print_table(rows, ['threshold', 'detector_calls', 'entered', 'exited', 'seconds'])
+        print(f"Skip ratio: {skip_ratio:.1%}")
+        if not counts_match:
+            raise SystemExit("❌ Counts differ with the motion gate enabled")
+        print("✅ Counts match")
+
+    elif args.benchmark == "backends":
+        if args.export:
+            export_onnx(args.export, int8=True)
+        frames = load_frames(args.video, args.frames)
+        rows = bench_backends(args.video, args.backends, frames, args.batch_size)
+        print_table(rows, ['backend', 'p50_ms', 'p95_ms', 'fps', 'entered', 'exited', 'agrees'])
+
+    elif args.benchmark == "transport":
+        rows = bench_transport(args.sizes, args.frames)
+        print_table(rows, ['size', 'transport', 'frames', 'fps', 'producer_cpu_s', 'consumer_cpu_s'])
+
+    elif args.benchmark == "pipeline":
+        videos = {}
+        if args.video:
+            videos['clip'] = (args.video, None)
+        os.makedirs(args.workdir, exist_ok=True)
+        for seconds in args.synthetic_seconds:
+            path = os.path.join(args.workdir, f"synthetic_{seconds:g}s.mp4")
+            expected_path = path + ".json"
+            if os.path.exists(path) and os.path.exists(expected_path):
+                with open(expected_path) as f:
+                    expected = tuple(json.load(f))
+            else:
+                expected = make_synthetic_video(path, seconds)
+                with open(expected_path, "w") as f:
+                    json.dump(expected, f)
+            videos[f"synthetic_{seconds:g}s"] = (path, expected)
+
+        rows = bench_pipeline(videos, args.variants, args.detector, args.stub_latency, args.repeat)
+        table = [{**row, **{f"{stage}_p95": s['p95_ms'] for stage, s in row['stages'].items()}}
+                 for row in rows]
+        for row in table:
+            for stage in ('decode', 'detect', 'track', 'count', 'draw', 'encode'):
+                row.setdefault(f"{stage}_p95", "-")
+        print_table(table, ['video', 'variant', 'fps', 'peak_rss_mb', 'entered', 'exited',
+                            'decode_p95', 'detect_p95', 'track_p95', 'count_p95', 'encode_p95'])
+        for row in rows:
+            if 'expected_entered' in row:
+                print(f"{row['video']}/{row['variant']}: expected "
+                      f"{row['expected_entered']}/{row['expected_exited']}, "
+                      f"counted {row['entered']}/{row['exited']}")
+
+        report = {
+            'commit': _git_commit(),
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'detector': args.detector,
+            'results': rows,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results saved to: {args.json}")
+
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+            regressions = compare_pipeline(baseline, rows, args.threshold)
+            if regressions:
+                for line in regressions:
+                    print(f"❌ {line}")
+                raise SystemExit(f"❌ {len(regressions)} regression(s) against {args.compare} "
+                                 f"(commit {baseline.get('commit')})")
+            print(f"✅ No regressions against {args.compare} (threshold {args.threshold:.0%})")
+
+    elif args.benchmark == "tiling":
+        truth = None
+        if args.video:
+            frames = load_frames(args.video, args.frames)
+        else:
+            frames, truth = make_crowd_frames(args.frames)
+
+        def make_backend(imgsz):
+            if args.detector == 'stub':
+                # About 8x3 px at the model input, where a nano model gives up
+                return StubBackend(min_area=24, imgsz=imgsz)
+            name, model, int8 = parse_backend_spec(args.detector)
+            backend = create_backend(name, model, device="cpu", int8=int8)
+            if hasattr(backend, 'imgsz'):
+                backend.imgsz = imgsz
+            return backend
+
+        rows = bench_tiling(frames, truth, make_backend, args.max_tiles)
+        print_table(rows, ['mode', 'imgsz', 'inputs_per_frame', 'relative_cost',
+                           'boxes_per_frame', 'recall', 'ms_per_frame'])
+
+    elif args.benchmark == "embedding":
+        frames = load_frames(args.video, args.frames)
+        if args.detector == 'stub':
+            backend = StubBackend()
+        else:
+            name, model, int8 = parse_backend_spec(args.detector)
+            backend = create_backend(name, model, device="cpu", int8=int8)
+        # Detect once up front so every mode tracks the same boxes
+        detections = [dets for i in range(0, len(frames), 16)
+                      for dets in backend.predict(frames[i:i + 16])]
+        print(f"{len(frames)} frames, {sum(map(len, detections)) / len(frames):.1f} "
+              f"detections per frame")
+
+        rows = bench_embedding(frames, detections, args.modes, args.every, args.streams)
+        print_table(rows, ['mode', 'embedded', 'track_ms', 'track_ids', 'id_switches',
+                           'entered', 'exited'])
+
+    elif args.benchmark == "source":
+        rows = bench_source(args.video, args.seconds, args.work_ms / 1000, args.fail_every,
+                            args.outage)
+        print_table(rows, ['scenario', 'consumed', 'frames', 'dropped', 'reconnects',
+                           'read_failures', 'latency_ms', 'max_latency_ms'])
+
+    elif args.benchmark == "live":
+        rows = [bench_live(args.seconds, readers, rate)
+                for rate in args.rates for readers in args.readers]
+        print_table(rows, ['readers', 'rate', 'requests_per_s', 'torn_reads', 'missed_reads',
+                           'publishes_per_s', 'worst_publish_us'])
+
+    elif args.benchmark == "stream":
+        rows = [row for viewers in args.viewers
+                for row in bench_stream(viewers, args.cameras, args.seconds, args.rate)]
+        print_table(rows, ['mode', 'viewers', 'requests', 'messages', 'server_cpu_s',
+                           'lag_p50_ms', 'lag_p95_ms'])
+
+    elif args.benchmark == "settings":
+        rows = [row for transport in args.transport for clients in args.clients
+                for row in bench_settings(clients, args.seconds, args.write_ratio, transport)]
+        print_table(rows, ['mode', 'transport', 'clients', 'requests', 'errors', 'requests_per_s',
+                           'p50_ms', 'p99_ms'])
+
+    elif args.benchmark == "lookup":
+        rows = bench_lookup(args.lookups, args.check_interval)
+        print_table(rows, ['lookup', 'lookups', 'us_per_lookup', 'version_checks', 'reload_ms'])
+
+    elif args.benchmark == "history":
+        rows, raw_ms, rollup_ms, buckets = bench_history(args.events, args.cameras,
+                                                         args.naive_events)
+        print_table(rows, ['writer', 'events', 'events_per_s', 'record_us', 'flushes'])
+        print(f"Hourly totals for a day ({buckets} rows): {raw_ms:.1f} ms from raw events, "
+              f"{rollup_ms:.2f} ms from counts_hour")
+        print("✅ Rollups match the raw events")
+
+    elif args.benchmark == "retention":
+        rows = bench_retention(args.events, args.days, args.retention_days)
+        print_table(rows, ['mode', 'deleted', 'seconds', 'max_write_ms', 'p99_write_ms',
+                           'max_read_ms', 'file_mb'])
+
+    elif args.benchmark == "alerts":
+        rows = bench_alerts(args.zones, args.rules, args.seconds, args.change_ratio)
+        print_table(rows, ['evaluator', 'evaluations', 'evals_per_s', 'ms_per_tick',
+                           'max_tick_ms', 'alerts'])
+
+    elif args.benchmark == "soak":
+        rows = bench_soak(args.frames, args.concurrent, args.lifetime)
+        print_table(rows, ['frame', 'track_ids', 'live_slots', 'heap_kb', 'entered', 'seconds'])
+        # Compare against the first checkpoint, after arrays and caches are warm
+        growth = rows[-1]['heap_kb'] - rows[0]['heap_kb']
+        if growth > args.max_growth_kb:
+            raise SystemExit(f"❌ Track state grew by {growth:.0f} KiB")
+        print(f"✅ Memory flat ({growth:+.0f} KiB over {rows[-1]['track_ids']} track ids)")
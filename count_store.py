@@ -0,0 +1,279 @@
+"""
+Count History
+Store crossing events in batched transactions and roll them up per minute, hour and day
+"""
+
+import sqlite3
+import threading
+import time
+
+HISTORY_DB = "counts.db"
+
+# Rollup tables (counts_<name>) and their bucket sizes in seconds; days are UTC days
+ROLLUPS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+ROLLUP_INTERVAL = 10.0
+
+SCHEMA = (
+    # One row per crossing; rows without a direction only record a zone's
+    # occupancy changing without one (e.g. a track lost inside it)
+    '''
+    CREATE TABLE IF NOT EXISTS count_events (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        camera_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        geometry_id TEXT NOT NULL,
+        direction TEXT,
+        track_id INTEGER,
+        inside INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS count_events_ts ON count_events (ts)',
+    # Last event id each rollup table has counted
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        resolution TEXT PRIMARY KEY,
+        last_event_id INTEGER NOT NULL
+    )
+    ''',
+)
+
+ROLLUP_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS counts_{name} (
+        camera_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        geometry_id TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        entered INTEGER NOT NULL,
+        exited INTEGER NOT NULL,
+        occupancy_max INTEGER NOT NULL,
+        occupancy_last INTEGER NOT NULL,
+        PRIMARY KEY (camera_id, kind, geometry_id, bucket)
+    ) WITHOUT ROWID
+'''
+ROLLUP_INDEX = 'CREATE INDEX IF NOT EXISTS counts_{name}_bucket ON counts_{name} (bucket)'
+
+INSERT_EVENTS = '''
+    INSERT INTO count_events (ts, camera_id, kind, geometry_id, direction, track_id, inside)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Adds the events in (?, ?] to their buckets; occupancy_last is the newest event's.
+# CASE rather than SUM(direction = ...), which is NULL for occupancy-only buckets
+ROLLUP = '''
+    INSERT INTO counts_{name}
+    (camera_id, kind, geometry_id, bucket, entered, exited, occupancy_max, occupancy_last)
+    SELECT r.camera_id, r.kind, r.geometry_id, r.bucket, r.entered, r.exited,
+           r.occupancy_max, e.inside
+    FROM (
+        SELECT camera_id, kind, geometry_id, CAST(ts / {seconds} AS INTEGER) * {seconds} AS bucket,
+               SUM(CASE WHEN direction = 'enter' THEN 1 ELSE 0 END) AS entered,
+               SUM(CASE WHEN direction = 'exit' THEN 1 ELSE 0 END) AS exited,
+               MAX(inside) AS occupancy_max, MAX(id) AS last_id
+        FROM count_events
+        WHERE id > ? AND id <= ?
+        GROUP BY camera_id, kind, geometry_id, bucket
+    ) AS r
+    JOIN count_events AS e ON e.id = r.last_id
+    WHERE true
+    ON CONFLICT (camera_id, kind, geometry_id, bucket) DO UPDATE SET
+        entered = entered + excluded.entered,
+        exited = exited + excluded.exited,
+        occupancy_max = MAX(occupancy_max, excluded.occupancy_max),
+        occupancy_last = excluded.occupancy_last
+'''
+
+
+class CountStore:
+    """
+    Count history of every camera, in a SQLite file shared by all processes.
+
+    `record` only appends a frame's crossings to an in-memory buffer, so
+    the counting loop never waits for the disk. A background thread writes
+    the buffer every `flush_interval` seconds, or as soon as `batch_size`
+    events are waiting, with one `executemany` per transaction. Every
+    `rollup_interval` seconds it adds the events written since the last
+    rollup to the per-minute, per-hour and per-day tables (entered, exited,
+    peak and last occupancy per camera, line or zone and bucket), so
+    dashboards read a few pre-aggregated rows instead of scanning events.
+
+    A rollup reads and advances its watermark in one BEGIN IMMEDIATE
+    transaction, so several processes sharing the file never count an
+    event twice. `close` flushes and rolls up whatever is left.
+    """
+
+    def __init__(self, path=HISTORY_DB, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 rollup_interval=ROLLUP_INTERVAL, log=print):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self.log = log
+
+        self.recorded = 0
+        self.written = 0
+        self.flushes = 0
+        self.rollups = 0
+
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        # Occupancy last recorded per (camera, zone), to notice changes without a crossing
+        self._inside = {}
+
+        # Autocommit: transactions are explicit, so they can be BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        # Only takes effect on a new file; lets retention.py hand freed pages back
+        self._conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._db_lock = threading.Lock()
+        with self._transaction():
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            for name in ROLLUPS:
+                self._conn.execute(ROLLUP_SCHEMA.format(name=name))
+                self._conn.execute(ROLLUP_INDEX.format(name=name))
+
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="count-store", daemon=True)
+        self._thread.start()
+
+    # ==================== WRITING ====================
+    def record(self, camera_id, crossings, counts, ts=None):
+        """Buffer a frame's CameraCounter crossings, with the occupancy after them"""
+        ts = time.time() if ts is None else ts
+        inside = {zone['id']: zone['inside'] for zone in counts.get('zones', ())}
+        rows = []
+        crossed = set()
+        for track_id, kind, geometry_id, direction in crossings:
+            if kind == 'zone':
+                occupancy = inside[geometry_id]
+                crossed.add(geometry_id)
+            else:
+                occupancy = counts['inside']
+            rows.append((ts, camera_id, kind, str(geometry_id), direction, int(track_id),
+                         occupancy))
+        for zone_id, occupancy in inside.items():
+            key = (camera_id, zone_id)
+            if self._inside.get(key, 0) != occupancy and zone_id not in crossed:
+                rows.append((ts, camera_id, 'zone', str(zone_id), None, None, occupancy))
+            self._inside[key] = occupancy
+        if not rows:
+            return
+
+        with self._buffer_lock:
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.batch_size
+        self.recorded += len(rows)
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write the buffered events in one transaction"""
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            with self._transaction():
+                self._conn.executemany(INSERT_EVENTS, rows)
+        except sqlite3.Error:
+            # Keep them for the next flush
+            with self._buffer_lock:
+                self._buffer[:0] = rows
+            raise
+        self.written += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    def rollup(self):
+        """Add events written since the last rollup to every rollup table"""
+        with self._transaction(immediate=True):
+            conn = self._conn
+            newest = conn.execute('SELECT MAX(id) FROM count_events').fetchone()[0] or 0
+            for name, seconds in ROLLUPS.items():
+                row = conn.execute('SELECT last_event_id FROM rollup_state WHERE resolution = ?',
+                                   (name,)).fetchone()
+                last = row[0] if row else 0
+                if last >= newest:
+                    continue
+                conn.execute(ROLLUP.format(name=name, seconds=seconds), (last, newest))
+                conn.execute('INSERT OR REPLACE INTO rollup_state (resolution, last_event_id) '
+                             'VALUES (?, ?)', (name, newest))
+        self.rollups += 1
+
+    def close(self):
+        self._closed.set()
+        self._wake.set()
+        self._thread.join()
+        self._conn.close()
+
+    # ==================== READING ====================
+    def history(self, resolution='hour', camera_id=None, geometry_id=None, since=None, until=None):
+        """Rollup rows of one resolution, oldest bucket first, as dicts"""
+        if resolution not in ROLLUPS:
+            raise ValueError(f"Unknown resolution '{resolution}', expected one of {tuple(ROLLUPS)}")
+        conditions, params = [], []
+        for condition, value in (('bucket >= ?', since), ('bucket < ?', until),
+                                 ('camera_id = ?', camera_id), ('geometry_id = ?', geometry_id)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        query = f'SELECT * FROM counts_{resolution}'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY bucket, camera_id, kind, geometry_id'
+
+        with self._db_lock:
+            cursor = self._conn.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    # ==================== BACKGROUND ====================
+    def _run(self):
+        next_rollup = time.monotonic() + self.rollup_interval
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            closing = self._closed.is_set()
+            try:
+                self.flush()
+                if closing or time.monotonic() >= next_rollup:
+                    self.rollup()
+                    next_rollup = time.monotonic() + self.rollup_interval
+            except sqlite3.Error as e:
+                self.log(f"⚠️  Count history not saved yet: {e}")
+            if closing:
+                return
+
+    def _transaction(self, immediate=False):
+        return _Transaction(self._conn, self._db_lock, immediate)
+
+
+class _Transaction:
+    """BEGIN ... COMMIT (ROLLBACK on error) on an autocommit connection, holding `lock`"""
+
+    def __init__(self, conn, lock, immediate=False):
+        self.conn = conn
+        self.lock = lock
+        self.begin = 'BEGIN IMMEDIATE' if immediate else 'BEGIN'
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute(self.begin)
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.lock.release()
@@ -0,0 +1,188 @@
+"""
+Line Crossing Counts
+Vectorized crossing checks for all tracks against counting lines and occupancy zones
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+from track_state import TrackStateStore
+
+
+class LineCrossingCounter:
+    """
+    Count tracks crossing one or more line segments.
+
+    Each line is ((x1, y1), (x2, y2)). A centroid is on side -1 or 1 of a
+    line once its signed distance is more than `offset` pixels, and 0 (no
+    change) inside that band or beyond the segment's ends. A track is
+    counted once per line when its last known side flips: -1 -> 1 is an
+    entry and 1 -> -1 an exit. For a left-to-right horizontal line, side 1
+    is below the line, so walking down the image enters.
+
+    All checks for a frame run as array operations over every track and
+    every line at once. Per-track state lives in a fixed-size
+    TrackStateStore of `capacity` tracks, forgotten `ttl` frames after a
+    track was last seen or when `sweep` is told the tracker dropped it.
+    """
+
+    def __init__(self, lines, offset, capacity=4096, ttl=900):
+        lines = np.asarray(lines, dtype=np.float64).reshape(-1, 2, 2)
+        self.lines = lines
+        self.offset = offset
+
+        starts = lines[:, 0]
+        vectors = lines[:, 1] - starts
+        lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+        if (lengths == 0).any():
+            raise ValueError("Counting lines must have two distinct end points")
+
+        self._starts = starts
+        self._directions = vectors / lengths[:, None]
+        self._normals = np.stack([-self._directions[:, 1], self._directions[:, 0]], axis=1)
+        self._lengths = lengths
+
+        self.entered = np.zeros(len(lines), dtype=np.int64)
+        self.exited = np.zeros(len(lines), dtype=np.int64)
+
+        self.state = TrackStateStore(len(lines), capacity, ttl)
+        self.frame = 0
+
+    def sides(self, centroids):
+        """(tracks, lines) array of -1 / 0 / 1 sides for an (N, 2) centroid array"""
+        relative = centroids[:, None, :] - self._starts[None, :, :]
+        distance = (relative * self._normals[None]).sum(axis=2)
+        along = (relative * self._directions[None]).sum(axis=2)
+
+        sides = np.zeros(distance.shape, dtype=np.int8)
+        sides[distance < -self.offset] = -1
+        sides[distance > self.offset] = 1
+        sides[(along < 0) | (along > self._lengths[None])] = 0
+        return sides
+
+    def update(self, track_ids, centroids):
+        """Check crossings for one frame; returns (entered, exited) masks of shape (tracks, lines)"""
+        self.frame += 1
+        if not len(track_ids):
+            empty = np.zeros((0, len(self.lines)), dtype=bool)
+            return empty, empty
+
+        state = self.state
+        rows = state.rows(track_ids, self.frame)
+        sides = self.sides(np.asarray(centroids, dtype=np.float64))
+
+        last = state.last_side[rows]
+        previous = np.where(last == 0, sides, last)
+        uncounted = ~state.counted[rows]
+
+        entered = uncounted & (previous < 0) & (sides > 0)
+        exited = uncounted & (previous > 0) & (sides < 0)
+
+        state.counted[rows] |= entered | exited
+        state.last_side[rows] = np.where(sides != 0, sides, last)
+
+        self.entered += entered.sum(axis=0)
+        self.exited += exited.sum(axis=0)
+        return entered, exited
+
+    def sweep(self, live_ids=None):
+        """Forget tracks the tracker no longer has, or that outlived the TTL"""
+        return self.state.sweep(self.frame, live_ids)
+
+
+class ZoneOccupancy:
+    """
+    Count tracks entering and leaving polygon zones, and how many are inside.
+
+    Each zone is a list of (x, y) points. Membership is precomputed into
+    two bitmask grids of `cell`-pixel cells, one bit per zone (up to 64):
+    an inner grid of the polygon shrunk by `offset` pixels and an outer one
+    grown by it. A frame then costs one grid lookup per track however many
+    zones there are. A centroid is inside a zone once it is in the inner
+    grid, outside once it has left the outer one, and keeps its last state
+    in between, so jitter on an edge isn't counted.
+
+    Every outside -> inside change is an entry and every inside -> outside
+    change an exit; a track first seen inside is not an entry. `inside` is
+    the number of tracks currently in each zone.
+    """
+
+    MAX_ZONES = 64
+
+    def __init__(self, zones, frame_size, offset, cell=4, capacity=4096, ttl=900):
+        if len(zones) > self.MAX_ZONES:
+            raise ValueError(f"At most {self.MAX_ZONES} zones per camera, got {len(zones)}")
+
+        W, H = frame_size
+        self.cell = cell
+        self.offset = offset
+        grid = (math.ceil(H / cell), math.ceil(W / cell))
+        self._inner = np.zeros(grid, dtype=np.uint64)
+        self._outer = np.zeros(grid, dtype=np.uint64)
+
+        radius = int(round(offset / cell))
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+        for bit, polygon in enumerate(zones):
+            points = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+            if len(points) < 3:
+                raise ValueError("Zones need at least three points")
+            mask = np.zeros(grid, dtype=np.uint8)
+            cv2.fillPoly(mask, [np.round(points / cell).astype(np.int32)], 1)
+            inner = cv2.erode(mask, kernel) if radius else mask
+            outer = cv2.dilate(mask, kernel) if radius else mask
+            self._inner[inner > 0] |= np.uint64(1 << bit)
+            self._outer[outer > 0] |= np.uint64(1 << bit)
+
+        self._bits = np.left_shift(np.uint64(1), np.arange(len(zones), dtype=np.uint64))
+        self.zones = len(zones)
+
+        self.entered = np.zeros(len(zones), dtype=np.int64)
+        self.exited = np.zeros(len(zones), dtype=np.int64)
+        self.inside = np.zeros(len(zones), dtype=np.int64)
+
+        self.state = TrackStateStore(len(zones), capacity, ttl)
+        self.frame = 0
+
+    def sides(self, centroids):
+        """(tracks, zones) array of -1 (outside) / 0 (edge band) / 1 (inside)"""
+        cells = np.asarray(centroids, dtype=np.int64) // self.cell
+        rows = np.clip(cells[:, 1], 0, self._inner.shape[0] - 1)
+        columns = np.clip(cells[:, 0], 0, self._inner.shape[1] - 1)
+
+        inner = self._inner[rows, columns][:, None] & self._bits
+        outer = self._outer[rows, columns][:, None] & self._bits
+
+        sides = np.zeros(inner.shape, dtype=np.int8)
+        sides[inner != 0] = 1
+        sides[outer == 0] = -1
+        return sides
+
+    def update(self, track_ids, centroids):
+        """Check zone changes for one frame; returns (entered, exited) masks of shape (tracks, zones)"""
+        self.frame += 1
+        if not len(track_ids):
+            self.inside[:] = 0
+            empty = np.zeros((0, self.zones), dtype=bool)
+            return empty, empty
+
+        state = self.state
+        rows = state.rows(track_ids, self.frame)
+        sides = self.sides(centroids)
+
+        last = state.last_side[rows]
+        entered = (last < 0) & (sides > 0)
+        exited = (last > 0) & (sides < 0)
+
+        current = np.where(sides != 0, sides, last)
+        state.last_side[rows] = current
+
+        self.entered += entered.sum(axis=0)
+        self.exited += exited.sum(axis=0)
+        self.inside = (current > 0).sum(axis=0)
+        return entered, exited
+
+    def sweep(self, live_ids=None):
+        """Forget tracks the tracker no longer has, or that outlived the TTL"""
+        return self.state.sweep(self.frame, live_ids)
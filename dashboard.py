@@ -1,66 +1,105 @@
-import streamlit as st
-import requests
-import time
-
-st.set_page_config(page_title="Admin Panel", layout="wide")
-
-# --------- LOGIN SYSTEM ----------
-if "logged_in" not in st.session_state:
-    st.session_state.logged_in = False
-
-def login_page():
-    st.title("🔐 Admin Login")
-
-    username = st.text_input("Username")
-    password = st.text_input("Password", type="password")
-
-    if st.button("Login"):
-        # Demo credentials (change later)
-        if username == "admin" and password == "1234":
-            st.session_state.logged_in = True
-            st.success("✅ Login Successful")
-            st.rerun()
-        else:
-            st.error("❌ Invalid username or password")
-
-def dashboard_page():
-    st.title("👥 AI Crowd Counting System - Admin Dashboard")
-
-    if st.button("🚪 Logout"):
-        st.session_state.logged_in = False
-        st.rerun()
-
-    col1, col2, col3 = st.columns(3)
-
-    entered_box = col1.empty()
-    exited_box = col2.empty()
-    inside_box = col3.empty()
-
-    status = st.empty()
-
-    while True:
-        try:
-            r = requests.get("http://localhost:5005/api/live", timeout=2)
-            data = r.json()
-
-            entered = int(data.get("entered", 0))
-            exited = int(data.get("exited", 0))
-            inside = entered - exited
-
-            entered_box.metric("Total Entered", entered)
-            exited_box.metric("Total Exited", exited)
-            inside_box.metric("Currently Inside", inside)
-
-            status.success("✅ System Live")
-
-        except:
-            status.error("❌ Admin Server Not Running")
-
-        time.sleep(1)
-
-# --------- ROUTER ----------
-if st.session_state.logged_in:
-    dashboard_page()
-else:
-    login_page()
-
+import streamlit as st
+import requests
+import json
+import time
+
+st.set_page_config(page_title="Admin Panel", layout="wide")
+
+LIVE_STREAM_URL = "http://localhost:5005/api/live/stream"
+
+# --------- LIVE UPDATES ----------
+def live_events(url):
+    """Yield (event, data) from the admin server's Server-Sent Events stream.
+
+    One HTTP connection stays open for as long as the server is up. The
+    read timeout is above the server's 15 s keepalive, so a dead server
+    shows up as an error.
+    """
+    with requests.get(url, stream=True, timeout=(3, 30)) as r:
+        r.raise_for_status()
+        event, data = "message", []
+        for line in r.iter_lines(decode_unicode=True):
+            if not line:
+                if data:
+                    yield event, json.loads("\n".join(data))
+                event, data = "message", []
+            elif line.startswith(":"):
+                continue
+            elif line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data.append(line[5:].lstrip())
+
+# --------- LOGIN SYSTEM ----------
+if "logged_in" not in st.session_state:
+    st.session_state.logged_in = False
+
+def login_page():
+    st.title("🔐 Admin Login")
+
+    username = st.text_input("Username")
+    password = st.text_input("Password", type="password")
+
+    if st.button("Login"):
+        # Demo credentials (change later)
+        if username == "admin" and password == "1234":
+            st.session_state.logged_in = True
+            st.success("✅ Login Successful")
+            st.rerun()
+        else:
+            st.error("❌ Invalid username or password")
+
+def dashboard_page():
+    st.title("👥 AI Crowd Counting System - Admin Dashboard")
+
+    if st.button("🚪 Logout"):
+        st.session_state.logged_in = False
+        st.rerun()
+
+    col1, col2, col3 = st.columns(3)
+
+    entered_box = col1.empty()
+    exited_box = col2.empty()
+    inside_box = col3.empty()
+
+    status = st.empty()
+    cameras_box = st.empty()
+
+    # Counts pushed by the server, per camera; redrawn on every push
+    cameras = {}
+    while True:
+        try:
+            for event, data in live_events(LIVE_STREAM_URL):
+                if event == "snapshot":
+                    cameras = {c["camera"]: c for c in data["cameras"]}
+                elif event == "counts":
+                    for camera in data["cameras"]:
+                        cameras[camera["camera"]] = camera
+
+                entered = sum(c["entered"] for c in cameras.values())
+                exited = sum(c["exited"] for c in cameras.values())
+                inside = entered - exited
+
+                entered_box.metric("Total Entered", entered)
+                exited_box.metric("Total Exited", exited)
+                inside_box.metric("Currently Inside", inside)
+                cameras_box.table([
+                    {"Camera": c["camera"], "Entered": c["entered"], "Exited": c["exited"],
+                     "Inside": c["inside"], "Live": "✅" if c["active"] else "⏹"}
+                    for c in cameras.values()
+                ])
+
+                status.success("✅ System Live")
+
+        except (requests.RequestException, ValueError):
+            status.error("❌ Admin Server Not Running")
+
+        # Reconnect after the server went away
+        time.sleep(1)
+
+# --------- ROUTER ----------
+if st.session_state.logged_in:
+    dashboard_page()
+else:
+    login_page()
+
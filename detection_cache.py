@@ -0,0 +1,164 @@
+"""
+Detection Cache
+Store per-frame detections and appearance embeddings on disk to re-count recordings without YOLO
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+# Frame rows: (first detection row, detection count), or one of these counts
+PREDICT = -1
+CARRY = -2
+
+# Bytes hashed from the start, middle and end of a video for its fingerprint
+_FINGERPRINT_CHUNK = 1 << 20
+
+_COLUMNS = {
+    'frames': (np.int64, 2),
+    'boxes': (np.int32, 4),
+    'conf': (np.float32, None),
+}
+
+
+def video_fingerprint(path):
+    """Cheap content hash of a video file: its size plus three 1 MiB samples"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        for position in (0, max(0, size // 2 - _FINGERPRINT_CHUNK // 2),
+                         max(0, size - _FINGERPRINT_CHUNK)):
+            f.seek(position)
+            digest.update(f.read(_FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
+
+def cache_key(video_path, settings):
+    """Cache directory name for a video and the settings its detections depend on"""
+    payload = json.dumps({'video': video_fingerprint(video_path), **settings}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:20]
+
+
+class DetectionRecorder:
+    """
+    Append one stream's tracker input, frame by frame, to a cache directory.
+
+    Columns are raw little-endian files (frame rows, ltwh boxes, scores and
+    float16 embeddings) plus `meta.json`. They are written to
+    `<path>.partial` and only moved into place by `close(complete=True)`,
+    so an interrupted run never leaves a cache that looks whole.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = dict(meta)
+        self._partial = path + ".partial"
+        shutil.rmtree(self._partial, ignore_errors=True)
+        os.makedirs(self._partial)
+
+        self._files = {name: open(os.path.join(self._partial, f"{name}.bin"), "wb")
+                       for name in list(_COLUMNS) + ['embeds']}
+        self._frames = 0
+        self._rows = 0
+        self._embed_dim = None
+
+    def add(self, detections, embeds):
+        """
+        Record a detection frame.
+
+        Returns the detections and embeddings as they will read back
+        (float32 scores, float16 embeddings), so the live tracker sees
+        exactly what a replay will.
+        """
+        count = len(detections)
+        self._files['frames'].write(np.array([self._rows, count], dtype=np.int64).tobytes())
+        self._frames += 1
+        if not count:
+            return detections, embeds
+
+        boxes = np.array([box for box, _, _ in detections], dtype=np.int32)
+        conf = np.array([score for _, score, _ in detections], dtype=np.float32)
+        vectors = np.asarray(embeds, dtype=np.float16)
+        if self._embed_dim is None:
+            self._embed_dim = vectors.shape[1]
+
+        self._files['boxes'].write(boxes.tobytes())
+        self._files['conf'].write(conf.tobytes())
+        self._files['embeds'].write(vectors.tobytes())
+        self._rows += count
+
+        detections = [(box, score, label) for box, score, (_, _, label)
+                      in zip(boxes.tolist(), conf.tolist(), detections)]
+        return detections, list(vectors.astype(np.float32))
+
+    def mark(self, kind):
+        """Record a frame the tracker only predicted (PREDICT) or re-fed (CARRY)"""
+        self._files['frames'].write(np.array([0, kind], dtype=np.int64).tobytes())
+        self._frames += 1
+
+    def close(self, complete):
+        for f in self._files.values():
+            f.close()
+        if not complete:
+            shutil.rmtree(self._partial, ignore_errors=True)
+            return False
+
+        self.meta.update(frames=self._frames, rows=self._rows, embed_dim=self._embed_dim or 0)
+        with open(os.path.join(self._partial, "meta.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._partial, self.path)
+        return True
+
+
+class DetectionCache:
+    """
+    Read-only, memory-mapped view of a complete recorder directory.
+
+    `frame(index)` gives (PREDICT | CARRY, None, None) or
+    (count, detections, embeddings) for each recorded frame, in the form
+    CameraCounter expects.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.frames = self.meta['frames']
+        self.fps = self.meta['fps']
+        self.size = tuple(self.meta['size'])
+        self.stride = self.meta['stride']
+
+        rows = self.meta['rows']
+        self._frames = self._column('frames', self.frames)
+        self._boxes = self._column('boxes', rows)
+        self._conf = self._column('conf', rows)
+        self._embeds = self._map('embeds', np.float16, (rows, self.meta['embed_dim']))
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(os.path.join(path, "meta.json"))
+
+    def _column(self, name, rows):
+        dtype, width = _COLUMNS[name]
+        return self._map(name, dtype, (rows, width) if width else (rows,))
+
+    def _map(self, name, dtype, shape):
+        if not shape[0]:
+            # Empty files can't be memory-mapped
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, f"{name}.bin"), dtype=dtype, mode="r",
+                         shape=shape)
+
+    def frame(self, index):
+        start, count = self._frames[index]
+        if count < 0:
+            return int(count), None, None
+
+        end = start + count
+        detections = [(box, score, "person") for box, score in
+                      zip(self._boxes[start:end].tolist(), self._conf[start:end].tolist())]
+        return int(count), detections, list(self._embeds[start:end].astype(np.float32))
@@ -0,0 +1,526 @@
+"""
+Person Detector
+Interchangeable YOLO backends and batch inference across frames and camera streams
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+BACKENDS = ('ultralytics', 'onnx')
+DEFAULT_MODELS = {'ultralytics': "yolov8n.pt", 'onnx': "yolov8n.onnx"}
+
+
+def xyxy_to_detections(xyxy, conf):
+    """Convert (N, 4) corner boxes and (N,) scores into DeepSort (ltwh, conf, "person") tuples"""
+    ltwh = np.asarray(xyxy).astype(np.int64)
+    ltwh[:, 2:] -= ltwh[:, :2]
+    return [(box, score, "person")
+            for box, score in zip(ltwh.tolist(), np.asarray(conf, dtype=np.float64).tolist())]
+
+
+def boxes_to_detections(results):
+    """Convert one YOLO result into DeepSort (ltwh, conf, "person") tuples"""
+    boxes = results.boxes
+    return xyxy_to_detections(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy())
+
+
+def letterbox(frame, size):
+    """Resize keeping aspect ratio and pad to size x size, like YOLO's LetterBox"""
+    h, w = frame.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = round(w * ratio), round(h * ratio)
+    left, top = (size - new_w) // 2, (size - new_h) // 2
+
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = cv2.resize(
+        frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR
+    )
+    return canvas, ratio, left, top
+
+
+def backend_settings(name, model=None, conf=0.5, classes=(0,), int8=False):
+    """Everything a backend's detections depend on, e.g. to key cached detections"""
+    if model is None:
+        model = DEFAULT_MODELS.get(name)
+    elif not isinstance(model, str):
+        model = type(model).__name__
+    return {'backend': name, 'model': model, 'conf': float(conf),
+            'classes': [int(c) for c in classes], 'int8': bool(int8)}
+
+
+# ==================== BACKENDS ====================
+class UltralyticsBackend:
+    """YOLOv8 through the ultralytics package and PyTorch"""
+
+    name = 'ultralytics'
+
+    def __init__(self, model="yolov8n.pt", conf=0.5, classes=(0,), device=None):
+        from ultralytics import YOLO
+
+        self.model = YOLO(model) if isinstance(model, str) else model
+        self.conf = conf
+        self.classes = list(classes)
+        self.device = device
+        self.settings = backend_settings(self.name, model, conf, classes)
+
+    def predict(self, frames):
+        kwargs = {'conf': self.conf, 'classes': self.classes, 'verbose': False}
+        if self.device is not None:
+            kwargs['device'] = self.device
+
+        results = self.model.predict(list(frames), **kwargs)
+        return [boxes_to_detections(r) for r in results]
+
+
+class OnnxBackend:
+    """
+    YOLOv8 exported to ONNX, run with ONNX Runtime on the CPU.
+
+    With `int8=True` the dynamically quantized `<model>.int8.onnx` next to
+    the model is loaded instead (see `export_onnx`). Frames are letterboxed
+    and batched into one session run when the model has a dynamic batch
+    axis, otherwise run one at a time. Boxes go through the same confidence
+    filter and NMS as ultralytics' defaults, so both backends return the
+    same detection tuples.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model="yolov8n.onnx", conf=0.5, classes=(0,), iou=0.7,
+                 int8=False, threads=None):
+        import onnxruntime as ort
+
+        self.settings = backend_settings(self.name, model, conf, classes, int8)
+        if int8:
+            model = int8_path(model)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(
+            model, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, _ = model_input.shape
+        self.imgsz = height if isinstance(height, int) else 640
+        self.dynamic_batch = not isinstance(batch, int)
+
+        self.conf = conf
+        self.iou = iou
+        # Class scores start after the 4 box columns
+        self.class_columns = [4 + c for c in classes]
+
+    def predict(self, frames):
+        frames = list(frames)
+        prepared = [letterbox(frame, self.imgsz) for frame in frames]
+
+        blob = np.stack([image for image, _, _, _ in prepared])
+        blob = blob[..., ::-1].transpose(0, 3, 1, 2)
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: blob})[0]
+        else:
+            outputs = np.concatenate([
+                self.session.run(None, {self.input_name: blob[i:i + 1]})[0]
+                for i in range(len(frames))
+            ])
+
+        return [self._postprocess(output, frame.shape, meta[1:])
+                for output, frame, meta in zip(outputs, frames, prepared)]
+
+    def _postprocess(self, output, shape, letterbox_meta):
+        ratio, left, top = letterbox_meta
+        predictions = output.T  # (anchors, 4 + classes)
+        scores = predictions[:, self.class_columns].max(axis=1)
+        keep = scores >= self.conf
+        if not keep.any():
+            return []
+
+        cx, cy, w, h = predictions[keep, :4].T
+        scores = scores[keep]
+        x1 = (cx - w / 2 - left) / ratio
+        y1 = (cy - h / 2 - top) / ratio
+        x2 = (cx + w / 2 - left) / ratio
+        y2 = (cy + h / 2 - top) / ratio
+
+        height, width = shape[:2]
+        x1, x2 = np.clip(x1, 0, width), np.clip(x2, 0, width)
+        y1, y2 = np.clip(y1, 0, height), np.clip(y2, 0, height)
+
+        ltwh = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)
+        indices = cv2.dnn.NMSBoxes(ltwh.tolist(), scores.tolist(), self.conf, self.iou)
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+
+        xyxy = np.stack([x1, y1, x2, y2], axis=1)[indices]
+        return xyxy_to_detections(xyxy, scores[indices])
+
+
+def int8_path(model_path):
+    """Path of the INT8-quantized variant of an ONNX model"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext or '.onnx'}"
+
+
+def export_onnx(weights="yolov8n.pt", int8=False, imgsz=640):
+    """Export YOLO weights to ONNX with a dynamic batch axis, optionally quantized"""
+    from ultralytics import YOLO
+
+    onnx_path = YOLO(weights).export(format="onnx", dynamic=True, imgsz=imgsz)
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(onnx_path, int8_path(onnx_path), weight_type=QuantType.QUInt8)
+    return onnx_path
+
+
+def merge_boxes(xyxy, scores, iou=0.5, containment=0.8):
+    """
+    Indices of boxes kept by greedy NMS over boxes from several tiles.
+
+    Besides the usual IoU test, a box mostly inside a higher-scoring one
+    (intersection over the smaller area above `containment`) is dropped,
+    which removes the partial boxes of people cut by a tile edge.
+    """
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.minimum(xyxy[best, 2], xyxy[rest, 2]) - np.maximum(xyxy[best, 0], xyxy[rest, 0])
+        height = np.minimum(xyxy[best, 3], xyxy[rest, 3]) - np.maximum(xyxy[best, 1], xyxy[rest, 1])
+        inter = np.clip(width, 0, None) * np.clip(height, 0, None)
+        union = areas[best] + areas[rest] - inter
+        smaller = np.minimum(areas[best], areas[rest])
+        drop = (inter > iou * union) | (inter > containment * smaller)
+        order = rest[~drop]
+    return np.array(keep, dtype=np.intp)
+
+
+def tiled_settings(settings, tile=640, overlap=0.2, max_tiles=8, min_height=32):
+    """Backend settings extended with the tiling parameters TiledBackend uses"""
+    return {**settings, 'tiling': {'tile': tile, 'overlap': overlap,
+                                   'max_tiles': max_tiles, 'min_height': min_height}}
+
+
+class TiledBackend:
+    """
+    Run a backend on the whole frame plus overlapping tiles where people are small.
+
+    Each frame goes through `backend` once downscaled as usual and once as
+    up to `max_tiles` tiles of about `tile` pixels overlapping by
+    `overlap`, all in one `predict` call; boxes are shifted back and merged
+    with merge_boxes. Tiles only cover the rows from the top of the frame
+    down to where people are expected to be under `min_height` pixels at
+    the model's `imgsz` input. That limit is learned from the full-frame
+    detections by fitting box height against foot position (the usual
+    perspective of a camera looking down a plaza, far away at the top);
+    until `warmup` boxes have been seen the top `far_fraction` is tiled.
+    If more than `max_tiles` would be needed the tiles grow instead, which
+    bounds the cost at max_tiles + 1 model inputs per frame.
+    """
+
+    name = 'tiled'
+
+    def __init__(self, backend, tile=640, overlap=0.2, max_tiles=8, min_height=32,
+                 imgsz=640, iou=0.5, far_fraction=0.5, warmup=50, decay=0.999):
+        self.backend = backend
+        self.tile = tile
+        self.overlap = overlap
+        self.max_tiles = max(1, int(max_tiles))
+        self.min_height = min_height
+        self.imgsz = imgsz
+        self.iou = iou
+        self.far_fraction = far_fraction
+        self.warmup = warmup
+        self.decay = decay
+        self.settings = tiled_settings(
+            getattr(backend, 'settings', None) or {'backend': type(backend).__name__},
+            tile, overlap, max_tiles, min_height
+        )
+        self.tiles_run = 0
+
+        # Decayed sums for a least-squares fit of box height against box bottom
+        self._n = self._sy = self._sh = self._syy = self._syh = 0.0
+
+    def small_limit(self, shape):
+        """Row above which people are expected to be too small for the full-frame pass"""
+        H, W = shape[:2]
+        if self._n < self.warmup:
+            return int(H * self.far_fraction)
+
+        mean_y, mean_h = self._sy / self._n, self._sh / self._n
+        var_y = self._syy / self._n - mean_y ** 2
+        slope = (self._syh / self._n - mean_y * mean_h) / var_y if var_y > 1e-6 else 0.0
+        # Smallest box height, in frame pixels, the full-frame pass still finds
+        threshold = self.min_height * max(H, W) / self.imgsz
+        if slope <= 1e-6:
+            return H if mean_h < threshold else 0
+        limit = (threshold - (mean_h - slope * mean_y)) / slope
+        return int(np.clip(limit, 0, H))
+
+    def tiles(self, shape):
+        """(x0, y0, x1, y1) tiles covering the small-people rows of a frame"""
+        H, W = shape[:2]
+        limit = self.small_limit(shape)
+        if limit <= 0:
+            return []
+
+        size = self.tile
+        while True:
+            step = size * (1 - self.overlap)
+            columns = 1 if W <= size else int(np.ceil((W - size) / step)) + 1
+            rows = 1 if limit <= size else int(np.ceil((limit - size) / step)) + 1
+            if columns * rows <= self.max_tiles:
+                break
+            size = int(size * 1.25)
+        if size >= max(W, H):
+            # A tile as big as the frame is just the full-frame pass again
+            return []
+
+        size_x, size_y = min(size, W), min(size, H)
+        xs = np.linspace(0, W - size_x, columns).astype(int)
+        ys = np.linspace(0, max(0, min(limit, H) - size_y), rows).astype(int)
+        return [(x, y, x + size_x, y + size_y) for y in ys for x in xs]
+
+    def _observe(self, detections):
+        for (_, top, _, height), _, _ in detections:
+            self._n = self._n * self.decay + 1
+            bottom = top + height
+            self._sy = self._sy * self.decay + bottom
+            self._sh = self._sh * self.decay + height
+            self._syy = self._syy * self.decay + bottom * bottom
+            self._syh = self._syh * self.decay + bottom * height
+
+    def predict(self, frames):
+        frames = list(frames)
+        images, layouts = [], []
+        for frame in frames:
+            tiles = self.tiles(frame.shape)
+            layouts.append(tiles)
+            images.append(frame)
+            images.extend(frame[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles)
+        self.tiles_run += len(images) - len(frames)
+
+        results = iter(self.backend.predict(images))
+        merged = []
+        for tiles in layouts:
+            full = next(results)
+            self._observe(full)
+            if not tiles:
+                merged.append(full)
+                continue
+
+            boxes, scores = [], []
+            for (x0, y0, _, _), detections in zip([(0, 0, 0, 0)] + tiles,
+                                                  [full] + [next(results) for _ in tiles]):
+                for (left, top, width, height), score, _ in detections:
+                    boxes.append((left + x0, top + y0, left + x0 + width, top + y0 + height))
+                    scores.append(score)
+            if not boxes:
+                merged.append([])
+                continue
+
+            xyxy = np.array(boxes, dtype=np.float64)
+            scores = np.array(scores, dtype=np.float64)
+            keep = merge_boxes(xyxy, scores, self.iou)
+            merged.append(xyxy_to_detections(xyxy[keep], scores[keep]))
+        return merged
+
+
+def create_backend(name="ultralytics", model=None, conf=0.5, classes=(0,),
+                   device=None, int8=False):
+    """Build a detector backend by name"""
+    if name == 'ultralytics':
+        return UltralyticsBackend(model or DEFAULT_MODELS[name], conf, classes, device)
+    if name == 'onnx':
+        return OnnxBackend(model or DEFAULT_MODELS[name], conf, classes, int8=int8)
+    raise ValueError(f"Unknown detector backend '{name}', expected one of {BACKENDS}")
+
+
+class RegionOfInterest:
+    """
+    Part of the frame that is sent to the detector.
+
+    Either the counting lines' bounding box grown by `margin` pixels, or a
+    polygon whose outside is blanked. The crop is taken from the
+    bounding rectangle, YOLO letterboxes it to its input size, and the
+    resulting boxes are shifted back to full-frame coordinates.
+    The margin should be at least the band offset plus about twice a
+    person's height, so tracks are confirmed on fully visible people before
+    they reach the band; boxes cut by the crop edge make tracks unstable.
+    """
+
+    def __init__(self, frame_size, lines=None, margin=None, polygon=None):
+        W, H = frame_size
+        self.mask = None
+
+        if polygon is not None:
+            points = np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+            x, y, w, h = cv2.boundingRect(points)
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(W, x + w), min(H, y + h)
+
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(mask, [points - (x0, y0)], 255)
+            if cv2.countNonZero(mask) < mask.size:
+                self.mask = mask
+        elif lines is not None and margin is not None:
+            points = np.asarray(lines, dtype=np.float64).reshape(-1, 2)
+            x0 = max(0, int(points[:, 0].min()) - margin)
+            y0 = max(0, int(points[:, 1].min()) - margin)
+            x1 = min(W, int(np.ceil(points[:, 0].max())) + margin)
+            y1 = min(H, int(np.ceil(points[:, 1].max())) + margin)
+        else:
+            raise ValueError("RegionOfInterest needs a polygon or lines and a margin")
+
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError("RegionOfInterest lies outside the frame")
+
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.pixel_ratio = (x1 - x0) * (y1 - y0) / float(W * H)
+
+    def crop(self, frame):
+        """Cut the region out of a frame, blanking pixels outside a polygon"""
+        crop = frame[self.y0:self.y1, self.x0:self.x1]
+        if self.mask is not None:
+            crop = cv2.bitwise_and(crop, crop, mask=self.mask)
+        return crop
+
+    def to_frame(self, detections):
+        """Shift detections on the crop back to full-frame coordinates"""
+        return [([l + self.x0, t + self.y0, w, h], conf, label)
+                for (l, t, w, h), conf, label in detections]
+
+
+class BatchDetector:
+    """
+    Collect frames from one or more streams and run them through a backend together.
+
+    Callers submit frames and get a Future back. A worker thread gathers up
+    to `batch_size` pending frames, waiting at most `max_wait` seconds after
+    the first one arrives, runs a single backend `predict` call on the batch
+    and resolves each Future with that frame's detections. Futures of one
+    stream resolve in the order that stream submitted them.
+
+    `model` is a model path for the `backend` named, or a backend instance.
+    Backend calls are serialized, since neither ultralytics models nor ONNX
+    Runtime sessions may run `predict` from several threads at once.
+    """
+
+    def __init__(self, model=None, batch_size=1, max_wait=0.02,
+                 conf=0.5, classes=(0,), device=None, backend="ultralytics",
+                 int8=False):
+        if model is None or isinstance(model, str):
+            model = create_backend(backend, model, conf, classes, device, int8)
+        self.backend = model
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max_wait
+
+        self.batches = 0
+        self.frames = 0
+
+        self._requests = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._predict_lock = threading.Lock()
+        self._closed = False
+
+    # ==================== DIRECT ====================
+    def detect_batch(self, frames):
+        """Run detection on a list of frames in one backend call"""
+        with self._predict_lock:
+            detections = self.backend.predict(frames)
+
+            self.batches += 1
+            self.frames += len(frames)
+        return detections
+
+    def detect(self, frame):
+        """Detect people in a single frame, batching with other callers"""
+        return self.submit(frame).result()
+
+    # ==================== QUEUED ====================
+    def submit(self, frame):
+        """Queue a frame for the next batch and return a Future of its detections"""
+        future = Future()
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("BatchDetector is closed")
+            if self._worker is None and self.batch_size > 1:
+                self._worker = threading.Thread(
+                    target=self._run, name="batch-detector", daemon=True
+                )
+                self._worker.start()
+
+        if self.batch_size == 1:
+            # Nothing to batch with, skip the worker hand-off (detect_batch locks)
+            try:
+                future.set_result(self.detect_batch([frame])[0])
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._requests.put((frame, future))
+        return future
+
+    def close(self):
+        """Stop the worker thread after pending batches are done"""
+        with self._lock:
+            self._closed = True
+            worker = self._worker
+        if worker is not None:
+            self._requests.put(None)
+            worker.join()
+
+    def _collect(self):
+        """Block for the first request, then gather a batch until full or timed out"""
+        first = self._requests.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-post the shutdown marker so it ends the loop after this batch
+                self._requests.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+
+            frames = [frame for frame, _ in batch]
+            try:
+                detections = self.detect_batch(frames)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), dets in zip(batch, detections):
+                future.set_result(dets)
@@ -0,0 +1,201 @@
+"""
+Appearance Embeddings
+Decide which detections DeepSort needs a fresh appearance embedding for, and batch the crops
+"""
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from detector import BatchDetector
+
+EMBED_MODES = ('always', 'every', 'ambiguous', 'iou')
+
+# Length of the one-hot identity vectors used instead of embeddings in 'iou' mode
+IDENTITY_DIM = 128
+
+
+def predicted_boxes(tracks):
+    """(N, 4) ltrb boxes of DeepSort tracks one Kalman step ahead"""
+    if not tracks:
+        return np.zeros((0, 4))
+    # Kalman state: centre x, centre y, aspect ratio, height, then velocities
+    state = np.array([t.mean[:4] + t.mean[4:8] for t in tracks])
+    width = state[:, 2] * state[:, 3]
+    left = state[:, 0] - width / 2
+    top = state[:, 1] - state[:, 3] / 2
+    return np.stack([left, top, left + width, top + state[:, 3]], axis=1)
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) ltrb boxes"""
+    width = (np.minimum(a[:, None, 2], b[None, :, 2])
+             - np.maximum(a[:, None, 0], b[None, :, 0])).clip(0)
+    height = (np.minimum(a[:, None, 3], b[None, :, 3])
+              - np.maximum(a[:, None, 1], b[None, :, 1])).clip(0)
+    inter = width * height
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class BatchEmbedder(BatchDetector):
+    """
+    Appearance embedder shared by several streams, batching their crops.
+
+    Uses BatchDetector's queueing: callers submit (frame, detections) and
+    get a Future of the detections' embeddings. Up to `batch_size`
+    submissions, waiting at most `max_wait` seconds, are cropped and run
+    through one `embedder.predict` call. `embedder` defaults to DeepSort's
+    MobileNetV2 embedder.
+    """
+
+    def __init__(self, embedder=None, batch_size=1, max_wait=0.01):
+        if embedder is None:
+            from deep_sort_realtime.embedder.embedder_pytorch import MobileNetv2_Embedder
+            embedder = MobileNetv2_Embedder(half=True, max_batch_size=16, bgr=True, gpu=True)
+        super().__init__(embedder, batch_size=batch_size, max_wait=max_wait)
+        self.crops = 0
+
+    def detect_batch(self, items):
+        """Embed the detections of several (frame, detections) pairs in one call"""
+        crops, sizes = [], []
+        for frame, detections in items:
+            h, w = frame.shape[:2]
+            for (l, t, bw, bh), _, _ in detections:
+                l, t = int(l), int(t)
+                crops.append(frame[max(0, t):min(h, t + int(bh)),
+                                   max(0, l):min(w, l + int(bw))])
+            sizes.append(len(detections))
+
+        with self._predict_lock:
+            embeds = self.backend.predict(crops) if crops else []
+            self.batches += 1
+            self.frames += len(items)
+            self.crops += len(crops)
+
+        results, start = [], 0
+        for size in sizes:
+            results.append(list(embeds[start:start + size]))
+            start += size
+        return results
+
+    def embed(self, frame, detections):
+        """Embeddings of one frame's detections, batched with other callers"""
+        return self.submit((frame, detections)).result()
+
+
+class AppearanceEmbeddings:
+    """
+    Per-stream choice of which detections get a fresh appearance embedding.
+
+    'always' embeds every detection, as DeepSort does by default. The other
+    modes first match detections to the tracks' predicted boxes by IoU and
+    let a matched detection re-use its track's last embedding, which makes
+    DeepSort's appearance cascade agree with that match:
+
+    - 'every' embeds everything on every `every`-th update and in between
+      only detections no track overlaps by `min_iou`.
+    - 'ambiguous' embeds a detection unless it overlaps one track by
+      `min_iou` and neither overlaps anything else by more than `margin`,
+      so embeddings are only spent where people are close together.
+    - 'iou' never embeds: unmatched detections get a new one-hot identity
+      vector, so tracking is IoU-only. Fine for sparse scenes.
+
+    Crops are embedded by `embedder`, a BatchEmbedder that can be shared
+    across streams (one is created on first use when not given).
+    """
+
+    def __init__(self, mode='always', every=5, embedder=None, min_iou=0.3, margin=0.1):
+        if mode not in EMBED_MODES:
+            raise ValueError(f"Unknown embedding mode '{mode}', expected one of {EMBED_MODES}")
+        self.mode = mode
+        self.every = max(1, int(every))
+        self.embedder = embedder
+        self.min_iou = min_iou
+        self.margin = margin
+
+        self.updates = 0
+        self.computed = 0
+        self.reused = 0
+        self._identities = 0
+
+    @property
+    def settings(self):
+        """What the embeddings depend on, e.g. for a detection cache key"""
+        if self.mode == 'always':
+            return {'mode': 'always'}
+        settings = {'mode': self.mode, 'min_iou': self.min_iou}
+        if self.mode == 'every':
+            settings['every'] = self.every
+        elif self.mode == 'ambiguous':
+            settings['margin'] = self.margin
+        return settings
+
+    @property
+    def computed_ratio(self):
+        """Fraction of detections that went through the embedder"""
+        total = self.computed + self.reused
+        return self.computed / total if total else 0.0
+
+    def embed(self, tracker, frame, detections):
+        """Embeddings for one frame's ltwh `detections`, given the DeepSort `tracker`"""
+        self.updates += 1
+        if not detections:
+            return []
+        refresh = self.mode == 'every' and (self.updates - 1) % self.every == 0
+        if self.mode == 'always' or refresh:
+            return self._compute(frame, detections)
+
+        tracks = [t for t in tracker.tracker.tracks if t.features]
+        matches = self._match(tracks, detections)
+        embeds = [None] * len(detections)
+        missing = []
+        for i, j in enumerate(matches):
+            if j < 0:
+                missing.append(i)
+            else:
+                embeds[i] = tracks[j].features[-1]
+        self.reused += len(detections) - len(missing)
+
+        if missing:
+            if self.mode == 'iou':
+                fresh = [self._identity() for _ in missing]
+            else:
+                fresh = self._compute(frame, [detections[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                embeds[i] = vector
+        return embeds
+
+    def _compute(self, frame, detections):
+        if self.embedder is None:
+            self.embedder = BatchEmbedder()
+        self.computed += len(detections)
+        return self.embedder.embed(frame, detections)
+
+    def _identity(self):
+        vector = np.zeros(IDENTITY_DIM, dtype=np.float32)
+        vector[self._identities % IDENTITY_DIM] = 1.0
+        self._identities += 1
+        return vector
+
+    def _match(self, tracks, detections):
+        """Track index each detection may borrow an embedding from, or -1"""
+        matches = np.full(len(detections), -1)
+        if not tracks:
+            return matches
+
+        boxes = np.array([box for box, _, _ in detections], dtype=np.float64)
+        boxes[:, 2:] += boxes[:, :2]
+        iou = iou_matrix(boxes, predicted_boxes(tracks))
+        rows, cols = linear_sum_assignment(-iou)
+        for i, j in zip(rows, cols):
+            if iou[i, j] < self.min_iou:
+                continue
+            if self.mode == 'ambiguous':
+                # Anything else overlapping either side makes the match uncertain
+                if (np.delete(iou[i], j) > self.margin).any():
+                    continue
+                if (np.delete(iou[:, j], i) > self.margin).any():
+                    continue
+            matches[i] = j
+        return matches
@@ -0,0 +1,239 @@
+"""
+Shared Frame Ring
+Pass decoded frames between processes through shared memory instead of pickling them
+"""
+
+import queue
+import time
+from collections import deque, namedtuple
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from sources import StreamSource
+
+# What travels through queues instead of the frame itself
+FrameHandle = namedtuple('FrameHandle', ['slot', 'index'])
+
+_END = 'end'
+
+# Seconds a reader has to open the ring, and the writer waits for it to attach
+ATTACH_TIMEOUT = 30.0
+
+# Seconds between checks that the writer is still alive while waiting for frames
+POLL_INTERVAL = 0.5
+
+
+class SharedFrameRing:
+    """
+    Fixed number of same-shaped frame slots in one shared memory block.
+
+    The creating process owns the block and unlinks it on `close`; other
+    processes `attach` by name. Slot ownership is tracked with a queue of
+    free slot numbers shared by both sides (a multiprocessing Queue made by
+    their common parent, since queues can only be inherited). A writer
+    takes a free slot, fills it in place and passes a FrameHandle on; the
+    reader works on a zero-copy view of the slot and puts the slot number
+    back when it is done with the frame. Running out of free slots blocks
+    the writer, which gives back-pressure.
+    """
+
+    def __init__(self, shm, shape, slots, free_slots, owner):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.free_slots = free_slots
+        self._owner = owner
+        self._frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape, slots, free_slots):
+        """Allocate a ring and mark every slot free"""
+        size = int(np.prod(shape)) * slots
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        for slot in range(slots):
+            free_slots.put(slot)
+        return cls(shm, shape, slots, free_slots, owner=True)
+
+    @classmethod
+    def attach(cls, name, shape, slots, free_slots):
+        """Open a ring created by a sibling process (they share one resource tracker)"""
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, shape, slots, free_slots, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def describe(self):
+        """Name, shape and slot count another process needs to `attach`"""
+        return self.name, self.shape, self.slots
+
+    def view(self, slot):
+        """The slot's frame array, backed by shared memory"""
+        return self._frames[slot]
+
+    def acquire(self, timeout=None):
+        """Take a free slot number, blocking until the reader releases one"""
+        return self.free_slots.get(timeout=timeout)
+
+    def release(self, slot):
+        self.free_slots.put(slot)
+
+    def close(self):
+        self._frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds a frame view; the mapping goes when it does
+            pass
+        if self._owner:
+            self.shm.unlink()
+
+
+def capture_process(source, handles, free_slots, slots, stop=None, latest_only=False,
+                    attached=None):
+    """
+    Decode `source` straight into ring slots and send FrameHandles to `handles`.
+
+    Meant as a multiprocessing target. The first message is
+    ('ready', ring description, fps), or ('error', message) if the source
+    can't be opened; FrameHandles follow and _END marks the end. Setting
+    the `stop` event ends decoding early. With an `attached` event, the
+    block is only unlinked once the reader has set it (or ATTACH_TIMEOUT
+    passed), so a short source can't end before the reader opens the ring.
+    The source is read through a
+    StreamSource, so live streams reconnect (and with `latest_only` drop
+    stale frames) here.
+    """
+    cap = StreamSource(source, latest_only=latest_only)
+    if not cap.isOpened():
+        handles.put(('error', f"Cannot open source {source}"))
+        return
+
+    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+
+    ring = SharedFrameRing.create((H, W, 3), slots, free_slots)
+    handles.put(('ready', ring.describe(), fps))
+
+    index = 0
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                slot = ring.acquire(timeout=0.1)
+            except queue.Empty:
+                continue
+            ret, _ = cap.read(ring.view(slot))
+            if not ret:
+                ring.release(slot)
+                break
+            handles.put(FrameHandle(slot, index))
+            index += 1
+    finally:
+        handles.put(_END)
+        cap.release()
+        # Once attached the reader keeps its own mapping, so unlinking is safe
+        if attached is not None:
+            attached.wait(ATTACH_TIMEOUT)
+        ring.close()
+
+
+class RingCapture:
+    """
+    cv2.VideoCapture look-alike that reads frames from a capture_process.
+
+    `read` returns a zero-copy view of the next slot. Slots are handed out
+    in order and must be given back in the same order with `recycle` once
+    the frame is no longer used (people_counter does this after a frame
+    has been drawn and written). The `attached` event given to the
+    capture_process is set once the ring is open.
+
+    The process that started the capture_process sets `exited` once it is
+    no longer alive; waiting for the ring or for a frame then stops
+    instead of blocking forever on a writer killed before sending _END.
+    """
+
+    def __init__(self, handles, free_slots, stop=None, timeout=ATTACH_TIMEOUT, attached=None,
+                 exited=None):
+        self.handles = handles
+        self.exited = exited
+        message = self._next(timeout)
+        if message is None:
+            raise IOError(f"Frame producer did not open its source within {timeout:.0f}s")
+        if message == _END:
+            raise IOError("Frame producer exited before opening its source")
+        if message[0] == 'error':
+            raise IOError(message[1])
+
+        _, description, self.fps = message
+        self.ring = SharedFrameRing.attach(*description, free_slots)
+        if attached is not None:
+            attached.set()
+        self.stop = stop
+        self._outstanding = deque()
+        self._ended = False
+
+    def isOpened(self):
+        return not self._ended
+
+    def get(self, prop):
+        height, width = self.ring.shape[:2]
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return height
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0
+
+    def read(self):
+        if self._ended:
+            return False, None
+        handle = self._next()
+        if handle is None or handle == _END:
+            self._ended = True
+            return False, None
+        self._outstanding.append(handle.slot)
+        return True, self.ring.view(handle.slot)
+
+    def _next(self, timeout=None):
+        """Next message from the writer; _END once it exited, None after `timeout` seconds"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self.handles.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+            if self.exited is not None and self.exited.is_set():
+                # Whatever it sent before exiting has arrived by now
+                try:
+                    return self.handles.get_nowait()
+                except queue.Empty:
+                    return _END
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def recycle(self):
+        """Give the oldest outstanding frame's slot back to the writer"""
+        if self._outstanding:
+            self.ring.release(self._outstanding.popleft())
+
+    def release(self):
+        if self.stop is not None:
+            self.stop.set()
+        while self._outstanding:
+            self.recycle()
+        # Drain what the writer sent before it saw the stop event
+        while not self._ended:
+            try:
+                handle = self.handles.get(timeout=1.0)
+            except queue.Empty:
+                break
+            if handle == _END:
+                self._ended = True
+            else:
+                self.ring.release(handle.slot)
+        self.ring.close()
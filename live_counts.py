@@ -0,0 +1,363 @@
+"""
+Live Counts
+Shared-memory store of the latest per-camera and per-zone counts, for dashboards and the API
+"""
+
+import os
+import queue
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: slot claims are then not serialized across processes
+    fcntl = None
+
+STORE_NAME = "people_counter_live"
+SLOTS = 64
+MAX_ZONES = 16
+
+# Seconds without a publish after which an active slot counts as abandoned
+# (its writer died); writers heartbeat well within this
+CLAIM_STALE_AFTER = 120.0
+
+_MAGIC = b"PCLIVE01"
+_HEADER = 16
+
+ZONE_DTYPE = np.dtype([
+    ('id', 'S32'), ('entered', '<i8'), ('exited', '<i8'), ('inside', '<i8'),
+])
+SLOT_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('camera', 'S64'),
+    ('active', '<u8'),
+    ('updated', '<f8'),
+    ('frame', '<i8'),
+    ('entered', '<i8'),
+    ('exited', '<i8'),
+    ('inside', '<i8'),
+    ('zone_count', '<i8'),
+    ('zones', ZONE_DTYPE, (MAX_ZONES,)),
+])
+
+
+class LiveCounts:
+    """
+    Fixed table of camera slots in a named shared memory block.
+
+    Each counting process claims the slot of its camera id and publishes
+    into it; any number of processes (e.g. the admin API) read. Every slot
+    is a seqlock: the writer makes `seq` odd, writes, then makes it even
+    again, and readers copy the slot and retry if `seq` was odd or moved.
+    Writers never wait for readers and readers never take a lock, so a
+    burst of API requests can't slow down counting. Only claiming a slot,
+    once per camera run, takes a file lock.
+
+    `open` attaches to the block `name`, creating it (all zeros) if it
+    doesn't exist yet. The block outlives its processes so final counts
+    stay readable; `unlink` removes it.
+    """
+
+    def __init__(self, shm, slots):
+        self.shm = shm
+        self.slots = slots
+        self._table = np.ndarray((slots,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=_HEADER)
+        # Raw bytes of the same slots: structured copies are ~20x slower than memcpy
+        self._bytes = np.ndarray((slots, SLOT_DTYPE.itemsize), dtype=np.uint8,
+                                 buffer=shm.buf, offset=_HEADER)
+
+    @classmethod
+    def open(cls, name=STORE_NAME, slots=SLOTS, create=True):
+        """Attach to the store, creating it when `create`; None if it doesn't exist"""
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            if not create:
+                return None
+            try:
+                shm = shared_memory.SharedMemory(
+                    name=name, create=True, size=_HEADER + slots * SLOT_DTYPE.itemsize
+                )
+                shm.buf[:16] = _MAGIC + np.uint64(slots).tobytes()
+            except FileExistsError:
+                # Another process created it first
+                shm = shared_memory.SharedMemory(name=name)
+        # The block is meant to outlive this process
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+        if bytes(shm.buf[:8]) != _MAGIC:
+            # Created a moment ago and not initialized yet
+            time.sleep(0.01)
+            if bytes(shm.buf[:8]) != _MAGIC:
+                shm.close()
+                raise ValueError(f"Shared memory block '{name}' is not a live counts store")
+        slots = int(np.frombuffer(shm.buf[8:16], dtype=np.uint64)[0])
+        return cls(shm, slots)
+
+    def close(self):
+        self._table = self._bytes = None
+        self.shm.close()
+
+    def unlink(self):
+        # unlink() unregisters from the resource tracker, which `open` already did
+        resource_tracker.register(self.shm._name, 'shared_memory')
+        self.shm.unlink()
+
+    # ==================== WRITING ====================
+    def claim(self, camera_id, stale_after=CLAIM_STALE_AFTER):
+        """
+        Writer for `camera_id`'s slot: its old slot, a free one or the stalest inactive one.
+
+        Each slot has a single writer, so a camera another process is still
+        publishing (active and updated within `stale_after` seconds) raises
+        RuntimeError instead of sharing its slot.
+        """
+        key = str(camera_id).encode()[:64]
+        with _ClaimLock(self.shm.name):
+            table = self._table
+            cameras = list(table['camera'])
+            if key in cameras:
+                slot = cameras.index(key)
+                if table['active'][slot] and time.time() - table['updated'][slot] < stale_after:
+                    raise RuntimeError(
+                        f"Camera '{camera_id}' is already published by another process"
+                    )
+            elif b"" in cameras:
+                slot = cameras.index(b"")
+            else:
+                inactive = np.flatnonzero(table['active'] == 0)
+                if not len(inactive):
+                    raise RuntimeError(f"All {self.slots} live count slots are in use")
+                slot = int(inactive[np.argmin(table['updated'][inactive])])
+            writer = LiveWriter(self, slot)
+            writer._write(camera=key, active=1, updated=time.time())
+        return writer
+
+    # ==================== READING ====================
+    def snapshot(self, timeout=0.05):
+        """Consistent copy of every claimed slot, as JSON-ready dicts"""
+        table = self._bytes.copy().view(SLOT_DTYPE)[:, 0]
+        cameras = []
+        for slot in np.flatnonzero(table['camera'] != b""):
+            row = table[slot]
+            deadline = None
+            while int(self._table['seq'][slot]) != row['seq'] or row['seq'] & 1:
+                # Mid-write: copy this slot again, letting a preempted writer finish
+                if deadline is None:
+                    deadline = time.monotonic() + timeout
+                elif time.monotonic() > deadline:
+                    # Stuck odd: the writer died mid-write
+                    row = None
+                    break
+                time.sleep(0)
+                row = self._bytes[slot].copy().view(SLOT_DTYPE)[0]
+            if row is not None:
+                cameras.append(_row_dict(row))
+        return cameras
+
+    @staticmethod
+    def aggregate(cameras):
+        """Totals over `snapshot` cameras, plus the cameras themselves"""
+        entered = sum(c['entered'] for c in cameras)
+        exited = sum(c['exited'] for c in cameras)
+        return {
+            'entered': entered,
+            'exited': exited,
+            'inside': sum(c['inside'] for c in cameras),
+            'active_cameras': sum(c['active'] for c in cameras),
+            'cameras': cameras,
+        }
+
+
+class LiveWriter:
+    """One camera's slot in a LiveCounts store; only one process should write it"""
+
+    def __init__(self, store, slot):
+        self.store = store
+        self.slot = slot
+        # The slot is staged here, so the odd-seq window is a single memcpy
+        self._raw = store._bytes[slot].copy()
+        self._record = self._raw.view(SLOT_DTYPE)
+
+    def publish(self, counts, frame=0):
+        """Write a CameraCounter.counts() dict"""
+        zones = counts.get('zones', ())[:MAX_ZONES]
+        self._write(entered=counts['entered'], exited=counts['exited'],
+                    inside=counts['inside'], frame=frame, updated=time.time(), zones=zones)
+
+    def close(self):
+        """Mark the camera inactive, keeping its last counts readable"""
+        self._write(active=0, updated=time.time())
+
+    def _write(self, zones=None, **fields):
+        record = self._record
+        for field, value in fields.items():
+            record[field] = value
+        if zones is not None:
+            rows = record['zones'][0]
+            for i, zone in enumerate(zones):
+                rows[i] = (str(zone['id']).encode()[:32], zone['entered'], zone['exited'],
+                           zone['inside'])
+            record['zone_count'] = len(zones)
+
+        table = self.store._table
+        slot = self.slot
+        # Odd while writing; skips ahead if a writer died mid-write
+        seq = (int(table['seq'][slot]) + 1) | 1
+        table['seq'][slot] = seq
+        # Everything after the 8-byte seq
+        self.store._bytes[slot, 8:] = self._raw[8:]
+        table['seq'][slot] = seq + 1
+
+
+# ==================== PUSH ====================
+class LiveBroadcaster:
+    """
+    Push live count changes to any number of subscribers.
+
+    One thread compares the store's slot sequence numbers every
+    `interval` seconds, which costs next to nothing while nothing changes.
+    When a camera's counts (not just its heartbeat) changed, every
+    subscriber's queue gets one list of updates: the camera's new counts
+    plus a 'delta' since the last push. The cost of a change is one
+    snapshot plus a queue put per subscriber, and no viewer polls. A
+    subscriber more than `backlog` pushes behind is flagged to `resync`
+    from a fresh snapshot instead of growing its queue.
+
+    `opener()` returns the LiveCounts store, or None while there is none.
+    The thread runs while there are subscribers.
+    """
+
+    def __init__(self, opener, interval=0.05, backlog=256):
+        self.opener = opener
+        self.interval = interval
+        self.backlog = backlog
+        self.pushes = 0
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._seqs = None
+        # Counts last pushed per camera
+        self._pushed = {}
+
+    def subscribe(self):
+        subscriber = LiveSubscriber(self.backlog)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-broadcaster",
+                                                daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            store = self.opener()
+            if store is not None:
+                seqs = store._table['seq'].copy()
+                if self._seqs is None or not np.array_equal(seqs, self._seqs):
+                    self._seqs = seqs
+                    self._push(store.snapshot())
+            time.sleep(self.interval)
+
+    def _push(self, cameras):
+        updates = []
+        for camera in cameras:
+            previous = self._pushed.get(camera['camera'])
+            if previous is not None and _same_counts(previous, camera):
+                continue
+            self._pushed[camera['camera']] = camera
+            delta = {key: camera[key] - (previous[key] if previous else 0)
+                     for key in ('entered', 'exited', 'inside')}
+            updates.append({**camera, 'delta': delta})
+        if not updates:
+            return
+
+        self.pushes += 1
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(updates)
+
+
+class LiveSubscriber:
+    """One viewer's queue of LiveBroadcaster pushes"""
+
+    def __init__(self, backlog):
+        self.resync = False
+        self._queue = queue.Queue(maxsize=backlog)
+
+    def put(self, updates):
+        try:
+            self._queue.put_nowait(updates)
+        except queue.Full:
+            self.resync = True
+
+    def get(self, timeout=None):
+        """Next list of updates, or None after `timeout` seconds without one"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def clear(self):
+        """Drop queued pushes before resyncing from a snapshot"""
+        self.resync = False
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class _ClaimLock:
+    """Inter-process lock around slot claims (a flock on a temp file)"""
+
+    def __init__(self, name):
+        self.path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o666)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def _same_counts(a, b):
+    return all(a[key] == b[key] for key in ('entered', 'exited', 'inside', 'active', 'zones'))
+
+
+def _row_dict(row):
+    zones = row['zones'][:int(row['zone_count'])]
+    return {
+        'camera': row['camera'].decode(),
+        'active': bool(row['active']),
+        'updated': float(row['updated']),
+        'frame': int(row['frame']),
+        'entered': int(row['entered']),
+        'exited': int(row['exited']),
+        'inside': int(row['inside']),
+        'zones': [{'id': z['id'].decode(), 'entered': int(z['entered']),
+                   'exited': int(z['exited']), 'inside': int(z['inside'])} for z in zones],
+    }
@@ -1,13 +1,630 @@
+import argparse
+import json
+import math
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, fields, replace
+
 import cv2
-from ultralytics import YOLO
+import numpy as np
 from deep_sort_realtime.deepsort_tracker import DeepSort
 
-def people_counter(input_path, output_path):
+from annotation import ANNOTATE_MODES, AnnotatedWriter, draw_frame
+from count_store import CountStore
+from counting import LineCrossingCounter, ZoneOccupancy
+from detection_cache import CARRY, PREDICT, DetectionCache, DetectionRecorder, cache_key
+from detector import (BACKENDS, BatchDetector, RegionOfInterest, TiledBackend,
+                      backend_settings, create_backend, tiled_settings)
+from embeddings import EMBED_MODES, AppearanceEmbeddings, BatchEmbedder
+from live_counts import LiveCounts
+from metrics import StageMetrics
+from motion import MotionGate
+from settings_cache import SettingsCache
+from sources import StreamSource
+
+# Bounded queues between stages: a slow stage blocks the one feeding it
+# instead of letting decoded frames pile up in memory.
+QUEUE_SIZE = 8
+
+SETTINGS_DB = "settings.db"
+
+# Frames between dropping state of tracks DeepSort has deleted
+SWEEP_EVERY = 30
+
+# Frames between live count heartbeats when nothing changed
+LIVE_EVERY = 30
+
+_END = object()
+
+# SettingsCache per DB path, shared by this process's cameras
+_settings_caches = {}
+
+
+@dataclass
+class CounterConfig:
+    """
+    Every people_counter tunable, grouped so runs can be configured,
+    stored and sent to worker processes as one picklable object.
+
+    None means "from the settings DB" where people_counter documents a
+    setting. `backend` is a backend name ('ultralytics' or 'onnx') or a
+    backend instance (anything with `predict(frames)`), which is then
+    used as is, e.g. a stub detector in tests.
+    """
+
+    # Detection
+    batch_size: int = 1
+    max_wait: float = 0.02
+    detection_fps: float = None
+    motion_threshold: float = None
+    roi_margin: int = None
+    roi_polygon: list = None
+    backend: object = None
+    model_path: str = None
+    conf: float = None
+    tiling: bool = None
+    detection_cache: str = None
+    # Tracking
+    embedding: str = None
+    embed_every: int = None
+    # Source
+    latest_only: bool = None
+    # Counting geometry
+    lines: object = None
+    zones: object = None
+    offset: int = 25
+    camera_id: str = None
+    # Output
+    display: bool = True
+    annotate: str = 'full'
+    annotate_every: int = 10
+    clip_seconds: float = 4.0
+    live: bool = None
+    history: bool = None
+    # Diagnostics
+    verbose: bool = True
+    metrics_interval: float = 60
+    profile_path: str = None
+
+    @classmethod
+    def resolve(cls, config=None, options=None):
+        """`config` (default: all defaults) with `options` overriding its fields"""
+        config = cls() if config is None else config
+        if not options:
+            return config
+        unknown = set(options) - {f.name for f in fields(cls)}
+        if unknown:
+            raise TypeError(f"Unknown people_counter option(s): {', '.join(sorted(unknown))}")
+        return replace(config, **options)
+
+
+def settings_cache(db_path=SETTINGS_DB):
+    """This process's SettingsCache of the settings DB at `db_path`"""
+    cache = _settings_caches.get(db_path)
+    if cache is None:
+        cache = _settings_caches.setdefault(db_path, SettingsCache(db_path))
+    return cache
+
+
+def load_setting(setting_key, default=None, db_path=SETTINGS_DB):
+    """Read a typed value from the admin settings DB, or default if unavailable"""
+    return settings_cache(db_path).get(setting_key, default)
+
+
+def load_geometry(camera_id, db_path=SETTINGS_DB):
+    """A camera's active counting lines and zones from the settings DB, as ({id: line}, {id: polygon})"""
+    lines, zones = {}, {}
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT zone_id, geometry_type, points FROM counting_geometry '
+                'WHERE camera_id = ? AND is_active = 1 ORDER BY id',
+                (camera_id,)
+            )
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return lines, zones
+
+    for zone_id, geometry_type, points in rows:
+        points = [tuple(point) for point in json.loads(points)]
+        if geometry_type == 'line':
+            lines[zone_id] = tuple(points)
+        elif geometry_type == 'zone':
+            zones[zone_id] = points
+    return lines, zones
+
+
+def _named(geometry):
+    """(ids, shapes) of a {id: shape} dict, or of a list numbered from 0"""
+    if isinstance(geometry, dict):
+        return list(geometry), list(geometry.values())
+    geometry = list(geometry or [])
+    return list(range(len(geometry))), geometry
+
+
+def _put(q, item, stop_event):
+    """Put item on a bounded queue, giving up once the pipeline is stopped."""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop_event):
+    """Get the next item from a queue, returning _END once stopped."""
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+# -------------------- STAGES --------------------
+def _decode_stage(cap, frames_q, stop_event, metrics=None):
+    """Read frames from the capture and hand them to the tracking stage."""
+    try:
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if metrics is not None:
+                metrics.record('decode', time.perf_counter() - start)
+            if not _put(frames_q, frame, stop_event):
+                break
+    finally:
+        _put(frames_q, _END, stop_event)
+
+
+class CameraCounter:
+    """DeepSort tracker plus line-crossing and zone counts for a single stream.
+
+    `lines` and `zones` are lists, or dicts keyed by the ids reported in
+    `crossings` and `counts()`. Zones need the `frame_size`.
+
+    With `stride` > 1 the detector only runs on every stride-th frame. The
+    tracker's clock then advances once per detection, and frames in between
+    use centroids extrapolated from each track's Kalman velocity, so
+    crossings are still checked on every frame.
+
+    With `metrics`, tracker updates are timed as 'track' and crossing
+    checks as 'count'. A `recorder` (DetectionRecorder) gets every
+    frame's tracker input, so the run can be replayed without detection.
+    `embeddings` (AppearanceEmbeddings, default: embed every detection)
+    decides which detections get a fresh appearance embedding.
+    """
+
+    def __init__(self, lines, offset, stride=1, metrics=None, recorder=None,
+                 zones=None, frame_size=None, embeddings=None):
+        self.stride = max(1, int(stride))
+        self.metrics = metrics
+        self.recorder = recorder
+        self.embeddings = embeddings or AppearanceEmbeddings()
+        # Keep tracks alive for the same wall-clock time as max_age=30 frames;
+        # embeddings come from self.embeddings, so DeepSort loads no embedder
+        self.tracker = DeepSort(max_age=max(1, math.ceil(30 / self.stride)), embedder=None)
+
+        self.line_ids, segments = _named(lines)
+        self.lines = LineCrossingCounter(segments, offset)
+        self.zone_ids, polygons = _named(zones)
+        self.zones = None
+        if polygons:
+            if frame_size is None:
+                raise ValueError("Counting zones need the frame size")
+            self.zones = ZoneOccupancy(polygons, frame_size, offset)
+
+        self._since_detect = 0
+        self._last_detections = []
+        self._last_embeds = []
+        # (track_id, 'line' | 'zone', id, 'enter' | 'exit') for the last frame counted
+        self.crossings = []
+
+    @property
+    def entered(self):
+        return int(self.lines.entered.sum())
+
+    @property
+    def exited(self):
+        return int(self.lines.exited.sum())
+
+    def counts(self):
+        """Line totals plus per-line and per-zone counters, ready for JSON"""
+        entered, exited = self.entered, self.exited
+        lines = self.lines
+        counts = {
+            'entered': entered,
+            'exited': exited,
+            'inside': entered - exited,
+            'lines': [{'id': line_id, 'entered': int(lines.entered[i]),
+                       'exited': int(lines.exited[i])}
+                      for i, line_id in enumerate(self.line_ids)],
+            'zones': [],
+        }
+        zones = self.zones
+        if zones is not None:
+            counts['zones'] = [{'id': zone_id, 'entered': int(zones.entered[i]),
+                                'exited': int(zones.exited[i]), 'inside': int(zones.inside[i])}
+                               for i, zone_id in enumerate(self.zone_ids)]
+        return counts
+
+    def update(self, frame, detections, embeds=None):
+        """Track one frame's detections and return confirmed track boxes
+
+        `embeds` are appearance embeddings of the detections, e.g. from a
+        detection cache; they are computed from `frame` when not given.
+        """
+        start = time.perf_counter()
+        if embeds is None:
+            detections = [d for d in detections if d[0][2] > 0 and d[0][3] > 0]
+            embeds = self.embeddings.embed(self.tracker, frame, detections)
+        if self.recorder is not None:
+            detections, embeds = self.recorder.add(detections, embeds)
+        self.tracker.update_tracks(detections, embeds=embeds)
+        if self.metrics is not None:
+            self.metrics.record('track', time.perf_counter() - start)
+
+        self._last_detections = detections
+        self._last_embeds = embeds
+        self._since_detect = 0
+        return self._count()
+
+    def carry_over(self):
+        """Re-feed the last detections and embeddings when the scene hasn't changed"""
+        start = time.perf_counter()
+        if self.recorder is not None:
+            self.recorder.mark(CARRY)
+        self.tracker.update_tracks(self._last_detections, embeds=self._last_embeds)
+        if self.metrics is not None:
+            self.metrics.record('track', time.perf_counter() - start)
+        self._since_detect = 0
+        return self._count()
+
+    def predict(self):
+        """Advance one frame without detections, moving tracks along their velocity"""
+        if self.recorder is not None:
+            self.recorder.mark(PREDICT)
+        self._since_detect += 1
+        return self._count()
+
+    def _count(self):
+        if self.metrics is None:
+            return self._check_lines()
+        start = time.perf_counter()
+        boxes = self._check_lines()
+        self.metrics.record('count', time.perf_counter() - start)
+        return boxes
+
+    def _check_lines(self):
+        all_tracks = self.tracker.tracker.tracks
+        if self.lines.frame % SWEEP_EVERY == 0:
+            live_ids = {t.track_id for t in all_tracks}
+            self.lines.sweep(live_ids)
+            if self.zones is not None:
+                self.zones.sweep(live_ids)
+
+        tracks = [t for t in all_tracks if t.is_confirmed()]
+        self.crossings = []
+        if not tracks:
+            self.lines.update([], None)
+            if self.zones is not None:
+                self.zones.update([], None)
+            return []
+
+        track_ids = [t.track_id for t in tracks]
+        # Kalman state: centre x, centre y, aspect ratio, height, then velocities
+        state = np.array([t.mean[:6] for t in tracks])
+        width = state[:, 2] * state[:, 3]
+        left = state[:, 0] - width / 2
+        top = state[:, 1] - state[:, 3] / 2
+        ltrb = np.stack([left, top, left + width, top + state[:, 3]], axis=1)
+
+        # Fraction of a tracker step elapsed since the last detection
+        step = self._since_detect / self.stride
+        if step:
+            ltrb += np.tile(state[:, 4:6] * step, 2)
+
+        ltrb = ltrb.astype(np.int64)
+        centroids = np.stack([
+            (ltrb[:, 0] + ltrb[:, 2]) // 2, (ltrb[:, 1] + ltrb[:, 3]) // 2
+        ], axis=1)
+        changes = [('line', self.line_ids, self.lines.update(track_ids, centroids))]
+        if self.zones is not None:
+            changes.append(('zone', self.zone_ids, self.zones.update(track_ids, centroids)))
+        for kind, ids, (entered, exited) in changes:
+            if entered.any() or exited.any():
+                for mask, direction in ((entered, 'enter'), (exited, 'exit')):
+                    for i, j in zip(*np.nonzero(mask)):
+                        self.crossings.append((track_ids[i], kind, ids[j], direction))
+
+        return list(zip(track_ids, *ltrb.T.tolist()))
+
+
+def _track_stage(frames_q, results_q, stop_event, errors, detector, counter,
+                 gate=None, roi=None, metrics=None):
+    """Run detection, tracking and counts (a CameraCounter) on each frame.
+
+    Frames are submitted to the detector as they arrive and consumed in
+    submission order, so up to one batch of frames is in flight at a time.
+    Only every `stride`-th frame is sent to the detector, and only if the
+    motion `gate` (when given) sees a change since the last detection.
+    With a `roi`, only that region is detected on and gated.
+
+    'detect' in `metrics` is the time this thread spends submitting a frame
+    and waiting for its detections, so batching shows up as less of it.
+    """
+    timed = metrics is not None
+    try:
+        stride = counter.stride
+        pending = deque()
+        index = 0
+        # Marker for frames the motion gate held back from the detector
+        static = object()
+
+        def flush(block):
+            while pending and (block or len(pending) >= detector.batch_size
+                               or pending[0][1] in (None, static)
+                               or pending[0][1].done()):
+                frame, future, waited = pending.popleft()
+                if future is None:
+                    boxes = counter.predict()
+                elif future is static:
+                    boxes = counter.carry_over()
+                else:
+                    start = time.perf_counter()
+                    detections = future.result()
+                    if timed:
+                        metrics.record('detect', waited + time.perf_counter() - start)
+                    if roi is not None:
+                        detections = roi.to_frame(detections)
+                    boxes = counter.update(frame, detections)
+                item = (frame, boxes, counter.counts(), counter.crossings)
+                if not _put(results_q, item, stop_event):
+                    return False
+            return True
 
-    cap = cv2.VideoCapture(input_path)
+        while True:
+            if pending:
+                # Don't sit on a partial batch if the decoder stalls
+                try:
+                    frame = frames_q.get(timeout=detector.max_wait)
+                except queue.Empty:
+                    if stop_event.is_set() or not flush(block=True):
+                        break
+                    continue
+            else:
+                frame = _get(frames_q, stop_event)
+
+            if frame is _END:
+                flush(block=True)
+                break
+
+            future = None
+            waited = 0.0
+            if index % stride == 0:
+                region = frame if roi is None else roi.crop(frame)
+                if gate is None or gate.should_detect(region):
+                    start = time.perf_counter()
+                    future = detector.submit(region)
+                    waited = time.perf_counter() - start
+                else:
+                    future = static
+            pending.append((frame, future, waited))
+            index += 1
+            if not flush(block=False):
+                break
+    except Exception as e:
+        errors.append(e)
+        stop_event.set()
+    finally:
+        _put(results_q, _END, stop_event)
+
+
+def _conf_backend(backend):
+    """The backend applying the confidence threshold, under any wrappers like TiledBackend"""
+    while not hasattr(backend, 'conf') and hasattr(backend, 'backend'):
+        backend = backend.backend
+    return backend if hasattr(backend, 'conf') else None
+
+
+def _publish_frame(on_event, frame_index, fps, crossings, previous, counts):
+    """Send a frame's 'crossing' / 'zone' events, and 'counts' if any counter changed"""
+    for track_id, kind, geometry_id, direction in crossings:
+        on_event({
+            'type': 'crossing' if kind == 'line' else 'zone',
+            'frame': frame_index,
+            'time': frame_index / fps,
+            'track_id': track_id,
+            kind: geometry_id,
+            'direction': direction,
+        })
+    if counts != previous:
+        on_event({'type': 'counts', 'frame': frame_index, **counts})
+
+
+def _summary_event(frames, counts, metrics):
+    return {'type': 'summary', 'frames': frames, **counts, 'metrics': metrics.snapshot()}
+
+
+def replay_counter(cache_path, lines=None, offset=25, on_event=None, metrics=None,
+                   verbose=True, zones=None):
+    """
+    Re-count a recording from its detection cache instead of the video.
+
+    The cached detections and embeddings go through a fresh tracker in the
+    recorded order, so the counts equal a full people_counter run with the
+    same detector settings and these `lines` / `zones` / `offset`, without decoding
+    or detecting anything. Events and the return value match people_counter.
+    """
+    log = print if verbose else (lambda *args: None)
+
+    cache = DetectionCache(cache_path)
+    W, H = cache.size
+    if lines is None and not zones:
+        lines = [((0, H // 2), (W, H // 2))]
+    if metrics is None:
+        metrics = StageMetrics()
+
+    counter = CameraCounter(lines, offset, cache.stride, metrics, zones=zones, frame_size=(W, H))
+    counts = previous = counter.counts()
+    metrics.start_clock()
+    for index in range(cache.frames):
+        count, detections, embeds = cache.frame(index)
+        if count == PREDICT:
+            counter.predict()
+        elif count == CARRY:
+            counter.carry_over()
+        else:
+            counter.update(None, detections, embeds)
+        metrics.frame_done()
+
+        counts = counter.counts()
+        if on_event is not None:
+            _publish_frame(on_event, index + 1, cache.fps, counter.crossings, previous, counts)
+        previous = counts
+
+    log("📊", metrics.summary_line())
+    if on_event is not None:
+        on_event(_summary_event(cache.frames, counts, metrics))
+    log("✅ Done! Replayed", cache.frames, "frames from", cache_path)
+    return counts['entered'], counts['exited']
+
+
+def people_counter(input_path, output_path=None, config=None, detector=None, embedder=None,
+                   metrics=None, on_event=None, **options):
+    """
+    Count people crossing lines in a video.
+
+    The tunables below are CounterConfig fields, given as `config` and/or
+    as keyword `options` overriding it. `detector`, `embedder`, `metrics`
+    and `on_event` are the run's collaborators.
+
+    `input_path` is a file, stream URL or device index, read through a
+    StreamSource: live sources are reconnected with backoff when reads
+    fail, and with `latest_only` (default: the source_latest_only setting)
+    stale frames of a live source are dropped when processing falls
+    behind. Anything with the VideoCapture interface works too.
+
+    Decoding runs on its own thread, detection and tracking on a second
+    one, and drawing, encoding and display on the calling thread (HighGUI
+    windows must stay on the main thread). Stages are linked by bounded
+    FIFO queues, so frame order and counts match a sequential run.
+
+    YOLO runs on batches of up to `batch_size` frames, waiting at most
+    `max_wait` seconds to fill one. Pass a shared `detector` to batch
+    frames from several cameras counted in parallel.
+
+    The detector runs at about `detection_fps` frames per second (read from
+    the settings DB when not given, 0 for every frame); tracks are
+    extrapolated on the frames in between.
+
+    With `motion_threshold` > 0 (default: the motion_threshold setting),
+    frames where less than that fraction of a downscaled copy changed since
+    the last detection skip YOLO and re-use the previous detections. The
+    gate's threshold and skip ratio go into the 'metrics' and 'summary'
+    events as 'motion_gate'.
+
+    `roi_margin` restricts detection to a band that many pixels around the
+    counting lines, and `roi_polygon` (a list of (x, y) points) to a
+    polygon; boxes are mapped back to the full frame before tracking.
+    Without either, the margin is read from the detector_roi_margin
+    setting (0 = whole frame).
+
+    `backend` ('ultralytics' or 'onnx') and `model_path` pick the detector;
+    both default to the settings DB, as does its confidence threshold
+    `conf`. A backend instance as `backend` is used as it is. Taken from
+    the settings, the threshold is reloaded while running when it changes,
+    unless detections are being cached. With `tiling` (default: the
+    detector_tiling setting) it also runs on tiles of the frame where people
+    are small, see TiledBackend.
+
+    `embedding` picks which detections DeepSort gets a fresh appearance
+    embedding for: 'always', 'every' (`embed_every`-th detection frame),
+    'ambiguous' or 'iou' (none), see AppearanceEmbeddings; both default to
+    the settings DB. Pass a shared BatchEmbedder as `embedder` to batch
+    crops from several cameras counted in parallel.
+
+    `lines` is a list of ((x1, y1), (x2, y2)) counting lines and `zones` a
+    list of [(x, y), ...] occupancy polygons, or dicts of either keyed by
+    the ids used in events. Without both, a `camera_id`'s geometry is read
+    from the settings DB, falling back to one horizontal line across the
+    middle of the frame. A crossing counts once the centroid is more than
+    `offset` pixels past the line, or into / out of a zone. The returned
+    totals are the lines' sums.
+
+    With `output_path` None and `display` False nothing is drawn, encoded or
+    shown. Otherwise `annotate` picks what goes to `output_path`: 'full'
+    (every frame), 'every' (every `annotate_every`-th frame) or 'clips'
+    (`clip_seconds` around each crossing, one file per clip).
+
+    `on_event` receives structured events as dicts: 'crossing' for each
+    track crossing a line, 'zone' for each track entering or leaving a
+    zone, 'counts' when any counter changes (with per-line and per-zone
+    counters) and a final 'summary'. `verbose=False` silences progress messages.
+
+    With `live` (default: the publish_live_counts setting) the counts go to
+    the shared LiveCounts store under `camera_id` (or 'default') as they
+    change, for the admin API's /api/live; a camera id another run is
+    still publishing is not published twice. With `history` (default: the
+    count_history_enabled setting) every crossing is also stored in the
+    CountStore and rolled up per minute, hour and day.
+
+    Per-frame decode, detect, track, count, draw and encode latencies go
+    into `metrics` (a StageMetrics, created when not given). Every
+    `metrics_interval` seconds (0 to disable) a p50/p95/p99 summary is
+    logged and sent as a 'metrics' event; the final snapshot is part of
+    'summary'. With `profile_path`, every pipeline thread runs under
+    cProfile and the merged stats are written there.
+
+    With a `detection_cache` directory, the tracker input of a video file
+    (detections and their embeddings) is cached there, keyed by the
+    video's content and the detector, stride, motion gate and ROI
+    settings. Once a complete cache exists, runs that draw nothing replay
+    it (see replay_counter), so moving lines or changing `offset` does not
+    need YOLO again. A ROI built from the lines (`roi_margin`) is part of
+    the key; leave it out when recording footage to re-count.
+    """
+    config = CounterConfig.resolve(config, options)
+    batch_size, max_wait = config.batch_size, config.max_wait
+    detection_fps, motion_threshold = config.detection_fps, config.motion_threshold
+    roi_margin, roi_polygon = config.roi_margin, config.roi_polygon
+    backend, model_path, conf, tiling = config.backend, config.model_path, config.conf, config.tiling
+    detection_cache = config.detection_cache
+    embedding, embed_every = config.embedding, config.embed_every
+    latest_only = config.latest_only
+    lines, zones, offset, camera_id = config.lines, config.zones, config.offset, config.camera_id
+    display, annotate = config.display, config.annotate
+    annotate_every, clip_seconds = config.annotate_every, config.clip_seconds
+    live, history = config.live, config.history
+    verbose, metrics_interval, profile_path = (config.verbose, config.metrics_interval,
+                                               config.profile_path)
+    log = print if verbose else (lambda *args: None)
+
+    # Anything with the VideoCapture read/get interface can stand in for a path
+    if hasattr(input_path, 'read'):
+        cap = input_path
+    else:
+        if latest_only is None:
+            latest_only = load_setting('source_latest_only', False)
+        cap = StreamSource(input_path, latest_only=latest_only, log=log)
+    source_stats = getattr(cap, 'stats', None)
+    # Captures that lend out shared buffers need them back once a frame is written
+    recycle = getattr(cap, 'recycle', None)
 
     if not cap.isOpened():
-        print("❌ ERROR: Cannot open input video")
+        print("❌ ERROR: Cannot open input video", file=sys.stderr)
         return
 
     W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -16,91 +633,382 @@ def people_counter(input_path, output_path):
     if FPS == 0:
         FPS = 30
 
-    writer = cv2.VideoWriter(
-        output_path,
-        cv2.VideoWriter_fourcc(*"mp4v"),
-        FPS,
-        (W, H)
+    if lines is None and zones is None and camera_id is not None:
+        lines, zones = load_geometry(camera_id)
+        if lines or zones:
+            log(f"✅ Loaded {len(lines)} line(s) and {len(zones)} zone(s) for camera {camera_id}")
+    if not lines and not zones:
+        lines = [((0, H // 2), (W, H // 2))]
+    segments = _named(lines)[1]
+    polygons = _named(zones)[1]
+
+    if metrics is None:
+        metrics = StageMetrics(profile=bool(profile_path))
+    elif profile_path:
+        metrics.profile = True
+
+    if detection_fps is None:
+        detection_fps = load_setting('detection_fps', 0)
+    stride = 1
+    if detection_fps and detection_fps < FPS:
+        stride = max(1, round(FPS / detection_fps))
+
+    if motion_threshold is None:
+        motion_threshold = load_setting('motion_threshold', 0)
+    gate = MotionGate(threshold=motion_threshold) if motion_threshold else None
+
+    if embedding is None:
+        embedding = load_setting('tracker_embedding', 'always')
+    if embed_every is None:
+        embed_every = load_setting('tracker_embed_every', 5)
+    embeddings = AppearanceEmbeddings(embedding, embed_every)
+
+    if roi_polygon is None and roi_margin is None:
+        roi_margin = load_setting('detector_roi_margin', 0) or None
+    roi = None
+    if roi_polygon is not None or roi_margin is not None:
+        anchors = [point for shape in segments + polygons for point in shape]
+        roi = RegionOfInterest((W, H), anchors, roi_margin, roi_polygon)
+        log(f"✅ Detecting on {roi.pixel_ratio:.0%} of the frame")
+
+    own_detector = detector is None
+    injected = own_detector and backend is not None and not isinstance(backend, str)
+    follow_conf = own_detector and not injected and conf is None
+    if injected:
+        detector_settings = getattr(backend, 'settings', None) or {
+            'backend': type(backend).__name__
+        }
+    elif own_detector:
+        if backend is None:
+            backend = load_setting('detector_backend', 'ultralytics')
+        if model_path is None:
+            model_path = load_setting('detector_model') or None
+        int8 = load_setting('detector_int8', False)
+        if follow_conf:
+            conf = load_setting('detection_confidence_threshold', 0.5)
+        detector_settings = backend_settings(backend, model_path, conf, int8=int8)
+    if own_detector:
+        if tiling is None:
+            tiling = load_setting('detector_tiling', False)
+        if tiling:
+            detector_settings = tiled_settings(detector_settings)
+    else:
+        detector_settings = getattr(detector.backend, 'settings', None) or {
+            'backend': type(detector.backend).__name__
+        }
+
+    cache_path = None
+    if detection_cache is not None:
+        if not isinstance(input_path, str) or not os.path.isfile(input_path):
+            log("⚠️  Detections are only cached for video files")
+        else:
+            settings = {
+                'detector': detector_settings,
+                'stride': stride,
+                'motion_threshold': motion_threshold,
+                'roi': None if roi is None else [roi.x0, roi.y0, roi.x1, roi.y1, roi_polygon],
+                'embedder': 'mobilenet',
+                'embedding': embeddings.settings,
+            }
+            cache_path = os.path.join(detection_cache, cache_key(input_path, settings))
+            if DetectionCache.exists(cache_path) and not output_path and not display:
+                cap.release()
+                log("♻️  Replaying cached detections from:", cache_path)
+                return replay_counter(cache_path, lines, offset, on_event, metrics, verbose,
+                                      zones)
+
+    if injected:
+        detector = BatchDetector(TiledBackend(backend) if tiling else backend,
+                                 batch_size=batch_size, max_wait=max_wait)
+    elif own_detector:
+        model = model_path
+        if tiling:
+            model = TiledBackend(create_backend(backend, model_path, conf, int8=int8))
+        detector = BatchDetector(
+            model, batch_size=batch_size, max_wait=max_wait, conf=conf, backend=backend,
+            int8=int8
+        )
+
+    own_embedder = embedder is None and embedding != 'iou'
+    if own_embedder:
+        embedder = BatchEmbedder()
+    embeddings.embedder = embedder
+
+    writer = None
+    if output_path:
+        writer = AnnotatedWriter(output_path, FPS, (W, H), segments, annotate,
+                                 annotate_every, clip_seconds, metrics, polygons)
+
+    recorder = None
+    if cache_path is not None:
+        os.makedirs(detection_cache, exist_ok=True)
+        recorder = DetectionRecorder(cache_path, {
+            'video': os.path.abspath(input_path), 'fps': FPS, 'size': [W, H], **settings
+        })
+    counter = CameraCounter(lines, offset, stride, metrics, recorder, zones, (W, H), embeddings)
+
+    # Cached detections must match the threshold in their key, so only uncached runs follow it
+    conf_backend = None
+    if follow_conf and recorder is None:
+        conf_backend = _conf_backend(detector.backend)
+
+    if live is None:
+        live = load_setting('publish_live_counts', True)
+    live_writer = None
+    if live:
+        try:
+            live_store = LiveCounts.open()
+            try:
+                live_writer = live_store.claim(camera_id or 'default')
+            except RuntimeError:
+                live_store.close()
+                raise
+            live_writer.publish(counter.counts())
+        except (OSError, ValueError, RuntimeError) as e:
+            log(f"⚠️  Live counts not published: {e}")
+
+    if history is None:
+        history = load_setting('count_history_enabled', True)
+    count_store = None
+    if history:
+        try:
+            count_store = CountStore(log=log)
+        except sqlite3.Error as e:
+            log(f"⚠️  Count history not stored: {e}")
+
+    frames_q = queue.Queue(maxsize=QUEUE_SIZE)
+    results_q = queue.Queue(maxsize=QUEUE_SIZE)
+    stop_event = threading.Event()
+    errors = []
+
+    decoder = threading.Thread(
+        target=metrics.profiled(_decode_stage), args=(cap, frames_q, stop_event, metrics),
+        name="decoder", daemon=True
+    )
+    tracker = threading.Thread(
+        target=metrics.profiled(_track_stage),
+        args=(frames_q, results_q, stop_event, errors, detector, counter, gate, roi, metrics),
+        name="tracker", daemon=True
     )
 
-    model = YOLO("yolov8n.pt")
-    tracker = DeepSort(max_age=30)
+    log("✅ Processing started..." + (" Press Q to exit" if display else ""))
+
+    metrics.start_clock()
+    profiler = metrics.start_profiler()
+    decoder.start()
+    tracker.start()
 
-    entered = 0
-    exited = 0
-    track_history = {}
-    counted_ids = set()
+    counts = counter.counts()
+    entered = exited = 0
+    frame_index = 0
+    finished = False
+    try:
+        while True:
+            item = _get(results_q, stop_event)
+            if item is _END:
+                finished = not errors
+                break
 
-    line_y = H // 2
-    offset = 25
+            frame, boxes, new_counts, crossings = item
+            frame_index += 1
 
-    print("✅ Processing started... Press Q to exit")
+            if on_event is not None:
+                _publish_frame(on_event, frame_index, FPS, crossings, counts, new_counts)
+            if live_writer is not None and (new_counts != counts or frame_index % LIVE_EVERY == 0):
+                live_writer.publish(new_counts, frame_index)
+            if count_store is not None and new_counts != counts:
+                count_store.record(camera_id or 'default', crossings, new_counts)
+            counts = new_counts
+            entered, exited = counts['entered'], counts['exited']
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+            if conf_backend is not None:
+                conf = load_setting('detection_confidence_threshold', conf)
+                if conf != conf_backend.conf:
+                    log(f"✅ Detection confidence threshold now {conf}")
+                    conf_backend.conf = conf
 
-        results = model.predict(
-            frame, conf=0.5, classes=[0], verbose=False
-        )[0]
+            if display:
+                start = time.perf_counter()
+                draw_frame(frame, boxes, entered, exited, segments, polygons)
+                metrics.record('draw', time.perf_counter() - start)
+                cv2.imshow("People Counter", frame)
+            if writer is not None:
+                if recycle is not None and writer.keeps_frames:
+                    # The shared slot is recycled below, keep a private copy
+                    frame = frame.copy()
+                writer.write(frame_index, frame, boxes, entered, exited,
+                             crossed=bool(crossings), drawn=display)
 
-        detections = []
-        for box in results.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            conf = float(box.conf[0])
-            detections.append(([x1, y1, x2 - x1, y2 - y1], conf, "person"))
+            if recycle is not None:
+                recycle()
 
-        tracks = tracker.update_tracks(detections, frame=frame)
+            metrics.frame_done()
+            if metrics.due(metrics_interval):
+                log("📊", metrics.summary_line())
+                if on_event is not None:
+                    event = {'type': 'metrics', 'frame': frame_index, **metrics.snapshot()}
+                    if source_stats is not None:
+                        event['source'] = source_stats()
+                    if gate is not None:
+                        event['motion_gate'] = gate.stats()
+                    on_event(event)
 
-        cv2.line(frame, (0, line_y), (W, line_y), (0, 0, 255), 2)
+            if display and cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+    finally:
+        stop_event.set()
+        decoder.join()
+        tracker.join()
+        if profiler is not None:
+            profiler.disable()
+        if own_detector:
+            detector.close()
+        if own_embedder:
+            embedder.close()
+        if live_writer is not None:
+            live_writer.publish(counts, frame_index)
+            live_writer.close()
+            live_writer.store.close()
+        if count_store is not None:
+            count_store.close()
+        # Only a run that saw every frame is worth replaying
+        if recorder is not None and recorder.close(finished):
+            log("✅ Detections cached in:", recorder.path)
 
-        for track in tracks:
-            if not track.is_confirmed():
-                continue
+        cap.release()
+        if writer is not None:
+            writer.close()
+        if display:
+            cv2.destroyAllWindows()
 
-            track_id = track.track_id
-            l, t, r, b = map(int, track.to_ltrb())
-            cy = (t + b) // 2
+    if errors:
+        raise errors[0]
 
-            prev_cy = track_history.get(track_id, cy)
-            track_history[track_id] = cy
+    log("📊", metrics.summary_line())
+    if profile_path and metrics.dump_profile(profile_path) is not None:
+        log("✅ Profile saved to:", profile_path)
 
-            if track_id not in counted_ids:
-                if prev_cy < line_y - offset and cy > line_y + offset:
-                    entered += 1
-                    counted_ids.add(track_id)
-                elif prev_cy > line_y + offset and cy < line_y - offset:
-                    exited += 1
-                    counted_ids.add(track_id)
+    if gate is not None:
+        log(f"✅ Motion gate skipped {gate.skip_ratio:.1%} of detector calls "
+            f"(threshold {gate.threshold})")
+    if source_stats is not None:
+        stats = source_stats()
+        if stats['dropped'] or stats['reconnects']:
+            log(f"✅ Source: dropped {stats['dropped']} stale frame(s), "
+                f"reconnected {stats['reconnects']} time(s)")
+    if embedding != 'always':
+        log(f"✅ Embedded {embeddings.computed_ratio:.1%} of detections ({embedding} mode)")
 
-            cv2.rectangle(frame, (l, t), (r, b), (0, 255, 0), 2)
-            cv2.putText(frame, f"ID {track_id}", (l, t - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    if on_event is not None:
+        summary = _summary_event(frame_index, counts, metrics)
+        if source_stats is not None:
+            summary['source'] = source_stats()
+        if gate is not None:
+            summary['motion_gate'] = gate.stats()
+        on_event(summary)
 
-        inside = entered - exited
+    if writer is not None and writer.clips:
+        log(f"✅ Done! {len(writer.clips)} clip(s) saved next to:", output_path)
+    elif output_path:
+        log("✅ Done! Output saved to:", output_path)
+    else:
+        log("✅ Done!")
+    return entered, exited
 
-        cv2.putText(frame, f"Entered: {entered}", (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        cv2.putText(frame, f"Exited: {exited}", (10, 60),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        cv2.putText(frame, f"Inside: {inside}", (10, 90),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Count people crossing a line in a video.")
+    parser.add_argument("input", help="input video path or stream URL")
+    parser.add_argument("-o", "--output", help="annotated output video (omit for none)")
+    parser.add_argument("--headless", action="store_true",
+                        help="no window; counts are emitted as JSON lines")
+    parser.add_argument("--events", default="-",
+                        help="file for JSON line events in headless mode (default: stdout)")
+    parser.add_argument("--annotate", choices=ANNOTATE_MODES, default="full",
+                        help="what to write to --output")
+    parser.add_argument("--annotate-every", type=int, default=10,
+                        help="frame interval for --annotate every")
+    parser.add_argument("--clip-seconds", type=float, default=4.0,
+                        help="clip length for --annotate clips")
+    parser.add_argument("--detection-fps", type=float,
+                        help="detector rate (default: detection_fps setting, 0 = every frame)")
+    parser.add_argument("--motion-threshold", type=float,
+                        help="changed-pixel fraction below which frames skip the detector "
+                             "(default: motion_threshold setting, 0 = off)")
+    parser.add_argument("--roi-margin", type=int,
+                        help="only detect within this many pixels of the counting lines "
+                             "(default: detector_roi_margin setting, 0 = whole frame)")
+    parser.add_argument("--roi-polygon", type=int, nargs="+", metavar="X Y",
+                        help="only detect inside this polygon, as x y pairs")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--backend", choices=BACKENDS,
+                        help="detector backend (default: detector_backend setting)")
+    parser.add_argument("--model", metavar="PATH",
+                        help="detector weights (default: detector_model setting)")
+    parser.add_argument("--tiling", action="store_true", default=None,
+                        help="also detect on tiles where people look small (default: setting)")
+    parser.add_argument("--embedding", choices=EMBED_MODES,
+                        help="which detections get appearance embeddings (default: setting)")
+    parser.add_argument("--embed-every", type=int,
+                        help="detection frames between full embedding passes for --embedding every")
+    parser.add_argument("--latest-only", action="store_true", default=None,
+                        help="drop stale frames of a live stream (default: setting)")
+    parser.add_argument("--line", type=int, nargs=4, action="append",
+                        metavar=("X1", "Y1", "X2", "Y2"),
+                        help="counting line, repeatable (default: across the middle)")
+    parser.add_argument("--zone", type=int, nargs="+", action="append", metavar="X Y",
+                        help="occupancy zone polygon as x y pairs, repeatable")
+    parser.add_argument("--camera", help="load this camera's lines and zones from the settings DB")
+    parser.add_argument("--offset", type=int, default=25,
+                        help="pixels past a line before a crossing counts")
+    parser.add_argument("--detection-cache", metavar="DIR",
+                        help="cache detections here; headless runs without -o replay them")
+    parser.add_argument("--metrics-interval", type=float, default=60,
+                        help="seconds between latency summaries (0 = only at the end)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="run under cProfile and write merged stats to PATH")
+    return parser.parse_args(argv)
 
-        writer.write(frame)
-        cv2.imshow("People Counter", frame)
 
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            break
+def run_cli(args):
+    """Non-interactive entry point; events go out as one JSON object per line"""
+    on_event = None
+    events = None
+    if args.headless:
+        events = sys.stdout if args.events == "-" else open(args.events, "a")
 
-    cap.release()
-    writer.release()
-    cv2.destroyAllWindows()
+        def on_event(event):
+            events.write(json.dumps(event) + "\n")
+            events.flush()
+
+    config = CounterConfig(
+        batch_size=args.batch_size, detection_fps=args.detection_fps,
+        motion_threshold=args.motion_threshold, roi_margin=args.roi_margin,
+        roi_polygon=list(zip(args.roi_polygon[::2], args.roi_polygon[1::2]))
+        if args.roi_polygon else None,
+        backend=args.backend, model_path=args.model, display=not args.headless,
+        lines=[((x1, y1), (x2, y2)) for x1, y1, x2, y2 in args.line] if args.line else None,
+        zones=[list(zip(z[::2], z[1::2])) for z in args.zone] if args.zone else None,
+        camera_id=args.camera, offset=args.offset, detection_cache=args.detection_cache,
+        tiling=args.tiling, embedding=args.embedding, embed_every=args.embed_every,
+        latest_only=args.latest_only, annotate=args.annotate,
+        annotate_every=args.annotate_every, clip_seconds=args.clip_seconds,
+        metrics_interval=args.metrics_interval, profile_path=args.profile,
+        # Keep stdout clean for the JSON event stream
+        verbose=not (args.headless and events is sys.stdout)
+    )
+    try:
+        return people_counter(args.input, args.output, config, on_event=on_event)
+    finally:
+        if events is not None and events is not sys.stdout:
+            events.close()
 
-    print("✅ Done! Output saved to:", output_path)
 
 # -------------------- RUN --------------------
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        result = run_cli(parse_args())
+        sys.exit(0 if result is not None else 1)
+
     print("===================================")
     print(" PEOPLE COUNTER PROGRAM STARTED ")
     print("===================================")
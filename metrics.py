@@ -0,0 +1,173 @@
+"""
+Pipeline Metrics
+Low-overhead per-stage latency histograms and optional cProfile hooks
+"""
+
+import cProfile
+import math
+import pstats
+import threading
+import time
+
+STAGES = ('decode', 'detect', 'track', 'count', 'draw', 'encode')
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram.
+
+    Buckets are 20 per decade from 1 microsecond to 100 seconds, so
+    recording is one log10 and a list increment and percentiles are
+    accurate to about 12%. Each histogram should be written by one thread;
+    reading from another thread is safe but may be a sample behind.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    MIN_SECONDS = 1e-6
+    PER_DECADE = 20
+    BUCKETS = 8 * PER_DECADE
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds > self.MIN_SECONDS:
+            bucket = min(self.BUCKETS - 1,
+                         int(math.log10(seconds / self.MIN_SECONDS) * self.PER_DECADE))
+        else:
+            bucket = 0
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, in seconds"""
+        if not self.count:
+            return 0.0
+        target = q / 100.0 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                upper = self.MIN_SECONDS * 10 ** ((bucket + 1) / self.PER_DECADE)
+                return min(upper, self.max)
+        return self.max
+
+    def summary(self):
+        """Count, mean and p50/p95/p99/max in milliseconds"""
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            'count': self.count,
+            'mean_ms': mean * 1000,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class StageMetrics:
+    """
+    Latency histograms for each pipeline stage plus frame throughput.
+
+    Stages call `record(stage, seconds)`; `snapshot` returns a JSON-ready
+    dict and `summary_line` a one-line p50/p95/p99 digest. With
+    `profile=True`, `profiled` wraps thread targets in their own cProfile
+    profiler and `dump_profile` merges them into one stats file.
+    """
+
+    def __init__(self, stages=STAGES, profile=False):
+        self.histograms = {stage: LatencyHistogram() for stage in stages}
+        self.frames = 0
+        self.started = time.perf_counter()
+        self.profile = profile
+
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        self._last_report = self.started
+
+    def record(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def start_clock(self):
+        """Measure fps and report intervals from now, e.g. after models are loaded"""
+        self.started = self._last_report = time.perf_counter()
+
+    def frame_done(self):
+        self.frames += 1
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'frames': self.frames,
+            'elapsed_s': elapsed,
+            'fps': self.frames / elapsed if elapsed > 0 else 0.0,
+            'stages': {stage: h.summary() for stage, h in self.histograms.items() if h.count},
+        }
+
+    def summary_line(self):
+        snapshot = self.snapshot()
+        parts = [f"{snapshot['frames']} frames {snapshot['fps']:.1f} fps"]
+        for stage, s in snapshot['stages'].items():
+            parts.append(f"{stage} p50={s['p50_ms']:.1f} p95={s['p95_ms']:.1f} "
+                         f"p99={s['p99_ms']:.1f}ms")
+        return " | ".join(parts)
+
+    def due(self, interval):
+        """True once every `interval` seconds, for periodic reporting"""
+        if not interval:
+            return False
+        now = time.perf_counter()
+        if now - self._last_report >= interval:
+            self._last_report = now
+            return True
+        return False
+
+    # ==================== PROFILING ====================
+    def start_profiler(self):
+        """Profile the calling thread; returns the profiler, or None when not profiling"""
+        if not self.profile:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler, which already sees every thread
+            return None
+        with self._profiles_lock:
+            self._profiles.append(profiler)
+        return profiler
+
+    def profiled(self, target):
+        """Wrap a thread target so it runs under its own cProfile profiler"""
+        if not self.profile:
+            return target
+
+        def run(*args, **kwargs):
+            profiler = self.start_profiler()
+            try:
+                return target(*args, **kwargs)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+
+        return run
+
+    def dump_profile(self, path):
+        """Merge every thread's profile into one pstats file"""
+        with self._profiles_lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(path)
+        return stats
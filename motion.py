@@ -0,0 +1,65 @@
+"""
+Motion Gate
+Skip detector calls when the scene has not changed
+"""
+
+import cv2
+
+
+class MotionGate:
+    """
+    Cheap frame-differencing check run before the detector.
+
+    Frames are shrunk to `width` pixels wide, converted to blurred grayscale
+    and compared with the last frame that was sent to the detector. If less
+    than `threshold` (a fraction of the downscaled pixels) changed by more
+    than `pixel_delta` grey levels, the scene is treated as static.
+    Comparing against the last detected frame rather than the previous one
+    means slow changes still add up and eventually trigger a detection.
+    """
+
+    def __init__(self, threshold=0.002, pixel_delta=25, width=160):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.width = width
+
+        self.checked = 0
+        self.skipped = 0
+        self._reference = None
+
+    @property
+    def skip_ratio(self):
+        """Fraction of checked frames that skipped the detector"""
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def stats(self):
+        """Threshold and skip counts, for metrics and summary events"""
+        return {'threshold': self.threshold, 'checked': self.checked,
+                'skipped': self.skipped, 'skip_ratio': self.skip_ratio}
+
+    def _prepare(self, frame):
+        h, w = frame.shape[:2]
+        height = max(1, round(h * self.width / w))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def changed_fraction(self, frame):
+        """Fraction of downscaled pixels that differ from the reference frame"""
+        small = self._prepare(frame)
+        if self._reference is None or self._reference.shape != small.shape:
+            return 1.0, small
+        diff = cv2.absdiff(small, self._reference)
+        _, mask = cv2.threshold(diff, self.pixel_delta, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / mask.size, small
+
+    def should_detect(self, frame):
+        """True if the frame has moved enough to be worth a detector pass"""
+        fraction, small = self.changed_fraction(frame)
+        self.checked += 1
+        if fraction < self.threshold:
+            self.skipped += 1
+            return False
+        self._reference = small
+        return True
@@ -0,0 +1,194 @@
+"""
+Retention
+Delete expired count history and settings history in small batches, on a schedule
+"""
+
+import sqlite3
+import threading
+import time
+
+from count_store import HISTORY_DB, ROLLUPS
+
+# Seconds between scheduled cleanups
+CLEANUP_INTERVAL = 3600.0
+
+# Rows per delete transaction, and the pause between them for other writers
+BATCH_SIZE = 1000
+BATCH_PAUSE = 0.05
+
+# Free pages handed back to the file system per incremental vacuum step
+VACUUM_PAGES = 256
+
+# Rollups outlive the raw events; day rows are kept for good
+PRUNED_ROLLUPS = ('minute', 'hour')
+
+
+def delete_batches(conn, table, where, params=(), key='rowid', batch_size=BATCH_SIZE,
+                   pause=BATCH_PAUSE):
+    """
+    Delete the rows of `table` matching `where`, `batch_size` at a time.
+
+    `conn` is in autocommit mode, so every batch is its own short
+    transaction and the write lock is free between batches. `where` should
+    be served by an index so each batch finds its rows without a scan.
+    `key` is the primary key column(s) of WITHOUT ROWID tables.
+    """
+    sql = (f'DELETE FROM {table} WHERE ({key}) IN '
+           f'(SELECT {key} FROM {table} WHERE {where} LIMIT ?)')
+    deleted = 0
+    while True:
+        count = conn.execute(sql, (*params, batch_size)).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+        time.sleep(pause)
+
+
+def reclaim_space(conn, pages=VACUUM_PAGES, pause=BATCH_PAUSE):
+    """Hand free pages back to the file system, `pages` per step (needs auto_vacuum INCREMENTAL)"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        # Freed pages stay in the file and are reused by later inserts
+        return 0
+    freed = 0
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    while free:
+        # execute() would only step the pragma once, freeing a single page
+        conn.executescript(f'PRAGMA incremental_vacuum({pages})')
+        left = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if left >= free:
+            # Writers are re-using the free pages as fast as they are returned
+            break
+        freed += free - left
+        free = left
+        time.sleep(pause)
+    return freed
+
+
+class RetentionCleaner:
+    """
+    Enforce data_retention_days on the count history and settings history.
+
+    Each `run` reads auto_cleanup_enabled, data_retention_days and
+    rollup_retention_days from `settings` (a SettingsCache), then deletes:
+
+    - raw count events older than data_retention_days, but only ones every
+      rollup table has already counted;
+    - per-minute and per-hour rollups older than rollup_retention_days
+      (per-day rollups are kept);
+    - settings_history rows older than data_retention_days.
+
+    Deletes go through `delete_batches`, so ingestion and API writes wait
+    for at most one small batch and WAL readers never wait. Space is then
+    reclaimed with incremental vacuum steps. A run returns, logs and keeps
+    as `last_report` the rows deleted per table, pages freed and seconds
+    taken. `start` runs it every `interval` seconds on a daemon thread.
+    """
+
+    def __init__(self, settings, settings_path='settings.db', counts_path=HISTORY_DB,
+                 interval=CLEANUP_INTERVAL, batch_size=BATCH_SIZE, pause=BATCH_PAUSE, log=print):
+        self.settings = settings
+        self.settings_path = settings_path
+        self.counts_path = counts_path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.log = log
+
+        self.runs = 0
+        self.last_report = None
+
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._schedule, name="retention",
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self, now=None):
+        """One cleanup pass; returns its report"""
+        with self._run_lock:
+            now = time.time() if now is None else now
+            start = time.perf_counter()
+            report = {'started': now, 'enabled': self.settings.get('auto_cleanup_enabled', True),
+                      'deleted': {}, 'pages_freed': 0}
+            if report['enabled']:
+                days = self.settings.get('data_retention_days', 90)
+                rollup_days = max(days, self.settings.get('rollup_retention_days', 365))
+                report['retention_days'] = days
+                report['rollup_retention_days'] = rollup_days
+                self._clean_counts(now - days * 86400, now - rollup_days * 86400, report)
+                self._clean_settings_history(now - days * 86400, report)
+            report['seconds'] = time.perf_counter() - start
+
+            self.runs += 1
+            self.last_report = report
+        if report['enabled']:
+            deleted = ", ".join(f"{n} {table}" for table, n in report['deleted'].items())
+            self.log(f"🧹 Retention cleanup: deleted {deleted or 'nothing'}, freed "
+                     f"{report['pages_freed']} page(s) in {report['seconds']:.2f}s")
+        return report
+
+    def _connect(self, path):
+        # Autocommit, so each delete batch commits on its own
+        return sqlite3.connect(path, uri=True, timeout=30, isolation_level=None)
+
+    def _clean_counts(self, cutoff, rollup_cutoff, report):
+        try:
+            conn = self._connect(f"file:{self.counts_path}?mode=rw")
+        except sqlite3.Error:
+            # No count history yet
+            return
+        try:
+            # Events not yet counted by every rollup table stay
+            counted = conn.execute(
+                f"SELECT COUNT(*), MIN(last_event_id) FROM rollup_state "
+                f"WHERE resolution IN ({', '.join('?' * len(ROLLUPS))})", tuple(ROLLUPS)
+            ).fetchone()
+            rolled_up = counted[1] if counted[0] == len(ROLLUPS) else 0
+            report['deleted']['count_events'] = delete_batches(
+                conn, 'count_events', 'ts < ? AND id <= ?', (cutoff, rolled_up),
+                batch_size=self.batch_size, pause=self.pause)
+            for name in PRUNED_ROLLUPS:
+                report['deleted'][f'counts_{name}'] = delete_batches(
+                    conn, f'counts_{name}', 'bucket < ?', (rollup_cutoff,),
+                    key='camera_id, kind, geometry_id, bucket',
+                    batch_size=self.batch_size, pause=self.pause)
+            report['pages_freed'] += reclaim_space(conn, pause=self.pause)
+        except sqlite3.OperationalError as e:
+            self.log(f"⚠️  Count history not cleaned: {e}")
+        finally:
+            conn.close()
+
+    def _clean_settings_history(self, cutoff, report):
+        try:
+            conn = self._connect(f"file:{self.settings_path}?mode=rw")
+        except sqlite3.Error:
+            return
+        try:
+            report['deleted']['settings_history'] = delete_batches(
+                conn, 'settings_history', "timestamp < datetime(?, 'unixepoch')", (cutoff,),
+                batch_size=self.batch_size, pause=self.pause)
+            report['pages_freed'] += reclaim_space(conn, pause=self.pause)
+        except sqlite3.OperationalError as e:
+            self.log(f"⚠️  Settings history not cleaned: {e}")
+        finally:
+            conn.close()
+
+    def _schedule(self):
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception as e:
+                # Keep the schedule going; the next run may well succeed
+                self.log(f"⚠️  Retention cleanup failed: {e!r}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,214 @@
+"""
+Multi-Camera Runner
+Count people on several video files or camera streams in parallel worker processes
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+from collections import deque
+
+from frame_ring import RingCapture, capture_process
+from main import load_setting
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+# Frames one camera can have in flight between its decoder and counter
+RING_SLOTS = 24
+
+
+def _camera_worker(camera_id, source, events, options, threads, ring=None):
+    """Run one camera's decode/track/count loop and report back over `events`.
+
+    With `ring` (handles queue, free slots queue, stop event, attached
+    event, exited event) frames come from a separate capture_process
+    through shared memory instead.
+    """
+    if threads:
+        # Must be set before torch / onnxruntime are imported in this process
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(threads)
+
+    from main import people_counter
+
+    def publish(event):
+        event['camera'] = camera_id
+        events.put(event)
+
+    try:
+        if ring is not None:
+            handles, free_slots, stop, attached, exited = ring
+            source = RingCapture(handles, free_slots, stop, attached=attached, exited=exited)
+        result = people_counter(source, None, display=False, on_event=publish,
+                                camera_id=camera_id, **options)
+        if result is None:
+            publish({'type': 'error', 'message': f"Cannot open source {source}"})
+    except Exception as e:
+        publish({'type': 'error', 'message': repr(e)})
+    finally:
+        publish({'type': 'done'})
+
+
+def _aggregate(totals):
+    entered = sum(t['entered'] for t in totals.values())
+    exited = sum(t['exited'] for t in totals.values())
+    return {'entered': entered, 'exited': exited, 'inside': entered - exited}
+
+
+def run_cameras(sources, max_cameras=None, options=None, threads=None, on_update=None,
+                shared_memory=False):
+    """
+    Count people on every source, each in its own worker process.
+
+    `sources` is a list of paths/URLs (named cam0, cam1, ...) or a dict of
+    camera id -> path/URL. At most `max_cameras` workers run at once,
+    `max_concurrent_cameras` from the settings DB by default; extra sources
+    start as workers finish. Every worker has its own detector and DeepSort
+    state; lines and zones come from the settings DB under each camera id.
+    `options` are passed through to people_counter. With
+    `shared_memory`, each camera is decoded by a separate process that
+    writes frames into a shared memory ring the worker reads in place
+    (and reconnects or drops stale frames there, see StreamSource).
+
+    `on_update(camera_id, camera_totals, aggregate_totals)` is called in
+    this process whenever a camera's counts change. Returns the final
+    per-camera totals, with an 'error' entry for cameras that failed.
+    """
+    if not isinstance(sources, dict):
+        sources = {f"cam{i}": source for i, source in enumerate(sources)}
+    if max_cameras is None:
+        max_cameras = load_setting('max_concurrent_cameras', 10)
+    max_cameras = max(1, int(max_cameras))
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // min(max_cameras, len(sources) or 1))
+    options = dict(options or {})
+    latest_only = options.get('latest_only')
+    if latest_only is None:
+        latest_only = load_setting('source_latest_only', False)
+
+    ctx = mp.get_context('spawn')
+    events = ctx.Queue()
+
+    pending = deque(sources.items())
+    running = {}
+    decoders = {}
+    # Children unpickle these lazily, so the parent must keep them alive
+    rings = {}
+    totals = {camera_id: {'entered': 0, 'exited': 0, 'inside': 0} for camera_id in sources}
+
+    def start_next():
+        camera_id, source = pending.popleft()
+        ring = None
+        if shared_memory:
+            ring = rings[camera_id] = (ctx.Queue(), ctx.Queue(), ctx.Event(), ctx.Event(),
+                                       ctx.Event())
+            handles, free_slots, stop, attached, _ = ring
+            decoder = ctx.Process(
+                target=capture_process,
+                args=(source, handles, free_slots, RING_SLOTS, stop, latest_only, attached),
+                name=f"decoder-{camera_id}", daemon=True
+            )
+            decoder.start()
+            decoders[camera_id] = decoder
+
+        process = ctx.Process(
+            target=_camera_worker,
+            args=(camera_id, source, events, options, threads, ring),
+            name=f"camera-{camera_id}", daemon=True
+        )
+        process.start()
+        running[camera_id] = process
+
+    def finish(camera_id):
+        running.pop(camera_id, None)
+        decoder = decoders.pop(camera_id, None)
+        if decoder is not None:
+            decoder.join(timeout=5)
+        rings.pop(camera_id, None)
+        if pending:
+            start_next()
+
+    while pending and len(running) < max_cameras:
+        start_next()
+    if pending:
+        print(f"⚠️  {len(pending)} camera(s) waiting for a free worker "
+              f"(max_concurrent_cameras={max_cameras})")
+
+    try:
+        while running:
+            # Let workers stop waiting on decoders that died without ending their stream
+            for camera_id, decoder in decoders.items():
+                exited = rings[camera_id][4]
+                if not exited.is_set() and not decoder.is_alive():
+                    if decoder.exitcode:
+                        totals[camera_id].setdefault(
+                            'error', f"Decoder exited with code {decoder.exitcode}")
+                    exited.set()
+
+            try:
+                event = events.get(timeout=1.0)
+            except queue.Empty:
+                # A worker killed outside Python never posts 'done'
+                for camera_id, process in list(running.items()):
+                    if not process.is_alive():
+                        totals[camera_id].setdefault('error', f"Worker exited with code {process.exitcode}")
+                        finish(camera_id)
+                continue
+
+            camera_id = event['camera']
+            if event['type'] == 'counts':
+                camera = totals[camera_id]
+                camera.update(entered=event['entered'], exited=event['exited'],
+                              inside=event['inside'])
+                if on_update is not None:
+                    on_update(camera_id, camera, _aggregate(totals))
+            elif event['type'] == 'error':
+                totals[camera_id]['error'] = event['message']
+                print(f"❌ ERROR [{camera_id}]: {event['message']}")
+            elif event['type'] == 'done':
+                process = running.get(camera_id)
+                if process is not None:
+                    process.join()
+                finish(camera_id)
+    finally:
+        for process in list(running.values()) + list(decoders.values()):
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    return totals
+
+
+# -------------------- RUN --------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sources", nargs="+", help="video files or stream URLs")
+    parser.add_argument("--max-cameras", type=int,
+                        help="worker cap (default: max_concurrent_cameras setting)")
+    parser.add_argument("--threads", type=int, help="inference threads per worker")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="decode in separate processes, passing frames through shared memory")
+    parser.add_argument("--latest-only", action="store_true", default=None,
+                        help="drop stale frames of live streams (default: setting)")
+    args = parser.parse_args()
+
+    def report(camera_id, camera, aggregate):
+        print(f"[{camera_id}] Entered: {camera['entered']}  Exited: {camera['exited']}  "
+              f"| All cameras: Entered {aggregate['entered']}  Exited {aggregate['exited']}  "
+              f"Inside {aggregate['inside']}")
+
+    print("===================================")
+    print(" MULTI-CAMERA PEOPLE COUNTER ")
+    print("===================================")
+
+    totals = run_cameras(args.sources, args.max_cameras, {'latest_only': args.latest_only},
+                         threads=args.threads, on_update=report,
+                         shared_memory=args.shared_memory)
+
+    for camera_id, camera in totals.items():
+        status = f"❌ {camera['error']}" if 'error' in camera else "✅"
+        print(f"{status} {camera_id}: Entered {camera['entered']}  Exited {camera['exited']}")
+    aggregate = _aggregate(totals)
+    print(f"Total: Entered {aggregate['entered']}  Exited {aggregate['exited']}  "
+          f"Inside {aggregate['inside']}")
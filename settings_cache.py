@@ -0,0 +1,149 @@
+"""
+Settings Cache
+Typed in-process copy of the admin settings DB, reloaded when the DB's settings version changes
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+# Seconds between checks of the DB's settings version
+CHECK_INTERVAL = 1.0
+
+
+def typed_value(value, setting_type):
+    """A system_settings value converted to its setting_type; ValueError / TypeError if it can't be"""
+    if setting_type == 'integer':
+        return int(value)
+    if setting_type == 'float':
+        return float(value)
+    if setting_type == 'boolean':
+        return value.lower() == 'true'
+    return value
+
+
+class SettingsCache:
+    """
+    Read-through cache of settings, zone thresholds and alert rules for hot paths.
+
+    The first lookup loads every setting (typed), every active zone
+    threshold and every active alert rule in one read transaction. After
+    that a lookup is a dict get, plus a single-row query of the
+    `settings_version` counter at most once per `check_interval` seconds.
+    SettingsDatabase bumps that counter in the same transaction as every
+    settings, zone threshold, alert rule or geometry change, so a
+    long-running process picks up config changes within `check_interval`
+    without reading the tables on every frame.
+
+    A missing DB leaves the cache empty (lookups return their default),
+    and a DB without the counter is reloaded on every check. Safe to share
+    between threads.
+    """
+
+    def __init__(self, db_path, check_interval=CHECK_INTERVAL):
+        self.db_path = db_path
+        self.check_interval = check_interval
+
+        self.version = None
+        self.loads = 0
+        self.checks = 0
+
+        self._values = {}
+        self._zone_thresholds = {}
+        self._alert_rules = ()
+        self._next_check = 0.0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def get(self, setting_key, default=None):
+        """The setting's typed value, or `default` if it's missing or can't be converted"""
+        if time.monotonic() >= self._next_check:
+            self.refresh()
+        return self._values.get(setting_key, default)
+
+    def zone_threshold(self, zone_id):
+        """An active zone threshold as a dict, or None"""
+        if time.monotonic() >= self._next_check:
+            self.refresh()
+        return self._zone_thresholds.get(zone_id)
+
+    def alert_rules(self):
+        """Active alert rules as dicts, JSON decoded; the same tuple until a reload"""
+        if time.monotonic() >= self._next_check:
+            self.refresh()
+        return self._alert_rules
+
+    def refresh(self, force=False):
+        """Reload if the settings version moved (or always with `force`); True if it reloaded"""
+        with self._lock:
+            if not force and time.monotonic() < self._next_check:
+                # Another thread checked while this one waited for the lock
+                return False
+            self._next_check = time.monotonic() + self.check_interval
+            self.checks += 1
+            try:
+                return self._load(force)
+            except sqlite3.Error:
+                self._disconnect()
+                return False
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def _load(self, force):
+        if self._conn is None:
+            # Autocommit, so the loads below can be one explicit read transaction
+            self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                                         isolation_level=None, check_same_thread=False)
+        conn = self._conn
+        conn.execute('BEGIN')
+        try:
+            try:
+                version = conn.execute('SELECT version FROM settings_version').fetchone()[0]
+            except sqlite3.OperationalError:
+                # A DB from before the counter: no way to tell, so reload
+                version = None
+            if not force and version is not None and version == self.version:
+                return False
+
+            values = {}
+            for key, value, setting_type in conn.execute(
+                    'SELECT setting_key, setting_value, setting_type FROM system_settings'):
+                try:
+                    values[key] = typed_value(value, setting_type)
+                except (AttributeError, TypeError, ValueError):
+                    pass
+
+            thresholds = {}
+            for zone_id, capacity, warning, critical, cooldown in conn.execute(
+                    'SELECT zone_id, capacity, warning_threshold, critical_threshold, '
+                    'alert_cooldown FROM zone_thresholds WHERE is_active = 1'):
+                thresholds[zone_id] = {'capacity': capacity, 'warning_threshold': warning,
+                                       'critical_threshold': critical, 'alert_cooldown': cooldown}
+
+            rules = []
+            for rule_id, name, rule_type, conditions, actions, priority in conn.execute(
+                    'SELECT id, rule_name, rule_type, conditions, actions, priority '
+                    'FROM alert_rules WHERE is_active = 1 ORDER BY id'):
+                try:
+                    conditions, actions = json.loads(conditions), json.loads(actions)
+                except (TypeError, ValueError):
+                    continue
+                rules.append({'id': rule_id, 'rule_name': name, 'rule_type': rule_type,
+                              'conditions': conditions, 'actions': actions, 'priority': priority})
+        finally:
+            conn.execute('COMMIT')
+
+        # Swapped whole, so readers never see half a reload
+        self._values, self._zone_thresholds = values, thresholds
+        self._alert_rules = tuple(rules)
+        self.version = version
+        self.loads += 1
+        return True
+
+    def _disconnect(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
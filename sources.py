@@ -0,0 +1,316 @@
+"""
+Video Sources
+Read files, network streams and camera devices with reconnects and a latest-frame-only mode
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+LIVE_PREFIXES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+
+# Seconds before the first reconnect attempt; doubles up to MAX_BACKOFF
+BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+
+def is_live(source):
+    """Devices and network streams are live; anything else is read as a file"""
+    if isinstance(source, int):
+        return True
+    source = str(source)
+    return source.isdigit() or source.lower().startswith(LIVE_PREFIXES)
+
+
+def open_capture(source):
+    """cv2.VideoCapture for a path, URL or device index (also given as a digit string)"""
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+
+class StreamSource:
+    """
+    cv2.VideoCapture look-alike that survives a flaky source.
+
+    Files are read once, front to back. When a read from a live source
+    (device, RTSP / HTTP or other network URL) fails, it is reopened after
+    `backoff` seconds, doubling up to `max_backoff`, until `max_retries`
+    attempts in a row failed (None retries forever). Frames from a
+    reopened stream are resized to the first stream's size so the counting
+    geometry still fits.
+
+    With `latest_only`, a reader thread keeps just the newest frame of a
+    live source and `read` returns that, dropping the frames the consumer
+    was too slow for, so latency stays bounded instead of frames piling up
+    in the driver's buffer. `frames`, `dropped`, `reconnects` and
+    `read_failures` count what happened; `stats()` returns them as a dict.
+
+    `opener(source)` makes the underlying capture, e.g. a FaultInjector's
+    `open` to test all of this offline.
+    """
+
+    def __init__(self, source, live=None, latest_only=False, max_retries=None,
+                 backoff=BACKOFF, max_backoff=MAX_BACKOFF, opener=open_capture, log=print):
+        self.source = source
+        self.live = is_live(source) if live is None else live
+        self.latest_only = latest_only and self.live
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.opener = opener
+        self.log = log
+
+        self.frames = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.read_failures = 0
+        # Capture timestamp (CAP_PROP_POS_MSEC) of the frame `read` last returned
+        self.position_msec = 0.0
+
+        self._closed = threading.Event()
+        self._delay = backoff
+        self._failures = 0
+        self._ended = False
+        self._reader = None
+
+        self._cap = opener(source)
+        self._width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self._height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self._fps = self._cap.get(cv2.CAP_PROP_FPS)
+        if not self._cap.isOpened():
+            # A source that never opened is a configuration error, not an outage
+            self._ended = True
+        elif self.latest_only:
+            self._latest = None
+            self._fresh = threading.Condition()
+            self._reader = threading.Thread(target=self._read_ahead,
+                                            name="source-reader", daemon=True)
+            self._reader.start()
+
+    def isOpened(self):
+        return not self._ended
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self._width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self._height
+        if prop == cv2.CAP_PROP_FPS:
+            return self._fps
+        cap = self._cap
+        return cap.get(prop) if cap is not None else 0
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'reconnects': self.reconnects,
+            'read_failures': self.read_failures,
+        }
+
+    def read(self, image=None):
+        """Next frame (or the newest one with `latest_only`); copied into `image` if given"""
+        if self._reader is None:
+            ret, frame, position = self._next_frame(image)
+        else:
+            with self._fresh:
+                while self._latest is None and not self._ended:
+                    self._fresh.wait()
+                if self._latest is None:
+                    return False, None
+                frame, position = self._latest
+                self._latest = None
+            if image is not None:
+                np.copyto(image, frame)
+                frame = image
+            ret = True
+
+        if ret:
+            self.position_msec = position
+        return ret, frame
+
+    def release(self):
+        self._closed.set()
+        if self._reader is not None:
+            self._reader.join()
+        self._ended = True
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    # ==================== READING ====================
+    def _next_frame(self, image=None):
+        """Read from the capture, reconnecting a live source until it gives a frame"""
+        while not self._closed.is_set():
+            ret, frame = self._cap.read(image) if image is not None else self._cap.read()
+            if ret:
+                self.frames += 1
+                self._failures = 0
+                self._delay = self.backoff
+                return True, self._fit(frame, image), self._cap.get(cv2.CAP_PROP_POS_MSEC)
+            if not self.live:
+                # The end of a file
+                break
+            self.read_failures += 1
+            if not self._reconnect():
+                break
+        self._ended = True
+        return False, None, 0.0
+
+    def _fit(self, frame, image):
+        if frame.shape[1] == self._width and frame.shape[0] == self._height:
+            return frame
+        if image is not None and image.shape[:2] == (self._height, self._width):
+            return cv2.resize(frame, (self._width, self._height), dst=image)
+        return cv2.resize(frame, (self._width, self._height))
+
+    def _reconnect(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+        while not self._closed.is_set():
+            if self.max_retries is not None and self._failures >= self.max_retries:
+                self.log(f"❌ Giving up on {self.source} after {self._failures} attempts")
+                return False
+            self.log(f"⚠️  Lost {self.source}, reconnecting in {self._delay:.1f}s")
+            if self._closed.wait(self._delay):
+                return False
+            self._failures += 1
+            self._delay = min(self._delay * 2, self.max_backoff)
+
+            cap = self.opener(self.source)
+            if cap.isOpened():
+                self._cap = cap
+                self.reconnects += 1
+                self.log(f"✅ Reconnected to {self.source}")
+                return True
+            cap.release()
+        return False
+
+    def _read_ahead(self):
+        """Reader thread for `latest_only`: keep replacing the newest frame"""
+        try:
+            while True:
+                ret, frame, position = self._next_frame()
+                with self._fresh:
+                    if not ret:
+                        break
+                    if self._latest is not None:
+                        self.dropped += 1
+                    self._latest = frame, position
+                    self._fresh.notify()
+        finally:
+            with self._fresh:
+                self._ended = True
+                self._fresh.notify_all()
+
+
+# ==================== FAULT INJECTION ====================
+class FaultInjector:
+    """
+    Stand-in for a flaky live camera, backed by a video file.
+
+    Use `open` as a StreamSource's `opener`. With `realtime`, frame i is
+    not available before `i / fps` seconds after the first open and frames
+    keep "arriving" while the camera is unreachable, so a reconnect skips
+    ahead to the current one, like a real camera. Unread frames wait in an
+    unbounded buffer, like a driver's. Every `fail_every`-th read fails
+    (0 never), and then the next `outage` open attempts fail too. The
+    capture's CAP_PROP_POS_MSEC is the frame's capture time since
+    `started`, so consumers can measure their latency.
+    """
+
+    def __init__(self, path, fail_every=0, outage=0, realtime=True):
+        self.path = path
+        self.fail_every = fail_every
+        self.outage = outage
+        self.realtime = realtime
+
+        self.opens = 0
+        self.faults = 0
+        self.started = None
+
+        self._file = cv2.VideoCapture(path)
+        self.fps = self._file.get(cv2.CAP_PROP_FPS) or 30
+        self.size = (int(self._file.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(self._file.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self._index = 0
+        self._reads = 0
+        self._outage_left = 0
+
+    def open(self, source=None):
+        self.opens += 1
+        if self.started is None:
+            self.started = time.monotonic()
+        if self._outage_left:
+            self._outage_left -= 1
+            return _InjectedCapture(self, opened=False)
+        if self.realtime:
+            # Frames that arrived while disconnected are gone
+            self._skip_to(int((time.monotonic() - self.started) * self.fps))
+        return _InjectedCapture(self, opened=True)
+
+    @property
+    def position_msec(self):
+        """Capture time of the last frame read, in ms since `started`"""
+        return (self._index - 1) / self.fps * 1000
+
+    def _skip_to(self, index):
+        while self._index < index and self._file.grab():
+            self._index += 1
+
+    def read(self, image=None):
+        self._reads += 1
+        if self.fail_every and self._reads % self.fail_every == 0:
+            self.faults += 1
+            self._outage_left = self.outage
+            return False, None
+        if self.realtime:
+            wait = self.started + self._index / self.fps - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        ret, frame = self._file.read(image) if image is not None else self._file.read()
+        if ret:
+            self._index += 1
+        return ret, frame
+
+    def close(self):
+        self._file.release()
+
+
+class _InjectedCapture:
+    """One connection to a FaultInjector; dead once a read has failed"""
+
+    def __init__(self, injector, opened):
+        self.injector = injector
+        self._open = opened
+
+    def isOpened(self):
+        return self._open
+
+    def get(self, prop):
+        injector = self.injector
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return injector.size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return injector.size[1]
+        if prop == cv2.CAP_PROP_FPS:
+            return injector.fps
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return injector.position_msec
+        return 0
+
+    def read(self, image=None):
+        if not self._open:
+            return False, None
+        ret, frame = self.injector.read(image)
+        if not ret:
+            self._open = False
+        return ret, frame
+
+    def release(self):
+        self._open = False
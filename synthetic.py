@@ -0,0 +1,123 @@
+"""
+Synthetic Video
+People stand-ins (white boxes) walking across the counting line, and a detector that finds them
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from detector import xyxy_to_detections
+
+# Frame size of `write_clip` clips and the size of their people
+CLIP_SIZE = (320, 240)
+CLIP_PERSON = (20, 40)
+
+
+class StubBackend:
+    """
+    Detector stand-in for synthetic videos: bright blobs are people.
+
+    A threshold and contour pass per frame, plus an optional fixed
+    `latency` in seconds per frame to stand in for model cost, so tracker
+    and counting costs can be measured without weights or a GPU. With
+    `imgsz`, frames are first shrunk to fit that size like a model input
+    and `min_area` applies there, so small people get lost the way they do
+    with a real detector.
+    """
+
+    name = 'stub'
+
+    def __init__(self, latency=0.0, min_area=400, imgsz=None):
+        self.latency = latency
+        self.min_area = min_area
+        self.imgsz = imgsz
+
+    def predict(self, frames):
+        if self.latency:
+            time.sleep(self.latency * len(frames))
+        results = []
+        for frame in frames:
+            scale = 1.0
+            if self.imgsz and max(frame.shape[:2]) > self.imgsz:
+                scale = self.imgsz / max(frame.shape[:2])
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            _, mask = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            boxes = [cv2.boundingRect(c) for c in contours]
+            xyxy = np.array([(x, y, x + w, y + h) for x, y, w, h in boxes
+                             if w * h >= self.min_area], dtype=np.float64).reshape(-1, 4)
+            results.append(xyxy_to_detections(xyxy / scale, np.full(len(xyxy), 0.9)))
+        return results
+
+
+def make_synthetic_video(path, seconds, size=(1280, 720), fps=30, spawn_every=15,
+                         offset=25, seed=0):
+    """
+    Write a video of people walking straight across the middle line.
+
+    Every `spawn_every` frames a 40x90 white box enters at the top or
+    bottom in its own lane and walks to the far side at 3-8 px/frame, so
+    boxes never overlap. Returns the (entered, exited) counts an exact
+    tracker would report: downward walkers whose centroid ended more than
+    `offset` past the line enter, upward ones exit.
+    """
+    W, H = size
+    frames = int(seconds * fps)
+    rng = np.random.default_rng(seed)
+    lanes = max(1, (W - 80) // 60)
+
+    walkers = []
+    for i, start in enumerate(range(0, frames, spawn_every)):
+        down = i % 2 == 0
+        speed = rng.uniform(3, 8)
+        walkers.append((start, 40 + (i % lanes) * 60, speed if down else -speed))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (W, H))
+    background = rng.integers(30, 60, (H, W, 3), dtype=np.uint8)
+    for index in range(frames):
+        frame = background.copy()
+        for start, x, velocity in walkers:
+            if index < start:
+                continue
+            top = (-90 if velocity > 0 else H) + (index - start) * velocity
+            if -90 < top < H:
+                cv2.rectangle(frame, (x, int(top)), (x + 40, int(top) + 90), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+    entered = exited = 0
+    for start, x, velocity in walkers:
+        top = (-90 if velocity > 0 else H) + (frames - 1 - start) * velocity
+        centre = top + 45
+        if velocity > 0 and centre > H // 2 + offset:
+            entered += 1
+        elif velocity < 0 and centre < H // 2 - offset:
+            exited += 1
+    return entered, exited
+
+
+def write_clip(path, walkers, frames=60, still=10, fps=10):
+    """
+    Write an MJPG clip of `walkers`, each (x, from_y, to_y) box centres.
+
+    Boxes stand at from_y for `still` frames, walk to to_y and stand there
+    for the last `still` frames. With the default horizontal line across
+    the middle, walking down enters and walking up exits.
+    """
+    W, H = CLIP_SIZE
+    w, h = CLIP_PERSON
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (W, H))
+    moving = frames - 2 * still
+    for index in range(frames):
+        step = min(max(index - still, 0), moving) / moving
+        frame = np.zeros((H, W, 3), dtype=np.uint8)
+        for x, from_y, to_y in walkers:
+            y = round(from_y + (to_y - from_y) * step)
+            cv2.rectangle(frame, (x - w // 2, y - h // 2), (x + w // 2, y + h // 2),
+                          (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
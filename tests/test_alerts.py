@@ -0,0 +1,113 @@
+import pytest
+
+from alerts import AlertEngine, RuleError, SlidingWindow, compile_rule
+
+
+class FakeSettings:
+    """The SettingsCache calls AlertEngine makes; a new rules tuple is a reload"""
+
+    def __init__(self, rules, thresholds=None, values=None):
+        self.rules = tuple(rules)
+        self.thresholds = thresholds or {}
+        self.values = values or {}
+
+    def alert_rules(self):
+        return self.rules
+
+    def zone_threshold(self, zone_id):
+        return self.thresholds.get(zone_id)
+
+    def get(self, setting_key, default=None):
+        return self.values.get(setting_key, default)
+
+
+def rule(rule_id, condition, rule_type='threshold', **conditions):
+    return {'id': rule_id, 'rule_name': f"rule{rule_id}", 'rule_type': rule_type,
+            'priority': 'medium', 'actions': {},
+            'conditions': {'condition': condition, 'metric': 'occupancy', **conditions}}
+
+
+def camera(inside, zones=()):
+    return {'camera': 'c', 'entered': inside, 'exited': 0, 'inside': inside,
+            'zones': [{'id': zone_id, 'entered': n, 'exited': 0, 'inside': n}
+                      for zone_id, n in zones]}
+
+
+def test_sliding_window_min_and_max():
+    window = SlidingWindow(10)
+    window.push(0, 5)
+    window.push(4, 2)
+    window.push(8, 9)
+    assert (window.minimum(8), window.maximum(8)) == (2, 9)
+    # At 13 the window starts at 3, where 5 was still in effect
+    assert (window.minimum(13), window.maximum(13)) == (2, 9)
+    # At 16 it starts at 6, where 2 was in effect
+    assert (window.minimum(16), window.maximum(16)) == (2, 9)
+    assert (window.minimum(19), window.maximum(19)) == (9, 9)
+
+
+def test_percent_rise_needs_a_minimum_base():
+    engine = AlertEngine(FakeSettings([rule(1, 'increase > 50% in 5 minutes',
+                                            'rate_of_change')]))
+    # A quiet scene: the first arrivals are not a sudden crowd
+    for t, inside in enumerate([0, 1, 2, 3]):
+        assert engine.update([camera(inside, [('z1', inside)])], now=t) == []
+
+    engine = AlertEngine(FakeSettings([rule(1, 'increase > 50% in 5 minutes',
+                                            'rate_of_change', min_base=2)]))
+    engine.update([camera(2)], now=0)
+    alert, = engine.update([camera(4)], now=10)
+    assert (alert['zone'], alert['value']) == ('c', 100.0)
+
+    engine = AlertEngine(FakeSettings([rule(1, 'increase > 50% in 5 minutes',
+                                            'rate_of_change')]))
+    engine.update([camera(10)], now=0)
+    assert engine.update([camera(14)], now=10) == []
+    alert, = engine.update([camera(16)], now=20)
+    assert alert['value'] == 60.0
+
+
+def test_cooldown_suppresses_repeats():
+    settings = FakeSettings([rule(1, 'occupancy >= 5')], values={'alert_cooldown_seconds': 60})
+    engine = AlertEngine(settings)
+
+    assert len(engine.update([camera(5)], now=0)) == 1
+    assert engine.update([camera(6)], now=30) == []
+    assert engine.suppressed == 1
+    assert len(engine.update([camera(7)], now=61)) == 1
+
+    # A zone threshold's own cooldown wins over the setting
+    settings.thresholds['c'] = {'alert_cooldown': 10}
+    assert len(engine.update([camera(8)], now=72)) == 1
+
+
+def test_reload_recompiles_only_changed_rules():
+    settings = FakeSettings([rule(1, 'occupancy >= 5'),
+                             rule(2, 'increase > 3 in 1 minute', 'rate_of_change')])
+    engine = AlertEngine(settings)
+    assert engine.update([camera(3)], now=0) == []
+    assert engine.compiles == 2
+    rate_rule = engine.rules[1]
+
+    # A reload re-evaluates the current counts against the new rule
+    settings.rules = (rule(1, 'occupancy >= 2'), settings.rules[1])
+    alert, = engine.update([], now=1)
+    assert (alert['rule_id'], alert['value']) == (1, 3)
+    assert engine.compiles == 3
+    # The unchanged rule kept its compiled form, and its window the count from t=0
+    assert engine.rules[1] is rate_rule
+    alert, = engine.update([camera(7)], now=2)
+    assert (alert['rule_id'], alert['value']) == (2, 4)
+
+    # No reload (same rules tuple): nothing recompiled
+    engine.update([camera(8)], now=3)
+    assert engine.compiles == 3
+
+
+def test_invalid_rules_are_reported():
+    with pytest.raises(RuleError, match="Unknown value"):
+        compile_rule(rule(1, 'occupancy >= nonsense'))
+    engine = AlertEngine(FakeSettings([rule(1, 'occupancy >='), rule(2, 'occupancy >= 1')]))
+    engine.update([camera(1)], now=0)
+    assert list(engine.errors) == [1]
+    assert len(engine.rules) == 1
@@ -0,0 +1,30 @@
+from count_store import CountStore
+
+
+def zone_counts(inside):
+    return {'entered': 0, 'exited': 0, 'inside': 0, 'lines': [],
+            'zones': [{'id': 'z1', 'entered': 1, 'exited': 0, 'inside': inside}]}
+
+
+def test_rollup_of_occupancy_only_events(tmp_path):
+    store = CountStore(str(tmp_path / "counts.db"), rollup_interval=3600)
+    try:
+        # A track lost inside the zone: occupancy drops without a crossing
+        store.record('cam0', [], zone_counts(1), ts=120.0)
+        store.record('cam0', [], zone_counts(0), ts=121.0)
+        assert store.flush() == 2
+        store.rollup()
+
+        rows = store.history('minute', camera_id='cam0')
+        assert rows == [{'camera_id': 'cam0', 'kind': 'zone', 'geometry_id': 'z1',
+                         'bucket': 120, 'entered': 0, 'exited': 0,
+                         'occupancy_max': 1, 'occupancy_last': 0}]
+
+        # The watermark moved on, so later crossings still roll up
+        store.record('cam0', [(7, 'zone', 'z1', 'enter')], zone_counts(1), ts=130.0)
+        store.flush()
+        store.rollup()
+        row, = store.history('minute', camera_id='cam0')
+        assert (row['entered'], row['exited'], row['occupancy_last']) == (1, 0, 1)
+    finally:
+        store.close()
@@ -0,0 +1,47 @@
+import pytest
+
+from detector import BatchDetector
+from main import CounterConfig, people_counter
+from synthetic import StubBackend, write_clip
+
+
+def count(path, **options):
+    detector = BatchDetector(StubBackend())
+    entered, exited = people_counter(
+        path, None, detector=detector, detection_fps=0, embedding='iou', display=False,
+        live=False, history=False, verbose=False, **options
+    )
+    return entered, exited, detector.frames
+
+
+@pytest.fixture
+def clip(tmp_path, monkeypatch):
+    # Settings lookups fall back to their defaults without a settings.db here
+    monkeypatch.chdir(tmp_path)
+    return write_clip(str(tmp_path / "clip.avi"), [(80, 40, 200), (240, 200, 40)])
+
+
+def test_counts(clip):
+    entered, exited, detected = count(clip)
+    assert (entered, exited) == (1, 1)
+    assert detected == 60
+
+
+def test_motion_gate_keeps_counts(clip):
+    events = []
+    entered, exited, detected = count(clip, motion_threshold=0.002, on_event=events.append)
+    assert (entered, exited) == (1, 1)
+    # People standing still at either end don't need the detector
+    assert detected < 60
+    gate = events[-1]['motion_gate']
+    assert gate['threshold'] == 0.002
+    assert gate['skipped'] == 60 - detected
+    assert gate['skip_ratio'] == pytest.approx((60 - detected) / 60)
+
+
+def test_backend_instance_and_unknown_option(clip):
+    config = CounterConfig(backend=StubBackend(), embedding='iou', detection_fps=0,
+                           display=False, live=False, history=False, verbose=False)
+    assert people_counter(clip, None, config) == (1, 1)
+    with pytest.raises(TypeError):
+        people_counter(clip, None, config, motion_treshold=0.002)
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from detector import BatchDetector
+from main import people_counter
+from synthetic import StubBackend, write_clip
+
+
+def count(path, cache_dir, **options):
+    detector = BatchDetector(StubBackend())
+    events = []
+    entered, exited = people_counter(
+        path, None, detector=detector, detection_fps=0, embedding='iou', display=False,
+        live=False, history=False, verbose=False, detection_cache=cache_dir,
+        on_event=events.append, **options
+    )
+    crossings = [event for event in events if event['type'] == 'crossing']
+    return (entered, exited), crossings, detector.frames
+
+
+@pytest.fixture
+def clips(tmp_path, monkeypatch):
+    # Settings lookups fall back to their defaults without a settings.db here
+    monkeypatch.chdir(tmp_path)
+    return (write_clip(str(tmp_path / "a.avi"), [(80, 40, 200), (240, 200, 40)]),
+            write_clip(str(tmp_path / "b.avi"), [(160, 40, 200)]))
+
+
+def test_replay_matches_live_run(clips, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    counts, crossings, detected = count(clips[0], cache_dir)
+    assert counts == (1, 1)
+    assert detected == 60
+    assert len(os.listdir(cache_dir)) == 1
+
+    replayed, replayed_crossings, detected = count(clips[0], cache_dir)
+    assert replayed == counts
+    assert replayed_crossings == crossings
+    assert detected == 0
+
+
+def test_other_video_or_settings_are_not_replayed(clips, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    count(clips[0], cache_dir)
+
+    counts, _, detected = count(clips[1], cache_dir)
+    assert counts == (1, 0)
+    assert detected == 60
+
+    counts, _, detected = count(clips[0], cache_dir, motion_threshold=0.002)
+    assert counts == (1, 1)
+    assert detected > 0
+    assert len(os.listdir(cache_dir)) == 3
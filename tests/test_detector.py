@@ -0,0 +1,76 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from detector import BatchDetector
+from embeddings import BatchEmbedder
+
+
+class OverlapBackend:
+    """Records whether two predict calls ever ran at the same time"""
+
+    def __init__(self):
+        self.running = 0
+        self.overlapped = False
+
+    def predict(self, frames):
+        self.running += 1
+        if self.running > 1:
+            self.overlapped = True
+        time.sleep(0.002)
+        self.running -= 1
+        return [[] for _ in frames]
+
+
+def test_shared_detector_serializes_predict():
+    backend = OverlapBackend()
+    detector = BatchDetector(backend, batch_size=1)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def camera():
+        for _ in range(25):
+            assert detector.submit(frame).result() == []
+
+    threads = [threading.Thread(target=camera) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not backend.overlapped
+    assert (detector.batches, detector.frames) == (100, 100)
+
+
+def test_shared_embedder_serializes_predict():
+    backend = OverlapBackend()
+    embedder = BatchEmbedder(backend)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    detections = [([0, 0, 4, 4], 0.9, "person")]
+
+    def camera():
+        for _ in range(25):
+            assert embedder.embed(frame, detections) == [[]]
+
+    threads = [threading.Thread(target=camera) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not backend.overlapped
+    assert (embedder.batches, embedder.frames, embedder.crops) == (100, 100, 100)
+
+
+@pytest.mark.parametrize('batch_size', [1, 4])
+def test_closed_detector_rejects_frames(batch_size):
+    backend = OverlapBackend()
+    detector = BatchDetector(backend, batch_size=batch_size)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    assert detector.detect(frame) == []
+    detector.close()
+
+    with pytest.raises(RuntimeError, match="closed"):
+        detector.submit(frame)
+    assert detector.frames == 1
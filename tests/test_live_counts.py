@@ -0,0 +1,81 @@
+import multiprocessing as mp
+import os
+import time
+import uuid
+
+import pytest
+
+from live_counts import LiveCounts
+
+
+@pytest.fixture
+def store():
+    store = LiveCounts.open(f"pc_live_test_{os.getpid()}_{uuid.uuid4().hex[:8]}", slots=4)
+    yield store
+    store.unlink()
+    store.close()
+
+
+def counts(n):
+    return {'entered': n, 'exited': n, 'inside': 0,
+            'zones': [{'id': 'door', 'entered': n, 'exited': n, 'inside': 0}]}
+
+
+def _publish(name, publishes):
+    store = LiveCounts.open(name)
+    writer = store.claim('cam0')
+    for n in range(1, publishes + 1):
+        writer.publish(counts(n), n)
+    writer.close()
+    store.close()
+
+
+def test_snapshot_is_never_torn(store):
+    writer = mp.get_context('spawn').Process(target=_publish, args=(store.shm.name, 50_000))
+    writer.start()
+    seen = 0
+    while writer.is_alive() or not seen:
+        for camera in store.snapshot():
+            zone, = camera['zones'] if camera['frame'] else [{'entered': 0, 'exited': 0}]
+            # Every field of one snapshot comes from the same publish
+            assert camera['entered'] == camera['exited'] == camera['frame']
+            assert zone['entered'] == zone['exited'] == camera['frame']
+            seen += 1
+    writer.join()
+    assert writer.exitcode == 0
+
+    camera, = store.snapshot()
+    assert (camera['entered'], camera['active']) == (50_000, 0)
+
+
+def test_snapshot_skips_a_slot_left_mid_write(store):
+    store.claim('cam0').publish(counts(1), 1)
+    store.claim('cam1').publish(counts(2), 2)
+    # A writer that died between making seq odd and even again
+    store._table['seq'][0] |= 1
+
+    assert [camera['camera'] for camera in store.snapshot(timeout=0.01)] == ['cam1']
+
+
+def test_claim_refuses_a_camera_being_published(store):
+    writer = store.claim('cam0')
+    writer.publish(counts(1), 1)
+    with pytest.raises(RuntimeError, match="already published"):
+        store.claim('cam0')
+
+    # Free again once the first writer is done...
+    writer.close()
+    store.claim('cam0').publish(counts(2), 2)
+    # ...or once it stopped heartbeating, e.g. because it died
+    assert store.claim('cam0', stale_after=0).slot == writer.slot
+
+
+def test_claim_reuses_the_stalest_inactive_slot(store):
+    writers = [store.claim(f"cam{i}") for i in range(4)]
+    with pytest.raises(RuntimeError, match="in use"):
+        store.claim('cam4')
+    for writer in writers[:2]:
+        writer.close()
+        time.sleep(0.01)
+
+    assert store.claim('cam4').slot == writers[0].slot
@@ -0,0 +1,24 @@
+import time
+
+from retention import RetentionCleaner
+
+
+class BrokenSettings:
+    def get(self, setting_key, default=None):
+        raise KeyError(setting_key)
+
+
+def test_schedule_survives_unexpected_errors(tmp_path):
+    messages = []
+    cleaner = RetentionCleaner(BrokenSettings(), str(tmp_path / "settings.db"),
+                               str(tmp_path / "counts.db"), interval=0.01, log=messages.append)
+    cleaner.start()
+    deadline = time.monotonic() + 5
+    while len(messages) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    thread = cleaner._thread
+    cleaner.stop()
+
+    assert len(messages) >= 3
+    assert messages[0].startswith("⚠️  Retention cleanup failed: KeyError")
+    assert not thread.is_alive()
@@ -0,0 +1,41 @@
+import multiprocessing as mp
+
+import pytest
+
+from runner import run_cameras
+from synthetic import StubBackend, write_clip
+
+# (x, from_y, to_y) walkers, clip length and the counts each camera should give;
+# cam2's clip is shorter than the frame ring, so its decoder finishes first
+CAMERAS = {
+    'cam0': ([(80, 40, 200)], 60, (1, 0)),
+    'cam1': ([(80, 40, 200), (240, 200, 40)], 60, (1, 1)),
+    'cam2': ([(60, 40, 200), (160, 40, 200), (260, 200, 40)], 20, (2, 1)),
+}
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    # Workers inherit the working directory, where no settings.db exists
+    monkeypatch.chdir(tmp_path)
+    return {camera_id: write_clip(str(tmp_path / f"{camera_id}.avi"), walkers, frames,
+                                  still=frames // 6)
+            for camera_id, (walkers, frames, _) in CAMERAS.items()}
+
+
+@pytest.mark.parametrize('shared_memory', [False, True])
+def test_counts_every_camera(sources, shared_memory):
+    options = {'backend': StubBackend(), 'tiling': False, 'embedding': 'iou',
+               'detection_fps': 0, 'latest_only': False, 'live': False, 'history': False, 'verbose': False}
+    updates = []
+
+    totals = run_cameras(sources, max_cameras=2, options=options, threads=1,
+                         on_update=lambda camera_id, camera, aggregate: updates.append(camera_id),
+                         shared_memory=shared_memory)
+
+    assert totals == {camera_id: {'entered': entered, 'exited': exited,
+                                  'inside': entered - exited}
+                      for camera_id, (_, _, (entered, exited)) in CAMERAS.items()}
+    assert set(updates) == set(CAMERAS)
+    # Workers and decoders have all exited
+    assert mp.active_children() == []
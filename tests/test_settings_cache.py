@@ -0,0 +1,46 @@
+import pytest
+
+from settings_cache import SettingsCache
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # Importing admin_settings opens ./settings.db, so keep it out of the tree
+    monkeypatch.chdir(tmp_path)
+    from admin_settings import SettingsDatabase
+
+    db = SettingsDatabase(str(tmp_path / "test.db"))
+    yield db
+    db.pool.close()
+
+
+def test_opening_the_db_again_keeps_the_version(db):
+    version = db.get_version()
+    type(db)(db.db_path).pool.close()
+    assert db.get_version() == version
+
+
+def test_a_write_bumps_the_version(db):
+    version = db.get_version()
+    db.update_setting('detection_fps', '5', 'test')
+    assert db.get_version() == version + 1
+
+
+def test_cache_reloads_only_after_a_bump(db):
+    cache = SettingsCache(db.db_path, check_interval=0)
+    assert cache.get('detection_fps') == 10
+    assert cache.loads == 1
+
+    # Checks without a change don't reload
+    assert cache.get('detection_fps') == 10
+    assert not cache.refresh()
+    assert cache.loads == 1
+
+    db.update_setting('detection_fps', '5', 'test')
+    assert cache.get('detection_fps') == 5
+    assert cache.loads == 2
+
+    type(db)(db.db_path).pool.close()
+    assert not cache.refresh()
+    assert cache.loads == 2
+    cache.close()
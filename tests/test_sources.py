@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from sources import FaultInjector, StreamSource
+from synthetic import write_clip
+
+FRAMES = 30
+FPS = 10
+
+
+@pytest.fixture
+def clip(tmp_path):
+    return write_clip(str(tmp_path / "clip.avi"), [(160, 40, 200)], frames=FRAMES, fps=FPS)
+
+
+def read_all(source):
+    positions = []
+    while True:
+        ret, _ = source.read()
+        if not ret:
+            break
+        positions.append(source.position_msec)
+    source.release()
+    return positions
+
+
+def test_reconnects_after_dropped_reads(clip):
+    # Every 10th read fails, and the 2 reconnect attempts after it too
+    injector = FaultInjector(clip, fail_every=10, outage=2, realtime=False)
+    source = StreamSource(clip, live=True, max_retries=3, backoff=0.001,
+                          opener=injector.open, log=lambda *args: None)
+
+    positions = read_all(source)
+    injector.close()
+
+    # No frame lost or repeated across the reconnects
+    assert positions == [i * 1000 / FPS for i in range(FRAMES)]
+    assert injector.faults == 3
+    # 3 after the faults, then 3 more at the end of the file before giving up
+    assert source.stats() == {'frames': FRAMES, 'dropped': 0, 'reconnects': 6,
+                              'read_failures': 7}
+    assert not source.isOpened()
+
+
+def test_gives_up_after_max_retries(clip):
+    injector = FaultInjector(clip, fail_every=5, outage=10, realtime=False)
+    messages = []
+    source = StreamSource(clip, live=True, max_retries=3, backoff=0.001,
+                          opener=injector.open, log=messages.append)
+
+    positions = read_all(source)
+    injector.close()
+
+    assert len(positions) == 4
+    assert source.reconnects == 0
+    assert messages[-1].startswith("❌ Giving up")
+
+
+def test_latest_only_skips_stale_frames(clip):
+    injector = FaultInjector(clip, realtime=False)
+    source = StreamSource(clip, live=True, latest_only=True, max_retries=1, backoff=0.001,
+                          opener=injector.open, log=lambda *args: None)
+
+    positions = []
+    while True:
+        ret, _ = source.read()
+        if not ret:
+            break
+        positions.append(source.position_msec)
+        # A consumer much slower than the source
+        time.sleep(0.05)
+    source.release()
+    injector.close()
+
+    # Every frame was either consumed or dropped; consumed ones in order, ending on the last
+    assert source.frames == FRAMES
+    assert len(positions) + source.dropped == FRAMES
+    assert source.dropped > 0
+    assert positions == sorted(set(positions))
+    assert positions[-1] == (FRAMES - 1) * 1000 / FPS
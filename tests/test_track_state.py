@@ -0,0 +1,35 @@
+import numpy as np
+
+from counting import LineCrossingCounter
+from track_state import TrackStateStore
+
+
+def test_state_stays_bounded_over_many_tracks():
+    # A short version of 'benchmark.py soak': 20 tracks alive at once, each walking down
+    counter = LineCrossingCounter([((0, 500), (1000, 500))], offset=25, capacity=64)
+    lifetime, concurrent = 30, 20
+    for frame in range(3000):
+        first = max(0, (frame - lifetime) * concurrent // lifetime + 1)
+        last = frame * concurrent // lifetime
+        ids = list(range(first, last + 1))
+        ages = frame - np.arange(first, last + 1) * lifetime / concurrent
+        centroids = np.stack([np.full(len(ids), 100.0), ages * 1000 / lifetime], axis=1)
+        counter.update(ids, centroids)
+        if frame % 10 == 0:
+            counter.sweep(set(ids))
+
+    # Live tracks plus those gone since the last sweep
+    assert len(counter.state) <= concurrent + concurrent * 10 // lifetime + 1
+    # Tracks are counted once 25 px past the line, 16 frames into their life
+    counted = sum(1 for i in range(last + 1) if frame - i * lifetime / concurrent >= 16)
+    assert int(counter.entered.sum()) == counted
+
+
+def test_full_store_evicts_least_recently_seen():
+    store = TrackStateStore(1, capacity=2, ttl=None)
+    store.rows(['a'], 1)
+    store.rows(['b'], 2)
+    store.rows(['c'], 3)
+    assert len(store) == 2
+    assert store.evicted == 1
+    assert set(store._slots) == {'b', 'c'}
@@ -0,0 +1,93 @@
+"""
+Track State
+Fixed-size, evicting per-track state for long-running counters
+"""
+
+import numpy as np
+
+
+class TrackStateStore:
+    """
+    Per-track counting state in preallocated arrays.
+
+    Each track id gets a row (slot) holding its last known side and
+    counted flag for every line, plus the frame it was last seen on.
+    Slots are freed when the tracker deletes a track (`sweep` with the live
+    ids), when a track hasn't been seen for `ttl` frames, or, if the store
+    is full, by evicting the least recently seen track. Memory use is set by
+    `capacity` and doesn't grow with the number of tracks ever seen.
+    """
+
+    __slots__ = ('capacity', 'ttl', 'last_side', 'counted', 'last_seen',
+                 'evicted', '_slots', '_ids', '_free')
+
+    def __init__(self, n_lines, capacity=4096, ttl=900):
+        self.capacity = capacity
+        self.ttl = ttl
+
+        self.last_side = np.zeros((capacity, n_lines), dtype=np.int8)
+        self.counted = np.zeros((capacity, n_lines), dtype=bool)
+        self.last_seen = np.full(capacity, -1, dtype=np.int64)
+        self.evicted = 0
+
+        self._slots = {}
+        self._ids = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def nbytes(self):
+        return self.last_side.nbytes + self.counted.nbytes + self.last_seen.nbytes
+
+    def rows(self, track_ids, now):
+        """Slot index of each track id, allocating slots for new ids"""
+        rows = np.empty(len(track_ids), dtype=np.intp)
+        for i, track_id in enumerate(track_ids):
+            slot = self._slots.get(track_id)
+            if slot is None:
+                slot = self._allocate(track_id, now)
+            rows[i] = slot
+        self.last_seen[rows] = now
+        return rows
+
+    def _allocate(self, track_id, now):
+        if not self._free:
+            victim = int(np.argmin(self.last_seen))
+            if self.last_seen[victim] >= now:
+                raise RuntimeError(
+                    f"More than {self.capacity} tracks live at once, raise the store capacity"
+                )
+            self._release(victim)
+
+        slot = self._free.pop()
+        self._slots[track_id] = slot
+        self._ids[slot] = track_id
+        self.last_seen[slot] = now
+        return slot
+
+    def _release(self, slot):
+        del self._slots[self._ids[slot]]
+        self._ids[slot] = None
+        self.last_side[slot] = 0
+        self.counted[slot] = False
+        self.last_seen[slot] = -1
+        self._free.append(slot)
+        self.evicted += 1
+
+    def sweep(self, now, live_ids=None):
+        """Free slots of tracks that are gone from `live_ids` or older than the TTL"""
+        used = self.last_seen >= 0
+        stale = np.zeros(self.capacity, dtype=bool)
+        if self.ttl is not None:
+            stale = used & (self.last_seen < now - self.ttl)
+
+        slots = set(np.flatnonzero(stale).tolist())
+        if live_ids is not None:
+            slots.update(slot for track_id, slot in self._slots.items()
+                         if track_id not in live_ids)
+
+        for slot in slots:
+            self._release(slot)
+        return len(slots)